@@ -1,6 +1,13 @@
 import re
 import logging
-from typing import List, Dict, Optional
+from typing import Dict, Iterable, Optional, Union
+from backend.agents.country_gazetteer import DEFAULT_KINDS, KIND_CODE, CountryMention, get_country_gazetteer
+from backend.pdf_processing.invoice_text import InvoiceText
+
+# Every origin and context pattern contains one of these keywords; lines
+# without any are skipped before the patterns run
+_ORIGIN_KEYWORDS = re.compile(r'origin|made|manufactured|produced|shipped|exported')
+_CONTEXT_KEYWORDS = re.compile(r'shipping|customs|port|export')
 
 class CountryDetector:
     """
@@ -12,7 +19,7 @@ class CountryDetector:
         self.logger = logging.getLogger(__name__)
         
         # Common patterns for country of origin
-        self.patterns = [
+        self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in (
             r'country\s*of\s*origin\s*:?\s*([^\n]+)',
             r'origin\s*:?\s*([^\n]+)',
             r'made\s*in\s*:?\s*([^\n]+)',
@@ -20,147 +27,193 @@ class CountryDetector:
             r'produced\s*in\s*:?\s*([^\n]+)',
             r'shipped\s*from\s*:?\s*([^\n]+)',
             r'exported\s*from\s*:?\s*([^\n]+)'
-        ]
-        
-        # List of common countries with their variations
-        self.countries = {
-            "China": ["China", "PRC", "People's Republic of China", "Mainland China"],
-            "Mexico": ["Mexico", "Mexican"],
-            "Canada": ["Canada", "Canadian"],
-            "Japan": ["Japan", "Japanese"],
-            "Germany": ["Germany", "German", "Deutschland"],
-            "United States": ["United States", "USA", "US", "America", "American"],
-            "UK": ["United Kingdom", "UK", "Great Britain", "British", "England"],
-            "France": ["France", "French"],
-            "Italy": ["Italy", "Italian"],
-            "Spain": ["Spain", "Spanish"],
-            "Brazil": ["Brazil", "Brazilian"],
-            "India": ["India", "Indian"],
-            "South Korea": ["South Korea", "Korea", "Korean", "Republic of Korea"],
-            "Taiwan": ["Taiwan", "Chinese Taipei", "Republic of China"],
-            "Vietnam": ["Vietnam", "Vietnamese"],
-            "Thailand": ["Thailand", "Thai"],
-            "Malaysia": ["Malaysia", "Malaysian"],
-            "Indonesia": ["Indonesia", "Indonesian"],
-            "Philippines": ["Philippines", "Filipino"],
-            "Singapore": ["Singapore", "Singaporean"],
-            "Hong Kong": ["Hong Kong", "HK"]
-        }
+        )]
+        
+        # Look for shipping addresses, customs declarations, or other context clues
+        self.context_patterns = [(re.compile(pattern, re.IGNORECASE), context_type) for pattern, context_type in (
+            (r'shipping\s*address\s*:?\s*([^\n]+)', 'shipping'),
+            (r'customs\s*declaration\s*:?\s*([^\n]+)', 'customs'),
+            (r'port\s*of\s*loading\s*:?\s*([^\n]+)', 'port'),
+            (r'export\s*declaration\s*:?\s*([^\n]+)', 'export')
+        )]
+        
+        # Every ISO-3166 country with its aliases and adjectives
+        self.gazetteer = get_country_gazetteer()
     
-    def detect_country(self, text: str) -> Dict[str, str]:
+    def detect_country(self, text: Union[str, InvoiceText]) -> Dict[str, str]:
         """
         Detect country of origin from invoice text.
         
         Args:
-            text (str): Invoice text
+            text (Union[str, InvoiceText]): Invoice text, or the invoice's shared tokenized text
             
         Returns:
             Dict[str, str]: Dictionary containing:
                 - country: Detected country name
+                - country_code: ISO-3166 alpha-2 code, or None if not found
                 - confidence: Confidence level (high/medium/low)
                 - method: How the country was detected
         """
-        # Split text into lines
-        lines = text.split('\n')
-        
-        # Try pattern matching first
-        country = self._extract_from_patterns(lines)
-        if country:
-            return {
-                "country": country,
-                "confidence": "high",
-                "method": "pattern_matching"
-            }
-        
-        # Try direct country name matching
-        country = self._extract_from_country_names(lines)
-        if country:
-            return {
-                "country": country,
-                "confidence": "medium",
-                "method": "country_name_matching"
-            }
-        
-        # Try context analysis
-        country = self._analyze_context(lines)
-        if country:
-            return {
-                "country": country,
-                "confidence": "low",
-                "method": "context_analysis"
-            }
+        stream = self.stream()
+        stream.feed(text)
+        return stream.finish()
+    
+    def detect_country_from_pages(self, pages: Iterable[str]) -> Dict[str, str]:
+        """
+        Detect country of origin from page texts, stopping as soon as the answer is final.
         
-        return {
-            "country": "Unknown",
-            "confidence": "low",
-            "method": "not_found"
-        }
+        Args:
+            pages (Iterable[str]): Page texts in document order
+            
+        Returns:
+            Dict[str, str]: Same structure as detect_country
+        """
+        stream = self.stream()
+        for page_text in pages:
+            if stream.feed(page_text):
+                break
+        return stream.finish()
     
-    def _extract_from_patterns(self, lines: List[str]) -> Optional[str]:
+    def stream(self) -> "CountryDetectionStream":
+        """
+        Start an incremental detection that is fed text as pages are extracted.
+        
+        Returns:
+            CountryDetectionStream: Detection state for a single invoice
+        """
+        return CountryDetectionStream(self)
+    
+    def _extract_from_patterns(self, invoice_text: InvoiceText) -> Optional[CountryMention]:
         """
         Extract country using pattern matching.
         
         Args:
-            lines (List[str]): List of invoice lines
+            invoice_text (InvoiceText): Tokenized invoice text
             
         Returns:
-            Optional[str]: Detected country or None
+            Optional[CountryMention]: Detected country or None
         """
-        for line in lines:
+        for index in invoice_text.lines_matching(_ORIGIN_KEYWORDS):
+            line = invoice_text.lines[index]
             for pattern in self.patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
+                match = pattern.search(line)
                 if match:
-                    country_text = match.group(1).strip()
-                    # Try to match the extracted text with known countries
-                    for country, variations in self.countries.items():
-                        if any(var.lower() in country_text.lower() for var in variations):
-                            return country
+                    # Try to match the extracted text with known countries; a
+                    # labeled origin field may also hold an ISO code
+                    mention = self.gazetteer.first(match.group(1).strip(), kinds=DEFAULT_KINDS + (KIND_CODE,))
+                    if mention:
+                        return mention
         return None
     
-    def _extract_from_country_names(self, lines: List[str]) -> Optional[str]:
+    def _extract_from_country_names(self, invoice_text: InvoiceText) -> Optional[CountryMention]:
         """
         Extract country by matching country names.
         
+        Without an origin label next to it, a name that is also an ordinary
+        word ("Jordan Lane", "Chad Smith") is not taken as the origin.
+        
         Args:
-            lines (List[str]): List of invoice lines
+            invoice_text (InvoiceText): Tokenized invoice text
             
         Returns:
-            Optional[str]: Detected country or None
+            Optional[CountryMention]: First unambiguous country mentioned, or None
         """
-        for line in lines:
-            for country, variations in self.countries.items():
-                if any(re.search(r'\b' + re.escape(var) + r'\b', line, re.IGNORECASE) 
-                      for var in variations):
-                    return country
-        return None
+        return invoice_text.first_country(DEFAULT_KINDS, ambiguous=False)
     
-    def _analyze_context(self, lines: List[str]) -> Optional[str]:
+    def _analyze_context(self, invoice_text: InvoiceText) -> Optional[CountryMention]:
         """
         Analyze context to infer country of origin.
         
         Args:
-            lines (List[str]): List of invoice lines
+            invoice_text (InvoiceText): Tokenized invoice text
             
         Returns:
-            Optional[str]: Inferred country or None
+            Optional[CountryMention]: Inferred country or None
         """
-        # Look for shipping addresses, customs declarations, or other context clues
-        context_patterns = [
-            (r'shipping\s*address\s*:?\s*([^\n]+)', 'shipping'),
-            (r'customs\s*declaration\s*:?\s*([^\n]+)', 'customs'),
-            (r'port\s*of\s*loading\s*:?\s*([^\n]+)', 'port'),
-            (r'export\s*declaration\s*:?\s*([^\n]+)', 'export')
-        ]
-        
-        for line in lines:
-            for pattern, context_type in context_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
+        for index in invoice_text.lines_matching(_CONTEXT_KEYWORDS):
+            line = invoice_text.lines[index]
+            for pattern, context_type in self.context_patterns:
+                match = pattern.search(line)
                 if match:
-                    context_text = match.group(1).strip()
                     # Try to match the context text with known countries
-                    for country, variations in self.countries.items():
-                        if any(var.lower() in context_text.lower() for var in variations):
-                            self.logger.info(f"Found country {country} from {context_type} context")
-                            return country
+                    mention = self.gazetteer.first(match.group(1).strip(), ambiguous=False)
+                    if mention:
+                        self.logger.info(f"Found country {mention.name} from {context_type} context")
+                        return mention
+        
+        return None 
+
+
+class CountryDetectionStream:
+    """
+    Incremental country detection over invoice text that arrives page by page.
+    
+    Gives the same answer as CountryDetector.detect_country on the joined text:
+    a pattern match is final as soon as it is seen, while name and context
+    matches are only kept as candidates until the document ends.
+    """
+    
+    def __init__(self, detector: CountryDetector):
+        self.detector = detector
+        self._pattern_match = None
+        self._name_match = None
+        self._context_match = None
+    
+    @property
+    def is_final(self) -> bool:
+        """True once later text can no longer change the result."""
+        return self._pattern_match is not None
+    
+    def feed(self, text: Union[str, InvoiceText]) -> bool:
+        """
+        Scan the next chunk of invoice text.
+        
+        Args:
+            text (Union[str, InvoiceText]): Text of the next page
+            
+        Returns:
+            bool: True if the result is now final
+        """
+        if self.is_final:
+            return True
+        
+        invoice_text = InvoiceText.of(text)
+        self._pattern_match = self.detector._extract_from_patterns(invoice_text)
+        if self.is_final:
+            return True
+        
+        # The first name match anywhere beats any context match, so context
+        # analysis is only needed until a name has been seen
+        if self._name_match is None:
+            self._name_match = self.detector._extract_from_country_names(invoice_text)
+            if self._name_match is None and self._context_match is None:
+                self._context_match = self.detector._analyze_context(invoice_text)
         
-        return None 
\ No newline at end of file
+        return False
+    
+    def finish(self) -> Dict[str, str]:
+        """
+        Return the detection result for everything fed so far.
+        
+        Returns:
+            Dict[str, str]: Same structure as CountryDetector.detect_country
+        """
+        for mention, confidence, method in (
+            (self._pattern_match, "high", "pattern_matching"),
+            (self._name_match, "medium", "country_name_matching"),
+            (self._context_match, "low", "context_analysis"),
+        ):
+            if mention:
+                return {
+                    "country": mention.name,
+                    "country_code": mention.code,
+                    "confidence": confidence,
+                    "method": method
+                }
+        
+        return {
+            "country": "Unknown",
+            "country_code": None,
+            "confidence": "low",
+            "method": "not_found"
+        }
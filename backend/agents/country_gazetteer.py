@@ -0,0 +1,607 @@
+import re
+import threading
+from collections import deque
+
+# Kinds of country terms; callers choose which kinds they accept
+KIND_NAME = "name"
+KIND_ALIAS = "alias"
+KIND_ADJECTIVE = "adjective"
+KIND_CODE = "code"
+DEFAULT_KINDS = (KIND_NAME, KIND_ALIAS, KIND_ADJECTIVE)
+
+# ISO-3166-1 countries: alpha-2|alpha-3|common name|aliases|adjectives
+# Aliases and adjectives are separated by ";". Terms written in capitals
+# (acronyms such as USA or PRC) and codes only match capitalized text.
+ISO_3166 = """
+AD|AND|Andorra||Andorran
+AE|ARE|United Arab Emirates|UAE;U.A.E.;Emirates|Emirati
+AF|AFG|Afghanistan|Islamic Republic of Afghanistan|Afghan
+AG|ATG|Antigua and Barbuda|Antigua|
+AI|AIA|Anguilla||
+AL|ALB|Albania||Albanian
+AM|ARM|Armenia||Armenian
+AO|AGO|Angola||Angolan
+AQ|ATA|Antarctica||
+AR|ARG|Argentina|Argentine Republic|Argentine;Argentinian
+AS|ASM|American Samoa||
+AT|AUT|Austria||Austrian
+AU|AUS|Australia|Commonwealth of Australia|Australian
+AW|ABW|Aruba||
+AX|ALA|Aland Islands|Åland Islands;Åland|
+AZ|AZE|Azerbaijan||Azerbaijani
+BA|BIH|Bosnia and Herzegovina|Bosnia;Bosnia-Herzegovina|Bosnian
+BB|BRB|Barbados||Barbadian
+BD|BGD|Bangladesh||Bangladeshi
+BE|BEL|Belgium||Belgian
+BF|BFA|Burkina Faso||
+BG|BGR|Bulgaria||Bulgarian
+BH|BHR|Bahrain||Bahraini
+BI|BDI|Burundi||
+BJ|BEN|Benin||
+BL|BLM|Saint Barthelemy|Saint Barthélemy;St. Barthelemy;St Barts|
+BM|BMU|Bermuda||
+BN|BRN|Brunei|Brunei Darussalam|
+BO|BOL|Bolivia|Plurinational State of Bolivia|Bolivian
+BQ|BES|Caribbean Netherlands|Bonaire, Sint Eustatius and Saba;Bonaire|
+BR|BRA|Brazil|Brasil;Federative Republic of Brazil|Brazilian
+BS|BHS|Bahamas|The Bahamas|Bahamian
+BT|BTN|Bhutan||
+BV|BVT|Bouvet Island||
+BW|BWA|Botswana||
+BY|BLR|Belarus||Belarusian
+BZ|BLZ|Belize||
+CA|CAN|Canada||Canadian
+CC|CCK|Cocos (Keeling) Islands|Cocos Islands;Keeling Islands|
+CD|COD|Democratic Republic of the Congo|DR Congo;DRC;Congo-Kinshasa;Democratic Republic of Congo|
+CF|CAF|Central African Republic||
+CG|COG|Republic of the Congo|Congo;Congo-Brazzaville;Republic of Congo|
+CH|CHE|Switzerland|Swiss Confederation|Swiss
+CI|CIV|Cote d'Ivoire|Côte d'Ivoire;Ivory Coast|Ivorian
+CK|COK|Cook Islands||
+CL|CHL|Chile||Chilean
+CM|CMR|Cameroon||Cameroonian
+CN|CHN|China|People's Republic of China;PRC;P.R.C.;Mainland China;P.R. China|Chinese
+CO|COL|Colombia||Colombian
+CR|CRI|Costa Rica||Costa Rican
+CU|CUB|Cuba||Cuban
+CV|CPV|Cabo Verde|Cape Verde|
+CW|CUW|Curacao|Curaçao|
+CX|CXR|Christmas Island||
+CY|CYP|Cyprus||Cypriot
+CZ|CZE|Czech Republic|Czechia|Czech
+DE|DEU|Germany|Deutschland;Federal Republic of Germany|German
+DJ|DJI|Djibouti||
+DK|DNK|Denmark||Danish
+DM|DMA|Dominica||
+DO|DOM|Dominican Republic||Dominican
+DZ|DZA|Algeria||Algerian
+EC|ECU|Ecuador||Ecuadorian
+EE|EST|Estonia||Estonian
+EG|EGY|Egypt||Egyptian
+EH|ESH|Western Sahara||
+ER|ERI|Eritrea||
+ES|ESP|Spain|España;Kingdom of Spain|Spanish
+ET|ETH|Ethiopia||Ethiopian
+FI|FIN|Finland||Finnish
+FJ|FJI|Fiji||Fijian
+FK|FLK|Falkland Islands|Falklands;Malvinas|
+FM|FSM|Micronesia|Federated States of Micronesia|
+FO|FRO|Faroe Islands|Faroes|
+FR|FRA|France|French Republic|French
+GA|GAB|Gabon||
+GB|GBR|United Kingdom|UK;U.K.;Great Britain;Britain;England;Scotland;Wales;Northern Ireland;United Kingdom of Great Britain and Northern Ireland|British
+GD|GRD|Grenada||
+GE|GEO|Georgia||Georgian
+GF|GUF|French Guiana||
+GG|GGY|Guernsey||
+GH|GHA|Ghana||Ghanaian
+GI|GIB|Gibraltar||
+GL|GRL|Greenland||
+GM|GMB|Gambia|The Gambia|
+GN|GIN|Guinea||
+GP|GLP|Guadeloupe||
+GQ|GNQ|Equatorial Guinea||
+GR|GRC|Greece|Hellenic Republic|Greek
+GS|SGS|South Georgia and the South Sandwich Islands|South Georgia|
+GT|GTM|Guatemala||Guatemalan
+GU|GUM|Guam||
+GW|GNB|Guinea-Bissau||
+GY|GUY|Guyana||
+HK|HKG|Hong Kong|HK;Hong Kong SAR|
+HM|HMD|Heard Island and McDonald Islands||
+HN|HND|Honduras||Honduran
+HR|HRV|Croatia|Hrvatska|Croatian
+HT|HTI|Haiti||Haitian
+HU|HUN|Hungary||Hungarian
+ID|IDN|Indonesia||Indonesian
+IE|IRL|Ireland|Republic of Ireland;Eire|Irish
+IL|ISR|Israel||Israeli
+IM|IMN|Isle of Man||
+IN|IND|India|Republic of India;Bharat|Indian
+IO|IOT|British Indian Ocean Territory||
+IQ|IRQ|Iraq||Iraqi
+IR|IRN|Iran|Islamic Republic of Iran|Iranian
+IS|ISL|Iceland||Icelandic
+IT|ITA|Italy|Italia;Italian Republic|Italian
+JE|JEY|Jersey||
+JM|JAM|Jamaica||Jamaican
+JO|JOR|Jordan||Jordanian
+JP|JPN|Japan|Nippon|Japanese
+KE|KEN|Kenya||Kenyan
+KG|KGZ|Kyrgyzstan|Kyrgyz Republic|
+KH|KHM|Cambodia|Kampuchea|Cambodian
+KI|KIR|Kiribati||
+KM|COM|Comoros||
+KN|KNA|Saint Kitts and Nevis|St. Kitts and Nevis;St Kitts and Nevis|
+KP|PRK|North Korea|Democratic People's Republic of Korea;DPRK|North Korean
+KR|KOR|South Korea|Korea;Republic of Korea;ROK;Korea Republic|Korean;South Korean
+KW|KWT|Kuwait||Kuwaiti
+KY|CYM|Cayman Islands||
+KZ|KAZ|Kazakhstan||Kazakh
+LA|LAO|Laos|Lao People's Democratic Republic;Lao PDR|Laotian
+LB|LBN|Lebanon||Lebanese
+LC|LCA|Saint Lucia|St. Lucia;St Lucia|
+LI|LIE|Liechtenstein||
+LK|LKA|Sri Lanka||Sri Lankan
+LR|LBR|Liberia||Liberian
+LS|LSO|Lesotho||
+LT|LTU|Lithuania||Lithuanian
+LU|LUX|Luxembourg||Luxembourgish
+LV|LVA|Latvia||Latvian
+LY|LBY|Libya||Libyan
+MA|MAR|Morocco|Kingdom of Morocco|Moroccan
+MC|MCO|Monaco||Monegasque
+MD|MDA|Moldova|Republic of Moldova|Moldovan
+ME|MNE|Montenegro||Montenegrin
+MF|MAF|Saint Martin|St. Martin;Saint-Martin|
+MG|MDG|Madagascar||Malagasy
+MH|MHL|Marshall Islands||
+MK|MKD|North Macedonia|Macedonia;Republic of North Macedonia|Macedonian
+ML|MLI|Mali||Malian
+MM|MMR|Myanmar|Burma|Burmese
+MN|MNG|Mongolia||Mongolian
+MO|MAC|Macao|Macau|
+MP|MNP|Northern Mariana Islands||
+MQ|MTQ|Martinique||
+MR|MRT|Mauritania||Mauritanian
+MS|MSR|Montserrat||
+MT|MLT|Malta||Maltese
+MU|MUS|Mauritius||Mauritian
+MV|MDV|Maldives||Maldivian
+MW|MWI|Malawi||Malawian
+MX|MEX|Mexico|México;United Mexican States|Mexican
+MY|MYS|Malaysia||Malaysian
+MZ|MOZ|Mozambique||Mozambican
+NA|NAM|Namibia||Namibian
+NC|NCL|New Caledonia||
+NE|NER|Niger||
+NF|NFK|Norfolk Island||
+NG|NGA|Nigeria||Nigerian
+NI|NIC|Nicaragua||Nicaraguan
+NL|NLD|Netherlands|The Netherlands;Holland;Kingdom of the Netherlands|Dutch
+NO|NOR|Norway||Norwegian
+NP|NPL|Nepal||Nepalese;Nepali
+NR|NRU|Nauru||
+NU|NIU|Niue||
+NZ|NZL|New Zealand|NZ;Aotearoa|
+OM|OMN|Oman||Omani
+PA|PAN|Panama||Panamanian
+PE|PER|Peru||Peruvian
+PF|PYF|French Polynesia||
+PG|PNG|Papua New Guinea||
+PH|PHL|Philippines|The Philippines;Republic of the Philippines|Filipino;Philippine
+PK|PAK|Pakistan||Pakistani
+PL|POL|Poland||Polish
+PM|SPM|Saint Pierre and Miquelon||
+PN|PCN|Pitcairn Islands|Pitcairn|
+PR|PRI|Puerto Rico||Puerto Rican
+PS|PSE|Palestine|State of Palestine;Palestinian Territories|Palestinian
+PT|PRT|Portugal||Portuguese
+PW|PLW|Palau||
+PY|PRY|Paraguay||Paraguayan
+QA|QAT|Qatar||Qatari
+RE|REU|Reunion|Réunion|
+RO|ROU|Romania||Romanian
+RS|SRB|Serbia||Serbian
+RU|RUS|Russia|Russian Federation|Russian
+RW|RWA|Rwanda||Rwandan
+SA|SAU|Saudi Arabia|KSA;Kingdom of Saudi Arabia|Saudi
+SB|SLB|Solomon Islands||
+SC|SYC|Seychelles||
+SD|SDN|Sudan||Sudanese
+SE|SWE|Sweden||Swedish
+SG|SGP|Singapore|Republic of Singapore|Singaporean
+SH|SHN|Saint Helena|Saint Helena, Ascension and Tristan da Cunha;St. Helena|
+SI|SVN|Slovenia||Slovenian
+SJ|SJM|Svalbard and Jan Mayen|Svalbard|
+SK|SVK|Slovakia|Slovak Republic|Slovak
+SL|SLE|Sierra Leone||
+SM|SMR|San Marino||
+SN|SEN|Senegal||Senegalese
+SO|SOM|Somalia||Somali
+SR|SUR|Suriname|Surinam|
+SS|SSD|South Sudan||
+ST|STP|Sao Tome and Principe|São Tomé and Príncipe|
+SV|SLV|El Salvador||Salvadoran
+SX|SXM|Sint Maarten||
+SY|SYR|Syria|Syrian Arab Republic|Syrian
+SZ|SWZ|Eswatini|Swaziland|
+TC|TCA|Turks and Caicos Islands|Turks and Caicos|
+TD|TCD|Chad||Chadian
+TF|ATF|French Southern Territories||
+TG|TGO|Togo||Togolese
+TH|THA|Thailand|Kingdom of Thailand|Thai
+TJ|TJK|Tajikistan||Tajik
+TK|TKL|Tokelau||
+TL|TLS|Timor-Leste|East Timor|
+TM|TKM|Turkmenistan||Turkmen
+TN|TUN|Tunisia||Tunisian
+TO|TON|Tonga||Tongan
+TR|TUR|Turkey|Türkiye;Turkiye;Republic of Turkey|Turkish
+TT|TTO|Trinidad and Tobago|Trinidad|
+TV|TUV|Tuvalu||
+TW|TWN|Taiwan|Chinese Taipei;Republic of China;ROC;Taiwan, Province of China|Taiwanese
+TZ|TZA|Tanzania|United Republic of Tanzania|Tanzanian
+UA|UKR|Ukraine||Ukrainian
+UG|UGA|Uganda||Ugandan
+UM|UMI|United States Minor Outlying Islands||
+US|USA|United States|USA;U.S.A.;US;U.S.;United States of America;America|American
+UY|URY|Uruguay||Uruguayan
+UZ|UZB|Uzbekistan||Uzbek
+VA|VAT|Vatican City|Holy See;Vatican|
+VC|VCT|Saint Vincent and the Grenadines|St. Vincent and the Grenadines|
+VE|VEN|Venezuela|Bolivarian Republic of Venezuela|Venezuelan
+VG|VGB|British Virgin Islands|Virgin Islands, British|
+VI|VIR|U.S. Virgin Islands|US Virgin Islands;United States Virgin Islands;Virgin Islands, U.S.|
+VN|VNM|Vietnam|Viet Nam;Socialist Republic of Vietnam|Vietnamese
+VU|VUT|Vanuatu||
+WF|WLF|Wallis and Futuna||
+WS|WSM|Samoa||Samoan
+YE|YEM|Yemen||Yemeni
+YT|MYT|Mayotte||
+ZA|ZAF|South Africa|Republic of South Africa|South African
+ZM|ZMB|Zambia||Zambian
+ZW|ZWE|Zimbabwe||Zimbabwean
+"""
+
+# Place names that contain a country term but are not the country; matching
+# them (longest match wins) keeps e.g. a New Mexico address from reading as Mexico
+NON_COUNTRY_PHRASES = (
+    "New Mexico", "New Jersey", "New England", "New South Wales", "Indian Ocean",
+    "American Express", "Guinea Pig", "Jersey City", "North America", "South America",
+    "Central America", "Latin America", "Fine China", "Bone China", "Panama Hat", "French Fries",
+)
+
+# Country terms that are also given names or US place names ("Jordan Lane",
+# "Chad Smith", "Atlanta, Georgia"), even when capitalized. They only match
+# when capitalized, and callers scanning text without an origin label skip them.
+AMBIGUOUS_TERMS = ("Georgia", "Georgian", "Jordan", "Chad", "Jersey")
+
+# Country terms that are also common lowercase words ("turkey", "metal
+# polish", "swiss cheese"). They only match when capitalized, but are
+# otherwise taken like any other country term.
+CAPITALIZED_TERMS = (
+    "China", "Turkey", "Polish", "Panama", "Chile", "Guinea", "French", "Danish", "Swiss",
+)
+
+# Words of a term or of the text: letters with optional inner apostrophes
+_TOKEN = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+class Country:
+    """
+    A country from the gazetteer.
+    """
+
+    def __init__(self, code, alpha3, name):
+        """
+        Args:
+            code (str): ISO-3166 alpha-2 code
+            alpha3 (str): ISO-3166 alpha-3 code
+            name (str): Common English name
+        """
+        self.code = code
+        self.alpha3 = alpha3
+        self.name = name
+
+
+class CountryMention:
+    """
+    A country found in a text.
+    """
+
+    def __init__(self, country, start, end, kind, ambiguous=False):
+        """
+        Args:
+            country (Country): Country mentioned
+            start (int): Offset of the first character of the mention
+            end (int): Offset just past the mention
+            kind (str): Kind of term matched ("name", "alias", "adjective" or "code")
+            ambiguous (bool): Whether the term is also an ordinary word (see AMBIGUOUS_TERMS)
+        """
+        self.country = country
+        self.start = start
+        self.end = end
+        self.kind = kind
+        self.ambiguous = ambiguous
+
+    @property
+    def code(self):
+        """ISO-3166 alpha-2 code of the country."""
+        return self.country.code
+
+    @property
+    def name(self):
+        """Common English name of the country."""
+        return self.country.name
+
+    def to_dict(self):
+        """JSON-serializable form of the mention."""
+        return {"code": self.code, "name": self.name, "start": self.start, "end": self.end, "kind": self.kind}
+
+
+class _Term:
+    """A gazetteer term: the country it names (None for a non-country phrase) and how."""
+
+    def __init__(self, country, kind, length, capitalized, ambiguous=False, proper=False):
+        self.country = country
+        self.kind = kind
+        self.length = length
+        self.capitalized = capitalized
+        self.ambiguous = ambiguous
+        # Only matches when its first letter is a capital
+        self.proper = proper or ambiguous
+
+
+class CountryGazetteer:
+    """
+    Every ISO-3166 country with its aliases, adjectives and codes, compiled into
+    an Aho-Corasick automaton over words.
+
+    The automaton finds every mention in a text in a single linear pass over its
+    words, however many terms the gazetteer holds. Overlapping matches are
+    resolved leftmost-longest, so "Papua New Guinea" is one mention rather than
+    "Guinea".
+    """
+
+    def __init__(
+        self, data=ISO_3166, non_country_phrases=NON_COUNTRY_PHRASES, ambiguous_terms=AMBIGUOUS_TERMS,
+        capitalized_terms=CAPITALIZED_TERMS,
+    ):
+        """
+        Args:
+            data (str): Country table in the ISO_3166 format
+            non_country_phrases (iterable): Place names that must not match a country
+            ambiguous_terms (iterable): Country terms that are also names or US places
+            capitalized_terms (iterable): Country terms that are also lowercase words
+        """
+        ambiguous = {term.lower() for term in ambiguous_terms}
+        proper = {term.lower() for term in capitalized_terms}
+        self.countries = {}
+        # goto[state] maps a word to the next state; state 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+
+        for row in data.strip().splitlines():
+            code, alpha3, name, aliases, adjectives = row.split("|")
+            country = Country(code, alpha3, name)
+            self.countries[code] = country
+            self._add_term(name, _Term(country, KIND_NAME, 0, False, name.lower() in ambiguous, name.lower() in proper))
+            for alias in filter(None, aliases.split(";")):
+                self._add_term(alias, _Term(
+                    country, KIND_ALIAS, 0, alias.isupper(), alias.lower() in ambiguous, alias.lower() in proper
+                ))
+            for adjective in filter(None, adjectives.split(";")):
+                self._add_term(adjective, _Term(
+                    country, KIND_ADJECTIVE, 0, False, adjective.lower() in ambiguous, adjective.lower() in proper
+                ))
+            self._add_term(code, _Term(country, KIND_CODE, 0, True))
+            self._add_term(alpha3, _Term(country, KIND_CODE, 0, True))
+
+        for phrase in non_country_phrases:
+            self._add_term(phrase, _Term(None, None, 0, False))
+
+        self._build_failure_links()
+        self._max_length = max(entry.length for out in self._outputs for entry in out)
+
+    def _add_term(self, term, entry):
+        """
+        Insert a term into the trie.
+
+        Args:
+            term (str): Surface form of the term
+            entry (_Term): What the term means
+        """
+        words = [word.lower() for word in _TOKEN.findall(term)]
+        entry.length = len(words)
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._goto[state][word] = next_state
+            state = next_state
+        self._outputs[state].append(entry)
+
+    def _build_failure_links(self):
+        """
+        Link every state to the longest proper suffix of its path that is also
+        in the trie, and merge the outputs along those links.
+        """
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(word, 0) if state else 0
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def iter_mentions(self, text, kinds=DEFAULT_KINDS, ambiguous=True):
+        """
+        Find country mentions in document order, leftmost-longest.
+
+        Mentions are produced lazily, so a caller that only needs the first one
+        stops scanning as soon as it is found. Ambiguous terms and
+        CAPITALIZED_TERMS only match when capitalized.
+
+        Args:
+            text (str): Text to search
+            kinds (tuple): Kinds of terms to accept; codes are excluded by default
+                because two-letter codes collide with ordinary words
+            ambiguous (bool): Whether to report mentions of AMBIGUOUS_TERMS; they
+                still claim their words, so "Jordan" never yields a shorter match
+
+        Yields:
+            CountryMention: Each mention in order of offset
+        """
+        goto = self._goto
+        root = goto[0]
+        fail = self._fail
+        outputs = self._outputs
+        max_length = self._max_length
+
+        # Pending (start word, end word, start, end, term) matches and the first
+        # word not yet covered by a mention
+        candidates = []
+        cursor = 0
+        # Start offsets of the words on the current trie path
+        path_starts = []
+        state = 0
+        for index, match in enumerate(_TOKEN.finditer(text)):
+            word = match.group().lower()
+            if state:
+                while state and word not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(word, 0)
+            else:
+                state = root.get(word, 0)
+
+            if not state:
+                # Most words are not in any term; only settle what is pending
+                if path_starts:
+                    path_starts = []
+                if candidates:
+                    for mention, cursor in self._settle(candidates, cursor, index - max_length + 2):
+                        if ambiguous or not mention.ambiguous:
+                            yield mention
+                continue
+
+            path_starts.append(match.start())
+            if len(path_starts) > max_length:
+                del path_starts[0]
+
+            for entry in outputs[state]:
+                if entry.country is not None and entry.kind not in kinds:
+                    continue
+                start_word = index - entry.length + 1
+                if start_word < cursor:
+                    continue
+                start = path_starts[-entry.length]
+                if entry.capitalized and not text[start:match.end()].isupper():
+                    continue
+                if entry.proper and not text[start].isupper():
+                    continue
+                candidates.append((start_word, index, start, match.end(), entry))
+
+            if candidates:
+                # Matches found later start after this word, so candidates starting
+                # before it have every competitor (including longer ones) in hand
+                for mention, cursor in self._settle(candidates, cursor, index - max_length + 2):
+                    if ambiguous or not mention.ambiguous:
+                        yield mention
+
+        for mention, cursor in self._settle(candidates, cursor, float("inf")):
+            if ambiguous or not mention.ambiguous:
+                yield mention
+
+    @staticmethod
+    def _settle(candidates, cursor, settled_before):
+        """
+        Pick leftmost-longest matches among candidates that can no longer change.
+
+        Args:
+            candidates (list): Pending (start word, end word, start, end, term)
+                matches, updated in place
+            cursor (int): First word not covered by an earlier mention
+            settled_before (float): Candidates starting before this word are settled
+
+        Yields:
+            tuple: (CountryMention, new cursor) for each country picked
+        """
+        while candidates:
+            best = min(candidates, key=lambda match: (match[0], -match[1]))
+            if best[0] >= settled_before:
+                return
+            cursor = best[1] + 1
+            candidates[:] = [match for match in candidates if match[0] >= cursor]
+            if best[4].country is not None:
+                yield CountryMention(best[4].country, best[2], best[3], best[4].kind, best[4].ambiguous), cursor
+
+    def find(self, text, kinds=DEFAULT_KINDS, ambiguous=True):
+        """
+        Find every country mention in a text.
+
+        Args:
+            text (str): Text to search
+            kinds (tuple): Kinds of terms to accept
+            ambiguous (bool): Whether to report mentions of AMBIGUOUS_TERMS
+
+        Returns:
+            list: CountryMention objects in order of offset
+        """
+        return list(self.iter_mentions(text, kinds, ambiguous))
+
+    def first(self, text, kinds=DEFAULT_KINDS, ambiguous=True):
+        """
+        Find the first country mentioned in a text.
+
+        Args:
+            text (str): Text to search
+            kinds (tuple): Kinds of terms to accept
+            ambiguous (bool): Whether to report mentions of AMBIGUOUS_TERMS
+
+        Returns:
+            CountryMention: First mention, or None
+        """
+        return next(self.iter_mentions(text, kinds, ambiguous), None)
+
+    def lookup(self, term):
+        """
+        Resolve a name, alias, adjective or code on its own to a country.
+
+        Args:
+            term (str): e.g. "PRC", "South Korean" or "DE"
+
+        Returns:
+            Country: The country, or None if the whole term is not a known country
+        """
+        mention = self.first(term.strip(), kinds=DEFAULT_KINDS + (KIND_CODE,))
+        if mention is None or mention.start != 0 or mention.end != len(term.strip()):
+            return None
+        return mention.country
+
+
+def get_country_gazetteer():
+    """
+    Get the process-wide country gazetteer, compiling it on first use.
+
+    Returns:
+        CountryGazetteer: Shared gazetteer
+    """
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = CountryGazetteer()
+        return _gazetteer
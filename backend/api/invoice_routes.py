@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import json
 import logging
 import os
 import sys
@@ -11,9 +12,19 @@ if parent_dir not in sys.path:
     sys.path.insert(0, parent_dir)
 
 # Now import the backend modules
-from backend.pdf_processing.pdf_extractor import extract_text_from_pdf
+from backend.pdf_processing.pdf_extractor import extract_document
+from backend.pdf_processing.extraction_cache import get_extraction_cache
+from backend.pdf_processing.extraction_cascade import cascade_stats
 from backend.pdf_processing.invoice_parser import InvoiceParser
+from backend.pdf_processing.layout_templates import get_template_store
+from backend.pdf_processing.ocr_service import ocr_service_stats
+from backend.core.completion_cache import get_completion_cache
+from backend.core.llm_client import llm_client_stats
+from backend.core.llm_schemas import llm_parse_stats
+from backend.core.near_duplicates import get_near_duplicate_index
+from backend.core.product_classifications import get_product_classification_index
 from backend.core.tariff_invoice_integration import TariffInvoiceIntegration
+from backend.tariff_research.hts_index import get_hts_index
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,21 +45,68 @@ def parse_invoice():
         return jsonify({"error": "File must be a PDF"}), 400
     
     try:
-        # Extract text from PDF
-        text = extract_text_from_pdf(file)
+        # Extract text and tables from PDF
+        document = extract_document(file, parallel=True)
+        text = document.text
         
         # Parse the invoice and analyze tariffs
-        integration = TariffInvoiceIntegration(invoiceOutput=text, use_mock_data=False)
+        integration = TariffInvoiceIntegration(invoiceOutput=text, use_mock_data=False, document=document)
         result = integration.process_invoice_text()
         print("RESULT FROM ALL OF THE ANALYSIS", result['invoice_data'])
         
 
-        return jsonify({"analysis": result['tariff_analysis'], "items": result['invoice_data']})
+        return jsonify({"analysis": result['tariff_analysis'], "items": result['invoice_data'], "reuse": result['reuse']})
         # return jsonify(result)
     except Exception as e:
         logger.error(f"Error processing invoice: {str(e)}", exc_info=True)
         return jsonify({"error": f"Failed to process invoice: {str(e)}"}), 500
 
+@invoice_bp.route('/parse-invoice/stream', methods=['POST'])
+def parse_invoice_stream():
+    """Analyze a PDF invoice page by page, sending each line item's analysis as a line of NDJSON."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+    
+    if not file.filename.endswith('.pdf'):
+        return jsonify({"error": "File must be a PDF"}), 400
+    
+    # Read the upload now; the request's file is closed once streaming starts
+    pdf_bytes = file.read()
+    
+    def generate():
+        try:
+            integration = TariffInvoiceIntegration(use_mock_data=False)
+            for result in integration.iter_invoice_pdf_analysis(pdf_bytes):
+                yield json.dumps(result, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"Error streaming invoice analysis: {str(e)}", exc_info=True)
+            yield json.dumps({"error": f"Failed to process invoice: {str(e)}"}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @invoice_bp.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "ok", "message": "Invoice Parser API is running"}) 
\ No newline at end of file
+    cache = get_extraction_cache()
+    templates = get_template_store()
+    duplicates = get_near_duplicate_index()
+    completions = get_completion_cache()
+    hts_index = get_hts_index()
+    products = get_product_classification_index()
+    return jsonify({
+        "status": "ok",
+        "message": "Invoice Parser API is running",
+        "extraction_cache": cache.stats() if cache is not None else None,
+        "ocr_service": ocr_service_stats(),
+        "extraction_cascade": cascade_stats(),
+        "layout_templates": templates.stats() if templates is not None else None,
+        "near_duplicates": duplicates.stats() if duplicates is not None else None,
+        "llm_parsing": llm_parse_stats(),
+        "llm_client": llm_client_stats(),
+        "completion_cache": completions.stats() if completions is not None else None,
+        "hts_index": hts_index.stats() if hts_index is not None else None,
+        "product_classifications": products.stats() if products is not None else None
+    }) 
\ No newline at end of file
@@ -0,0 +1,280 @@
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+# Add the project root directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+parent_dir = os.path.dirname(backend_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from backend.pdf_processing.field_scanner import InvoiceFieldScanner
+
+# Country list of the previous implementation
+LEGACY_COUNTRIES = [
+    "China", "Mexico", "Canada", "Japan", "Germany", "United States",
+    "USA", "UK", "United Kingdom", "France", "Italy", "Spain",
+    "Brazil", "India", "South Korea", "Taiwan", "Vietnam", "Thailand",
+    "Malaysia", "Indonesia", "Philippines", "Singapore", "Hong Kong"
+]
+
+# Invoice total on the summary page, with a thousands separator
+SUMMARY_TOTAL = 12345.67
+
+FILLER_WORDS = (
+    "shipment pallet carton warehouse dock receiving inspection batch lot serial "
+    "packing weight dimensions handling notes reference customer account order"
+).split()
+
+
+def build_corpus(line_count, seed=0):
+    """
+    Build a synthetic invoice with an items section and the header fields at the end.
+
+    Placing the vendor, origin and total labels last makes every implementation
+    scan the whole corpus, like a long multi-page invoice with a summary page.
+    Some items have their own "Total:" line, and some amounts have thousands
+    separators; the per-pattern loops read both differently (see
+    compare_results).
+
+    Args:
+        line_count (int): Approximate number of lines
+        seed (int): Random seed
+
+    Returns:
+        list: Invoice lines
+    """
+    rng = random.Random(seed)
+    lines = ["", "Items:"]
+    item = 1
+    while len(lines) < line_count - 4:
+        lines.append(f"{item}. {' '.join(rng.choice(FILLER_WORDS) for _ in range(4))}")
+        lines.append(f"HTS Code: {rng.randint(1000, 9999)}.{rng.randint(10, 99)}.{rng.randint(1000, 9999)}")
+        quantity = rng.randint(1000, 5000) if rng.random() < 0.1 else rng.randint(1, 500)
+        unit_price = rng.randint(100, 999999) / 100 if rng.random() < 0.1 else rng.randint(100, 90099) / 100
+        lines.append(f"Quantity: {quantity:,}")
+        lines.append(f"Unit Price: ${unit_price:,.2f}")
+        if rng.random() < 0.5:
+            lines.append(f"Total: ${quantity * unit_price:,.2f}")
+        for _ in range(rng.randint(2, 6)):
+            lines.append(" ".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(3, 10))))
+        item += 1
+    lines += ["Vendor: Example Trading Co.", f"Made in {rng.choice(LEGACY_COUNTRIES)}", f"Balance Due: ${SUMMARY_TOTAL:,.2f}"]
+    return lines
+
+
+# The line-by-line implementation the scanner replaces, kept here as the baseline
+
+def legacy_vendor_name(lines):
+    patterns = [
+        r'vendor\s*:?\s*([^\n]+)',
+        r'supplier\s*:?\s*([^\n]+)',
+        r'from\s*:?\s*([^\n]+)',
+        r'bill\s*to\s*:?\s*([^\n]+)',
+        r'sold\s*by\s*:?\s*([^\n]+)',
+        r'company\s*:?\s*([^\n]+)',
+        r'business\s*:?\s*([^\n]+)'
+    ]
+    for line in lines:
+        for pattern in patterns:
+            match = re.search(pattern, line, re.IGNORECASE)
+            if match:
+                return match.group(1).strip()
+    for line in lines:
+        if line.strip():
+            return line.strip()
+    return "Unknown"
+
+
+def legacy_country_of_origin(lines):
+    patterns = [
+        r'country\s*of\s*origin\s*:?\s*([^\n]+)',
+        r'origin\s*:?\s*([^\n]+)',
+        r'made\s*in\s*:?\s*([^\n]+)',
+        r'manufactured\s*in\s*:?\s*([^\n]+)',
+        r'produced\s*in\s*:?\s*([^\n]+)'
+    ]
+    for line in lines:
+        for pattern in patterns:
+            match = re.search(pattern, line, re.IGNORECASE)
+            if match:
+                return match.group(1).strip()
+        for country in LEGACY_COUNTRIES:
+            if re.search(r'\b' + re.escape(country) + r'\b', line, re.IGNORECASE):
+                return country
+    return "Unknown"
+
+
+def legacy_line_items(lines):
+    items = []
+    current_item = None
+    items_started = False
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.lower().startswith('items:'):
+            items_started = True
+            continue
+        if not items_started:
+            continue
+        if re.match(r'^\d+\.', line):
+            if current_item is not None:
+                items.append(current_item)
+            current_item = {'product': line.split('.', 1)[1].strip(), 'quantity': 0, 'unit_price': 0.0, 'total_price': 0.0}
+            continue
+        if current_item is None:
+            continue
+        hts_match = re.search(r'hts\s*code\s*:?\s*([0-9\.]+)', line, re.IGNORECASE)
+        if hts_match:
+            current_item['hts_code'] = hts_match.group(1)
+            continue
+        qty_match = re.search(r'quantity\s*:?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
+        if qty_match:
+            current_item['quantity'] = float(qty_match.group(1))
+            continue
+        price_match = re.search(r'unit\s*price\s*:?\s*\$?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
+        if price_match:
+            current_item['unit_price'] = float(price_match.group(1))
+            continue
+        total_match = re.search(r'total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
+        if total_match:
+            current_item['total_price'] = float(total_match.group(1))
+            continue
+    if current_item is not None:
+        items.append(current_item)
+    return items
+
+
+def legacy_total_amount(lines):
+    patterns = [
+        r'total\s*amount\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
+        r'total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
+        r'amount\s*due\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
+        r'balance\s*due\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
+        r'grand\s*total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)'
+    ]
+    for line in lines:
+        for pattern in patterns:
+            match = re.search(pattern, line, re.IGNORECASE)
+            if match:
+                return float(match.group(1))
+    return 0.0
+
+
+def legacy_scan(lines):
+    return {
+        "vendor_name": legacy_vendor_name(lines),
+        "country_of_origin": legacy_country_of_origin(lines),
+        "line_items": legacy_line_items(lines),
+        "total_amount": legacy_total_amount(lines),
+    }
+
+
+def _cut_at_separator(value):
+    """What the per-pattern loops read from an amount printed with thousands separators."""
+    return float(f"{value:,.2f}".split(",")[0])
+
+
+def compare_results(legacy, scanner):
+    """
+    Compare the scanner's fields with the per-pattern loops'.
+
+    Two differences are expected. The loops stop reading an amount at a
+    thousands separator ("1,250.00" is 1.0), while the scanner reads the whole
+    amount. The loops also take the first "Total:" line as the invoice total,
+    even one that belongs to a line item, while the scanner skips item totals
+    and finds the summary total.
+
+    Args:
+        legacy (dict): Output of legacy_scan
+        scanner (dict): Output of InvoiceFieldScanner.scan
+
+    Returns:
+        tuple: (list of expected differences, list of unexpected differences),
+            each a description string
+    """
+    expected = []
+    unexpected = []
+    for field in ("vendor_name", "country_of_origin"):
+        if legacy[field] != scanner[field]:
+            unexpected.append(f"{field}: {legacy[field]!r} vs {scanner[field]!r}")
+
+    if legacy["total_amount"] != scanner["total_amount"]:
+        difference = f"total_amount: {legacy['total_amount']} vs {scanner['total_amount']}"
+        if scanner["total_amount"] == SUMMARY_TOTAL:
+            expected.append(difference + " (loops read an item's \"Total:\" line)")
+        else:
+            unexpected.append(difference)
+
+    if len(legacy["line_items"]) != len(scanner["line_items"]):
+        unexpected.append(f"line_items: {len(legacy['line_items'])} vs {len(scanner['line_items'])} items")
+        return expected, unexpected
+    separated = 0
+    for index, (legacy_item, scanner_item) in enumerate(zip(legacy["line_items"], scanner["line_items"])):
+        fields = [field for field in scanner_item if legacy_item.get(field) != scanner_item[field]]
+        if not fields:
+            continue
+        if all(legacy_item.get(field) == _cut_at_separator(scanner_item[field]) for field in fields):
+            separated += 1
+        else:
+            unexpected.append(f"line item {index + 1}: {legacy_item} vs {scanner_item}")
+    if separated:
+        expected.append(f"line_items: {separated} items with amounts cut at a thousands separator by the loops")
+    return expected, unexpected
+
+
+def time_runs(function, lines, repeat):
+    """
+    Time a field extractor over the corpus.
+
+    Args:
+        function (callable): Extractor taking the list of lines
+        lines (list): Invoice lines
+        repeat (int): Number of timed runs
+
+    Returns:
+        tuple: (median seconds, result of the last run)
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(lines)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the single-pass field scanner with per-pattern line loops")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = build_corpus(args.lines)
+    scanner = InvoiceFieldScanner()
+
+    legacy_seconds, legacy_result = time_runs(legacy_scan, lines, args.repeat)
+    scanner_seconds, scanner_result = time_runs(scanner.scan, lines, args.repeat)
+
+    print(f"{len(lines)} lines, {len(scanner_result['line_items'])} line items, median of {args.repeat} runs")
+    print(f"{'Implementation':<24}{'time (ms)':>12}")
+    print(f"{'per-pattern loops':<24}{legacy_seconds * 1000:>12.1f}")
+    print(f"{'single-pass scanner':<24}{scanner_seconds * 1000:>12.1f}")
+    print(f"Speedup: {legacy_seconds / scanner_seconds:.1f}x")
+    expected, unexpected = compare_results(legacy_result, scanner_result)
+    print("Expected differences from the per-pattern loops:")
+    for difference in expected or ["none"]:
+        print(f"  {difference}")
+    print(f"Unexpected differences: {len(unexpected)}")
+    for difference in unexpected[:10]:
+        print(f"  {difference}")
+
+
+if __name__ == "__main__":
+    main()
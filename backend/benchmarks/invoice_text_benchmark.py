@@ -0,0 +1,105 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add the project root directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+parent_dir = os.path.dirname(backend_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from backend.agents.country_detector import CountryDetector
+from backend.benchmarks.field_scanner_benchmark import build_corpus
+from backend.core.tariff_invoice_integration import TariffInvoiceIntegration
+from backend.pdf_processing.invoice_parser import InvoiceParser
+from backend.pdf_processing.invoice_text import InvoiceText
+
+
+def build_invoices(count, line_count):
+    """
+    Build synthetic invoices whose origin is only given in an address line.
+
+    Without an origin label both the country detector and the field scanner
+    fall back to looking for country names, so they read the same gazetteer
+    pass when the text is shared.
+
+    Args:
+        count (int): Number of invoices
+        line_count (int): Approximate number of lines per invoice
+
+    Returns:
+        list: Invoice texts
+    """
+    invoices = []
+    for seed in range(count):
+        lines = build_corpus(line_count, seed=seed)
+        country = lines[-2].split("Made in ", 1)[1]
+        lines[-2] = f"Warehouse: 12 Harbour Road, {country}"
+        invoices.append("\n".join(lines))
+    return invoices
+
+
+def run_pipeline(texts, detector, parser, integration, shared):
+    """
+    Run country detection, pattern parsing and the fallback line item
+    extraction over every invoice.
+
+    Args:
+        texts (list): Raw invoice texts
+        detector (CountryDetector): Country detector
+        parser (InvoiceParser): Invoice parser
+        integration (TariffInvoiceIntegration): Integration providing the fallback extractor
+        shared (bool): Tokenize each invoice once and hand the result to every stage;
+            otherwise every stage receives the raw string and tokenizes it itself
+
+    Returns:
+        list: (country, parsed invoice, fallback items) per invoice
+    """
+    results = []
+    for text in texts:
+        if shared:
+            text = InvoiceText(text)
+        results.append((
+            detector.detect_country(text),
+            parser._parse_with_patterns(text),
+            integration._extract_line_items_fallback(text),
+        ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the per-invoice CPU saved by sharing one InvoiceText across stages")
+    parser.add_argument("--invoices", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    texts = build_invoices(args.invoices, args.lines)
+    detector = CountryDetector()
+    invoice_parser = InvoiceParser()
+    # Only the text-based fallback is exercised, so skip the client and agent setup
+    integration = TariffInvoiceIntegration.__new__(TariffInvoiceIntegration)
+
+    timings = {}
+    results = {}
+    for shared in (False, True):
+        runs = []
+        for _ in range(args.repeat):
+            started = time.process_time()
+            results[shared] = run_pipeline(texts, detector, invoice_parser, integration, shared)
+            runs.append(time.process_time() - started)
+        timings[shared] = statistics.median(runs) / args.invoices
+
+    print(f"{args.invoices} invoices of {args.lines} lines, median of {args.repeat} runs")
+    print(f"{'Pipeline':<28}{'CPU per invoice (ms)':>22}")
+    print(f"{'each stage tokenizes':<28}{timings[False] * 1000:>22.2f}")
+    print(f"{'shared InvoiceText':<28}{timings[True] * 1000:>22.2f}")
+    print(f"Saved per invoice: {(timings[False] - timings[True]) * 1000:.2f} ms ({1 - timings[True] / timings[False]:.0%})")
+    print(f"Results identical: {results[False] == results[True]}")
+
+
+if __name__ == "__main__":
+    main()
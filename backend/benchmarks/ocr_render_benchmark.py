@@ -0,0 +1,74 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add the project root directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+parent_dir = os.path.dirname(backend_dir)
+if parent_dir not in sys.path:
+    sys.path.insert(0, parent_dir)
+
+from backend.pdf_processing.ocr import OCR_DPI, RENDER_BACKEND_PDFIUM, RENDER_BACKEND_POPPLER, render_page
+from backend.pdf_processing.pdf_extractor import count_pages
+
+SAMPLE_PDFS = ["duke_invoice.pdf", "sample_invoice.pdf", "temp_invoice.pdf"]
+
+
+def benchmark_backend(pdf_path, backend, dpi, repeat):
+    """
+    Time rendering every page of a PDF with one backend.
+
+    Args:
+        pdf_path (str): Path to PDF file
+        backend (str): Render backend
+        dpi (int): Render resolution
+        repeat (int): Number of timed runs
+
+    Returns:
+        list: Seconds per run
+    """
+    page_count = count_pages(pdf_path)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for index in range(page_count):
+            render_page(pdf_path, index, dpi=dpi, backend=backend)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR page rendering with pdfium and pdf2image")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to render (defaults to the repo's sample invoices)")
+    parser.add_argument("--dpi", type=int, default=OCR_DPI)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or [os.path.join(parent_dir, name) for name in SAMPLE_PDFS]
+
+    print(f"Rendering at {args.dpi} DPI, median of {args.repeat} runs")
+    print(f"{'PDF':<24}{'pdfium (ms)':>14}{'pdf2image (ms)':>16}{'speedup':>10}")
+    for pdf_path in pdfs:
+        medians = {}
+        for backend in (RENDER_BACKEND_PDFIUM, RENDER_BACKEND_POPPLER):
+            try:
+                medians[backend] = statistics.median(benchmark_backend(pdf_path, backend, args.dpi, args.repeat)) * 1000
+            except Exception as e:
+                print(f"  {backend} unavailable for {os.path.basename(pdf_path)}: {str(e)}")
+
+        pdfium_ms = medians.get(RENDER_BACKEND_PDFIUM)
+        poppler_ms = medians.get(RENDER_BACKEND_POPPLER)
+        speedup = f"{poppler_ms / pdfium_ms:.1f}x" if pdfium_ms and poppler_ms else "n/a"
+        print(
+            f"{os.path.basename(pdf_path):<24}"
+            f"{pdfium_ms if pdfium_ms is not None else float('nan'):>14.1f}"
+            f"{poppler_ms if poppler_ms is not None else float('nan'):>16.1f}"
+            f"{speedup:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
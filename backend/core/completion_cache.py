@@ -0,0 +1,269 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from llama_stack_client.types import ChatCompletionResponse
+
+# Default location of the disk tier
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "completions", "completions.db"
+)
+
+# Completions kept in memory, most recently used first
+DEFAULT_MEMORY_ENTRIES = 1024
+
+# Completions kept on disk; least recently used are evicted beyond this
+DEFAULT_DISK_ENTRIES = 100000
+
+# Hours a completion stays valid
+DEFAULT_TTL_HOURS = 24 * 7
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def _normalize_content(content):
+    """Message content with runs of whitespace collapsed, so prompt indentation does not matter."""
+    if isinstance(content, str):
+        return " ".join(content.split())
+    return content
+
+
+def _message_field(message, name):
+    """Field of a chat message given as a dict or a message model."""
+    if isinstance(message, dict):
+        return message.get(name)
+    return getattr(message, name, None)
+
+
+def completion_key(messages, model_id, params=None):
+    """
+    Cache key of a chat completion request.
+
+    Args:
+        messages (list): Chat messages
+        model_id (str): Model asked
+        params (dict, optional): Generation parameters (response_format, sampling_params, ...)
+
+    Returns:
+        str: Hex SHA-256 of the model, normalized messages and parameters
+    """
+    request = {
+        "model_id": model_id,
+        "messages": [
+            {"role": _message_field(message, "role"), "content": _normalize_content(_message_field(message, "content"))}
+            for message in messages
+        ],
+        "params": params or {},
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Two-tier cache of LLM chat completions.
+
+    An in-memory LRU of response objects sits in front of a SQLite table of
+    their JSON. Entries expire after ttl seconds, and each tier drops its
+    least recently used entries beyond its size cap.
+    """
+
+    def __init__(self, path=None, memory_entries=None, disk_entries=None, ttl_hours=None):
+        """
+        Args:
+            path (str, optional): SQLite database file
+            memory_entries (int, optional): Size cap of the memory tier
+            disk_entries (int, optional): Size cap of the disk tier
+            ttl_hours (float, optional): Hours a completion stays valid
+        """
+        self.path = path or os.getenv("COMPLETION_CACHE_PATH", DEFAULT_DB_PATH)
+        if memory_entries is None:
+            memory_entries = int(os.getenv("COMPLETION_CACHE_MEMORY_ENTRIES", DEFAULT_MEMORY_ENTRIES))
+        if disk_entries is None:
+            disk_entries = int(os.getenv("COMPLETION_CACHE_DISK_ENTRIES", DEFAULT_DISK_ENTRIES))
+        if ttl_hours is None:
+            ttl_hours = float(os.getenv("COMPLETION_CACHE_TTL_HOURS", DEFAULT_TTL_HOURS))
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl_hours * 3600
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (response, model_id, created_at), most recently used last
+        self._memory = collections.OrderedDict()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model_id TEXT, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+        self._db.commit()
+        self._disk_size = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def get(self, key):
+        """
+        Look up a completion.
+
+        Args:
+            key (str): completion_key of the request
+
+        Returns:
+            ChatCompletionResponse: Cached response, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, model_id, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT model_id, response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            model_id, payload, created_at = row
+            if now - created_at > self.ttl:
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._db.commit()
+                self._disk_size -= 1
+                self.expired += 1
+                self.misses += 1
+                return None
+
+            self._db.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            response = ChatCompletionResponse.model_validate(json.loads(payload))
+            self._remember(key, response, model_id, created_at)
+            self.disk_hits += 1
+            return response
+
+    def put(self, key, model_id, response):
+        """
+        Store a completion in both tiers.
+
+        Args:
+            key (str): completion_key of the request
+            model_id (str): Model that produced it
+            response (ChatCompletionResponse): Completion to store
+        """
+        if not hasattr(response, 'model_dump'):
+            return
+        payload = json.dumps(response.model_dump(mode="json"))
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, model_id, now)
+            previous = self._db.execute("SELECT 1 FROM completions WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, model_id, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model_id, payload, now, now),
+            )
+            if previous is None:
+                self._disk_size += 1
+            if self._disk_size > self.disk_entries:
+                # Evict a tenth of the cap at once so eviction is not run on every insert
+                excess = self._disk_size - self.disk_entries + max(self.disk_entries // 10, 1)
+                cursor = self._db.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self._disk_size -= cursor.rowcount
+                self.evictions += cursor.rowcount
+            self._db.commit()
+
+    def _remember(self, key, response, model_id, created_at):
+        """Put a response in the memory tier, evicting beyond its cap. Caller holds the lock."""
+        self._memory[key] = (response, model_id, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None, model_id=None):
+        """
+        Drop cached completions.
+
+        Args:
+            key (str, optional): Drop only this completion
+            model_id (str, optional): Drop every completion of this model
+
+        Returns:
+            int: Number of disk entries removed; with neither argument the whole cache is cleared
+        """
+        with self._lock:
+            if key is not None:
+                self._memory.pop(key, None)
+                cursor = self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            elif model_id is not None:
+                for cached_key in [k for k, entry in self._memory.items() if entry[1] == model_id]:
+                    del self._memory[cached_key]
+                cursor = self._db.execute("DELETE FROM completions WHERE model_id = ?", (model_id,))
+            else:
+                self._memory.clear()
+                cursor = self._db.execute("DELETE FROM completions")
+            self._db.commit()
+            self._disk_size -= cursor.rowcount
+        logging.info(f"Invalidated {cursor.rowcount} cached completions")
+        return cursor.rowcount
+
+    def stats(self):
+        """
+        Cache counters.
+
+        Returns:
+            dict: memory_hits, disk_hits, misses, hit_ratio, expired, evictions
+                and the entries in each tier
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_size,
+            }
+
+
+def get_completion_cache():
+    """
+    Get the process-wide completion cache, creating it on first use.
+
+    Set COMPLETION_CACHE_DISABLED=1 to turn caching off.
+
+    Returns:
+        CompletionCache: Shared cache, or None when disabled or unavailable
+    """
+    global _default_cache
+    if os.getenv("COMPLETION_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = CompletionCache()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Completion cache unavailable: {str(e)}")
+                return None
+        return _default_cache
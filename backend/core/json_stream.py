@@ -0,0 +1,99 @@
+import json
+import logging
+import re
+
+# Characters that change the parser state; everything else is skipped in bulk
+_STRUCTURAL = re.compile(r'[\[\]{}"\\]')
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for a JSON array of objects that arrives in pieces.
+
+    Text before the opening bracket (such as a Markdown code fence) is
+    ignored. Each object element is returned by feed() as soon as its closing
+    brace arrives; elements that are not objects, and objects that fail to
+    parse, are skipped.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.closed = False
+        self.errors = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape_next = False
+        self._pending = []
+
+    def feed(self, chunk):
+        """
+        Consume the next piece of the text.
+
+        Args:
+            chunk (str): Text received since the last call
+
+        Returns:
+            list: Objects (dicts) completed by this chunk, in order
+        """
+        completed = []
+        if self.closed or not chunk:
+            return completed
+
+        # A backslash at the end of the last chunk escapes this chunk's first character
+        skip = 1 if self._escape_next else 0
+        self._escape_next = False
+        element_start = 0 if self._depth > 1 else None
+
+        for match in _STRUCTURAL.finditer(chunk):
+            index = match.start()
+            if index < skip:
+                continue
+            char = chunk[index]
+
+            if self._in_string:
+                if char == '\\':
+                    skip = index + 2
+                    if skip > len(chunk):
+                        self._escape_next = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                    self._depth = 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 1:
+                    element_start = index
+                    self._pending = []
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 1 and element_start is not None:
+                    element = "".join(self._pending) + chunk[element_start:index + 1]
+                    self._pending = []
+                    element_start = None
+                    value = self._parse(element)
+                    if isinstance(value, dict):
+                        completed.append(value)
+                elif self._depth == 0:
+                    self.closed = True
+                    return completed
+
+        if element_start is not None:
+            self._pending.append(chunk[element_start:])
+        return completed
+
+    def _parse(self, element):
+        """Parse one complete array element, or None if it is not valid JSON."""
+        try:
+            return json.loads(element)
+        except json.JSONDecodeError as e:
+            self.errors += 1
+            logging.warning(f"Skipping malformed line item in streamed JSON: {str(e)}")
+            return None
@@ -0,0 +1,259 @@
+import collections
+import logging
+import os
+import statistics
+import threading
+import time
+import httpx
+from llama_stack_client import LlamaStackClient
+from backend.core.completion_cache import completion_key, get_completion_cache
+
+# Model used when a call does not name one
+DEFAULT_MODEL = "llama3.2:3b"
+
+# Most LLM calls in flight at once across the process
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Seconds a call may take before it is abandoned
+DEFAULT_TIMEOUT = 120.0
+
+# Keep-alive connections held open to the Llama Stack server
+DEFAULT_MAX_CONNECTIONS = 10
+
+# Recent call latencies kept for percentiles
+LATENCY_WINDOW = 1000
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def llama_stack_url():
+    """
+    Base URL of the Llama Stack server, from LLAMA_STACK_URL or LLAMA_HOST and LLAMA_PORT.
+
+    Returns:
+        str: Base URL
+    """
+    url = os.getenv("LLAMA_STACK_URL")
+    if url:
+        return url
+    return f"http://{os.getenv('LLAMA_HOST', 'localhost')}:{os.getenv('LLAMA_PORT', '8321')}"
+
+
+class LLMClient:
+    """
+    Process-wide Llama Stack client with pooled keep-alive connections.
+
+    Every call shares one httpx connection pool, waits for one of
+    max_concurrency slots, and is bounded by a timeout. Streaming calls hold
+    their slot until the stream is consumed or closed. Calls made with
+    cache=True are answered from the completion cache when the same request
+    was made before. The client exposes inference.chat_completion like
+    LlamaStackClient, so it can stand in for it.
+    """
+
+    def __init__(self, base_url=None, model_id=None, max_concurrency=None, timeout=None, max_connections=None):
+        """
+        Args:
+            base_url (str, optional): Llama Stack server URL
+            model_id (str, optional): Model used when a call does not name one
+            max_concurrency (int, optional): Most calls in flight at once
+            timeout (float, optional): Default per-call timeout in seconds
+            max_connections (int, optional): Keep-alive connections in the pool
+        """
+        self.base_url = base_url or llama_stack_url()
+        self.model_id = model_id or os.getenv("LLM_MODEL", DEFAULT_MODEL)
+        if max_concurrency is None:
+            max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        if timeout is None:
+            timeout = float(os.getenv("LLM_TIMEOUT", DEFAULT_TIMEOUT))
+        if max_connections is None:
+            max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+        self.calls = 0
+        self.errors = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.in_flight = 0
+        self._wait_seconds = 0.0
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.cache = get_completion_cache()
+
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            event_hooks={"request": [self._on_request]},
+        )
+        self.client = LlamaStackClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            http_client=self.http_client,
+        )
+        logging.info(f"LLM client for {self.base_url} (model {self.model_id}, {max_concurrency} concurrent calls)")
+
+    @property
+    def inference(self):
+        """This client, for code written against LlamaStackClient.inference."""
+        return self
+
+    def _on_request(self, request):
+        """Count an HTTP request and watch whether it opens a new connection."""
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name, info):
+        """httpcore trace hook; a TCP connect means the pool had no idle connection."""
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connections_opened += 1
+
+    def _acquire(self):
+        """Wait for a free call slot."""
+        started = time.perf_counter()
+        self._slots.acquire()
+        with self._lock:
+            self._wait_seconds += time.perf_counter() - started
+            self.in_flight += 1
+
+    def _release(self, started, failed):
+        """Free a call slot and record the call's latency."""
+        self._slots.release()
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += int(failed)
+            self._latencies.append(time.perf_counter() - started)
+
+    def chat_completion(self, messages, model_id=None, stream=False, timeout=None, cache=False, **kwargs):
+        """
+        Run a chat completion within the concurrency limit.
+
+        Args:
+            messages (list): Chat messages
+            model_id (str, optional): Model to ask; defaults to the configured model
+            stream (bool): Whether to stream the response
+            timeout (float, optional): Seconds before the call is abandoned
+            cache (bool): Answer from and store in the completion cache; for
+                deterministic prompts that recur, and ignored when streaming
+            **kwargs: Further chat_completion arguments (e.g. response_format)
+
+        Returns:
+            The completion response, or for stream=True an iterator over its
+            chunks that starts the call when first iterated
+        """
+        if stream:
+            return self._stream(messages, model_id, timeout, kwargs)
+
+        model_id = model_id or self.model_id
+        key = None
+        if cache and self.cache is not None:
+            key = completion_key(messages, model_id, kwargs)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        self._acquire()
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.client.inference.chat_completion(
+                messages=messages,
+                model_id=model_id,
+                stream=False,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            )
+            failed = False
+        finally:
+            self._release(started, failed)
+        if key is not None:
+            self.cache.put(key, model_id, response)
+        return response
+
+    def _stream(self, messages, model_id, timeout, kwargs):
+        """Streamed chat completion that holds a call slot until it is consumed or closed."""
+        self._acquire()
+        started = time.perf_counter()
+        failed = True
+        response = None
+        try:
+            response = self.client.inference.chat_completion(
+                messages=messages,
+                model_id=model_id or self.model_id,
+                stream=True,
+                timeout=timeout or self.timeout,
+                **kwargs,
+            )
+            yield from response
+            failed = False
+        except GeneratorExit:
+            # The caller stopped reading early; that is not a failure
+            failed = False
+            raise
+        finally:
+            # Return the connection to the pool even when the stream was abandoned
+            if response is not None and hasattr(response, 'close'):
+                response.close()
+            self._release(started, failed)
+
+    def stats(self):
+        """
+        Client counters.
+
+        Returns:
+            dict: calls, errors, in_flight, max_concurrency, latency mean/p50/p95
+                in seconds, mean wait for a slot, HTTP requests, connections
+                opened and connection_reuse_rate
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "base_url": self.base_url,
+                "model_id": self.model_id,
+                "calls": self.calls,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "mean_latency": statistics.fmean(latencies) if latencies else 0.0,
+                "p50_latency": latencies[len(latencies) // 2] if latencies else 0.0,
+                "p95_latency": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                "mean_wait": self._wait_seconds / self.calls if self.calls else 0.0,
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connection_reuse_rate": 1 - self.connections_opened / self.requests if self.requests else 0.0,
+            }
+
+
+def get_llm_client():
+    """
+    Get the process-wide LLM client, creating it on first use.
+
+    Returns:
+        LLMClient: Shared client, or None if it could not be created
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            try:
+                _default_client = LLMClient()
+            except Exception as e:
+                logging.error(f"Error initializing LLM client: {str(e)}")
+                return None
+        return _default_client
+
+
+def llm_client_stats():
+    """
+    Counters of the process-wide LLM client.
+
+    Returns:
+        dict: LLMClient.stats(), or None if the client is unavailable
+    """
+    client = get_llm_client()
+    return client.stats() if client is not None else None
@@ -0,0 +1,187 @@
+import logging
+import threading
+from typing import List, Optional
+from pydantic import BaseModel, ValidationError
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+class LineItem(BaseModel):
+    """
+    One invoice line item as returned by the LLM.
+    """
+
+    product: str
+    quantity: Optional[float] = None
+    unit_price: Optional[float] = None
+    total_price: Optional[float] = None
+    hts_code: Optional[str] = None
+    country_of_origin: Optional[str] = None
+
+
+class LineItemList(BaseModel):
+    """
+    Line items of an invoice. The array is wrapped in an object because
+    JSON-schema guided decoding expects an object at the top level.
+    """
+
+    line_items: List[LineItem]
+
+
+class InvoiceExtraction(BaseModel):
+    """
+    Structured invoice data as returned by the LLM.
+    """
+
+    vendor_name: str = "Unknown"
+    country_of_origin: str = "Unknown"
+    line_items: List[LineItem] = []
+    total_amount: Optional[float] = None
+
+
+class HtsClassification(BaseModel):
+    """
+    HTS code proposed for one product description of a batch.
+    """
+
+    index: int
+    hts_code: Optional[str] = None
+    confidence: float = 0.0
+
+
+class HtsClassificationBatch(BaseModel):
+    """
+    HTS codes for a numbered batch of product descriptions.
+    """
+
+    classifications: List[HtsClassification]
+
+
+def response_format(model):
+    """
+    Llama Stack response_format constraining generation to a model's JSON schema.
+
+    Args:
+        model (type): Pydantic model class
+
+    Returns:
+        dict: JSON schema response format
+    """
+    return {"type": "json_schema", "json_schema": model.model_json_schema()}
+
+
+LINE_ITEMS_FORMAT = response_format(LineItemList)
+INVOICE_FORMAT = response_format(InvoiceExtraction)
+HTS_BATCH_FORMAT = response_format(HtsClassificationBatch)
+
+
+def _strip_code_fence(content):
+    """Remove a Markdown code fence that a server without guided decoding may add."""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else ""
+        if content.rstrip().endswith("```"):
+            content = content.rstrip()[:-3]
+    return content
+
+
+class ParseStats:
+    """
+    Counters of LLM responses that failed schema validation, per schema.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = {}
+
+    def record(self, schema, success, invalid_items=0):
+        """
+        Record one LLM response.
+
+        Args:
+            schema (str): Name of the schema the response was validated against
+            success (bool): Whether the response parsed and validated
+            invalid_items (int): Elements of the response that were dropped as invalid
+        """
+        with self._lock:
+            counters = self._schemas.setdefault(schema, {"responses": 0, "failures": 0, "invalid_items": 0})
+            counters["responses"] += 1
+            counters["failures"] += int(not success)
+            counters["invalid_items"] += invalid_items
+
+    def stats(self):
+        """
+        Parse counters.
+
+        Returns:
+            dict: For each schema its responses, failures, failure_rate and invalid_items
+        """
+        with self._lock:
+            return {
+                schema: dict(counters, failure_rate=counters["failures"] / counters["responses"])
+                for schema, counters in self._schemas.items()
+            }
+
+
+def get_parse_stats():
+    """
+    Get the process-wide LLM parse counters.
+
+    Returns:
+        ParseStats: Shared counters
+    """
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = ParseStats()
+        return _stats
+
+
+def llm_parse_stats():
+    """
+    Counters of the process-wide LLM response validation.
+
+    Returns:
+        dict: ParseStats.stats()
+    """
+    return get_parse_stats().stats()
+
+
+def parse_response(model, content, schema):
+    """
+    Validate a complete LLM response against a model, recording the outcome.
+
+    Args:
+        model (type): Pydantic model class
+        content (str): Response text
+        schema (str): Name the outcome is recorded under
+
+    Returns:
+        BaseModel: Validated instance, or None if the response does not conform
+    """
+    try:
+        parsed = model.model_validate_json(_strip_code_fence(content or ""))
+    except ValidationError as e:
+        logging.warning(f"LLM response failed {schema} schema validation: {e.error_count()} errors")
+        get_parse_stats().record(schema, False)
+        return None
+    get_parse_stats().record(schema, True)
+    return parsed
+
+
+def validate_line_item(data):
+    """
+    Validate one streamed line item.
+
+    Args:
+        data (dict): Object parsed from the LLM output
+
+    Returns:
+        dict: Normalized line item, or None if it does not conform
+    """
+    try:
+        return LineItem.model_validate(data).model_dump()
+    except ValidationError as e:
+        logging.warning(f"Dropping line item that failed validation: {e.error_count()} errors")
+        return None
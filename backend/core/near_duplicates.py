@@ -0,0 +1,339 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# Default location of the index of analyzed invoices
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "near_duplicates", "invoices.db"
+)
+
+# Largest number of differing SimHash bits (out of 64) for two invoices to be near duplicates
+DEFAULT_MAX_DISTANCE = 3
+
+# Analyses older than this are not reused, since tariffs change
+DEFAULT_MAX_AGE_DAYS = 30
+
+# Words per shingle
+SHINGLE_SIZE = 3
+
+# Values that change between re-sent copies of the same invoice: dates,
+# times and page footers. Dates must not touch other digits or dots, so HTS
+# codes such as 8542.31.00 are kept
+_VOLATILE = re.compile(
+    r'(?<![\d.])(?:(?:19|20)\d{2}[/.-]\d{1,2}[/.-]\d{1,2}|\d{1,2}[/.-]\d{1,2}[/.-](?:\d{4}|\d{2}))(?![\d.])'
+    r'|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{1,2},?\s+\d{4}\b'
+    r'|\b\d{1,2}\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{4}\b'
+    r'|\b\d{1,2}:\d{2}(?::\d{2})?\s*(?:am|pm)?\b'
+    r'|\bpage\s+\d+(?:\s+of\s+\d+)?\b'
+)
+_WORD = re.compile(r'\w+')
+
+# Multipliers for combining word hashes into shingle hashes, and the
+# splitmix64 finalizer constants
+_SHINGLE_MULTIPLIERS = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9][:SHINGLE_SIZE], dtype=np.uint64
+)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def normalize_invoice_text(text):
+    """
+    Invoice text with the parts that vary between copies removed.
+
+    Args:
+        text (str): Raw invoice text
+
+    Returns:
+        str: Lowercased words without dates, times and page numbers
+    """
+    return " ".join(_WORD.findall(_VOLATILE.sub(" ", str(text).lower())))
+
+
+def _word_hash(word):
+    """Stable 64-bit hash of a word."""
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _bit_counts(values):
+    """Set bits of each uint64; np.bitwise_count needs NumPy 2.0."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def simhash(normalized):
+    """
+    64-bit SimHash of normalized text over its word shingles.
+
+    Each word is hashed once; shingle hashes are combined from the word
+    hashes and mixed with the splitmix64 finalizer, all in NumPy.
+
+    Args:
+        normalized (str): Output of normalize_invoice_text
+
+    Returns:
+        int: Unsigned 64-bit fingerprint
+    """
+    words = normalized.split()
+    if not words:
+        return 0
+    word_hashes = {}
+    hashes = np.array([word_hashes.setdefault(word, _word_hash(word)) for word in words], dtype=np.uint64)
+
+    if len(hashes) >= SHINGLE_SIZE:
+        count = len(hashes) - SHINGLE_SIZE + 1
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset, multiplier in enumerate(_SHINGLE_MULTIPLIERS):
+            shingles += hashes[offset:offset + count] * multiplier
+    else:
+        shingles = hashes
+    shingles ^= shingles >> np.uint64(30)
+    shingles *= _MIX_1
+    shingles ^= shingles >> np.uint64(27)
+    shingles *= _MIX_2
+    shingles ^= shingles >> np.uint64(31)
+
+    # A bit is set when most shingles have it set
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+    return int(np.packbits(majority, bitorder='little').view('<u8')[0])
+
+
+def line_item_key(item):
+    """
+    What a line item's tariff analysis depends on: its product and stated HTS code.
+
+    Args:
+        item (dict): Line item as extracted, before classification
+
+    Returns:
+        str: Key for matching items across invoices
+    """
+    product = " ".join(str(item.get('product') or '').lower().split())
+    return f"{product}|{item.get('hts_code') or ''}"
+
+
+class InvoiceFingerprint:
+    """
+    SimHash and exact digest of an invoice's normalized text.
+    """
+
+    def __init__(self, text):
+        """
+        Args:
+            text (str): Raw invoice text
+        """
+        normalized = normalize_invoice_text(text)
+        self.simhash = simhash(normalized)
+        self.digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class NearDuplicate:
+    """
+    A previously analyzed invoice close to the one being processed.
+    """
+
+    def __init__(self, entry_id, distance, digest, items, created_at):
+        """
+        Args:
+            entry_id (int): Row id in the index
+            distance (int): Differing SimHash bits
+            digest (str): Digest of the stored invoice's normalized text
+            items (list): Stored items, each {"key", "item", "analysis"}
+            created_at (float): When the stored invoice was analyzed
+        """
+        self.entry_id = entry_id
+        self.distance = distance
+        self.digest = digest
+        self.items = items
+        self.created_at = created_at
+
+    def analyses(self):
+        """
+        Stored items by line_item_key.
+
+        Returns:
+            dict: Key to {"key", "item", "analysis"}
+        """
+        return {stored["key"]: stored for stored in self.items}
+
+
+class NearDuplicateIndex:
+    """
+    SimHash index of analyzed invoices, persisted in SQLite.
+
+    Fingerprints, countries and ages are held in NumPy arrays, so a lookup is
+    one vectorized XOR and popcount over every indexed invoice; stored line
+    items and analyses are read from SQLite only for the match. Only
+    invoices with the same country of origin match, since tariffs depend on
+    it.
+    """
+
+    def __init__(self, path=None, max_distance=None, max_age_days=None):
+        """
+        Args:
+            path (str, optional): SQLite database file
+            max_distance (int, optional): Largest SimHash distance of a near duplicate
+            max_age_days (float, optional): Age after which analyses are not reused
+        """
+        self.path = path or os.getenv("NEAR_DUPLICATE_DB_PATH", DEFAULT_DB_PATH)
+        if max_distance is None:
+            max_distance = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", DEFAULT_MAX_DISTANCE))
+        if max_age_days is None:
+            max_age_days = float(os.getenv("NEAR_DUPLICATE_MAX_AGE_DAYS", DEFAULT_MAX_AGE_DAYS))
+        self.max_distance = max_distance
+        self.max_age = max_age_days * 24 * 3600
+
+        self.lookups = 0
+        self.exact = 0
+        self.near = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            "id INTEGER PRIMARY KEY, simhash INTEGER NOT NULL, digest TEXT NOT NULL, "
+            "country TEXT, created_at REAL NOT NULL, items TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        rows = self._db.execute("SELECT id, simhash, country, created_at FROM invoices ORDER BY id").fetchall()
+        self._countries = {}
+        self._size = 0
+        self._ids = np.zeros(max(len(rows), 1024), dtype=np.int64)
+        self._simhashes = np.zeros(len(self._ids), dtype=np.uint64)
+        self._country_codes = np.zeros(len(self._ids), dtype=np.int32)
+        self._created = np.zeros(len(self._ids), dtype=np.float64)
+        for entry_id, signed_hash, country, created_at in rows:
+            self._append(entry_id, signed_hash & 0xFFFFFFFFFFFFFFFF, country, created_at)
+
+    def _country_code(self, country):
+        """Small integer standing for a country in the NumPy arrays."""
+        return self._countries.setdefault(country or "", len(self._countries))
+
+    def _append(self, entry_id, fingerprint, country, created_at):
+        """Add an entry to the in-memory arrays, growing them as needed. Caller holds the lock."""
+        if self._size == len(self._ids):
+            capacity = len(self._ids) * 2
+            self._ids = np.resize(self._ids, capacity)
+            self._simhashes = np.resize(self._simhashes, capacity)
+            self._country_codes = np.resize(self._country_codes, capacity)
+            self._created = np.resize(self._created, capacity)
+        self._ids[self._size] = entry_id
+        self._simhashes[self._size] = fingerprint
+        self._country_codes[self._size] = self._country_code(country)
+        self._created[self._size] = created_at
+        self._size += 1
+
+    def find(self, fingerprint, country):
+        """
+        Find the closest recent invoice within max_distance.
+
+        Args:
+            fingerprint (InvoiceFingerprint): Fingerprint of the new invoice
+            country (str): Its country of origin
+
+        Returns:
+            NearDuplicate: Closest match, or None
+        """
+        with self._lock:
+            self.lookups += 1
+            size = self._size
+            distances = _bit_counts(self._simhashes[:size] ^ np.uint64(fingerprint.simhash))
+            candidates = (
+                (distances <= self.max_distance)
+                & (self._country_codes[:size] == self._country_code(country))
+                & (self._created[:size] >= time.time() - self.max_age)
+            )
+            positions = np.flatnonzero(candidates)
+            if not len(positions):
+                return None
+            # The newest of the closest entries holds the most recent analysis
+            best = positions[np.lexsort((-self._ids[positions], distances[positions]))[0]]
+            row = self._db.execute(
+                "SELECT digest, items, created_at FROM invoices WHERE id = ?", (int(self._ids[best]),)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, items, created_at = row
+            if digest == fingerprint.digest:
+                self.exact += 1
+            else:
+                self.near += 1
+        return NearDuplicate(int(self._ids[best]), int(distances[best]), digest, json.loads(items), created_at)
+
+    def add(self, fingerprint, country, items):
+        """
+        Index an analyzed invoice.
+
+        Args:
+            fingerprint (InvoiceFingerprint): Fingerprint of the invoice
+            country (str): Its country of origin
+            items (list): Analyzed items, each {"key", "item", "analysis"}
+
+        Returns:
+            int: Row id of the new entry
+        """
+        created_at = time.time()
+        payload = json.dumps(items, default=str)
+        # SQLite integers are signed
+        signed_hash = fingerprint.simhash - (1 << 64) if fingerprint.simhash >= 1 << 63 else fingerprint.simhash
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO invoices (simhash, digest, country, created_at, items) VALUES (?, ?, ?, ?, ?)",
+                (signed_hash, fingerprint.digest, country, created_at, payload),
+            )
+            self._db.commit()
+            self._append(cursor.lastrowid, fingerprint.simhash, country, created_at)
+        return cursor.lastrowid
+
+    def stats(self):
+        """
+        Index counters.
+
+        Returns:
+            dict: invoices, lookups, exact and near matches, and reuse_rate
+        """
+        with self._lock:
+            return {
+                "invoices": self._size,
+                "lookups": self.lookups,
+                "exact": self.exact,
+                "near": self.near,
+                "reuse_rate": (self.exact + self.near) / self.lookups if self.lookups else 0.0,
+                "max_distance": self.max_distance,
+            }
+
+
+def get_near_duplicate_index():
+    """
+    Get the process-wide near-duplicate index, creating it on first use.
+
+    Set NEAR_DUPLICATE_DISABLED=1 to turn reuse off.
+
+    Returns:
+        NearDuplicateIndex: Shared index, or None when disabled or unavailable
+    """
+    global _default_index
+    if os.getenv("NEAR_DUPLICATE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+
+    with _default_index_lock:
+        if _default_index is None:
+            try:
+                _default_index = NearDuplicateIndex()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Near-duplicate index unavailable: {str(e)}")
+                return None
+        return _default_index
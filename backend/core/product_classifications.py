@@ -0,0 +1,290 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import numpy as np
+from backend.tariff_research.hts_index import tokenize
+
+# Default location of the index of classified products
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "product_classifications", "products.db"
+)
+
+# Smallest cosine similarity at which a past classification is reused; the
+# two descriptions must also have the same words apart from numbers (see
+# product_terms), since one changed noun can keep the similarity above this
+DEFAULT_MIN_SIMILARITY = 0.8
+
+# Characters per n-gram, and hash buckets the n-grams are folded into
+NGRAM_SIZE = 3
+DIMENSIONS = 1 << 18
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Pack counts such as "100pc" or "12pk", which do not change what a product is
+_PACK_COUNT = re.compile(r'^(?:\d+(?:pc|pcs|pk|pack|ct)|pc|pcs|pk|pack|ct)$')
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def normalize_description(description):
+    """
+    Product description reduced to its distinct lowercase words in sorted order.
+
+    Sorting makes the stored key independent of word order, so "Hex Bolt M6"
+    and "m6 hex bolt" are the same product. Pack counts are dropped.
+
+    Args:
+        description (str): Product description
+
+    Returns:
+        str: Normalized description
+    """
+    words = {word for word in _WORD.findall(str(description).lower()) if not _PACK_COUNT.match(word)}
+    return " ".join(sorted(words))
+
+
+def product_terms(normalized):
+    """
+    Words that say what a product is: a description's words without numbers,
+    sizes or stopwords, with plurals folded.
+
+    "laptop computer 15 inch" and "laptop computer bag 15 inch" differ in
+    "bag", so one is never reused for the other, while "hex bolts m6" and
+    "hex bolt m8" have the same terms.
+
+    Args:
+        normalized (str): Output of normalize_description
+
+    Returns:
+        frozenset: Terms of the description
+    """
+    return frozenset(tokenize(" ".join(word for word in normalized.split() if word.isalpha())))
+
+
+def embed(normalized):
+    """
+    Hashed character n-gram vector of a normalized description.
+
+    Each word is padded with spaces, so n-grams at word edges are distinct
+    from those inside words. Counts are damped with 1 + log(count); IDF
+    weighting is applied at lookup time.
+
+    Args:
+        normalized (str): Output of normalize_description
+
+    Returns:
+        tuple: (bucket indices as int32, term weights as float32), sorted by bucket
+    """
+    counts = {}
+    for word in normalized.split():
+        padded = f" {word} "
+        for start in range(max(len(padded) - NGRAM_SIZE + 1, 1)):
+            bucket = zlib.crc32(padded[start:start + NGRAM_SIZE].encode('utf-8')) % DIMENSIONS
+            counts[bucket] = counts.get(bucket, 0) + 1
+    if not counts:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+    buckets = np.array(sorted(counts), dtype=np.int32)
+    return buckets, 1 + np.log(np.array([counts[bucket] for bucket in buckets], dtype=np.float32))
+
+
+class ProductMatch:
+    """
+    A past classification close to a product description.
+    """
+
+    def __init__(self, description, hts_code, similarity):
+        """
+        Args:
+            description (str): Description that was classified
+            hts_code (str): HTS code it was given
+            similarity (float): Cosine similarity to the looked-up description
+        """
+        self.description = description
+        self.hts_code = hts_code
+        self.similarity = similarity
+
+
+class ProductClassificationIndex:
+    """
+    Nearest-neighbour index of classified product descriptions, persisted in SQLite.
+
+    Descriptions are stored as sparse hashed character n-gram vectors in
+    flat NumPy arrays (one entry per non-zero weight), alongside the number
+    of products containing each n-gram. A lookup computes TF-IDF cosine
+    similarity against every indexed product with gathers and bincounts, so
+    IDF always reflects the current contents and an insert is only an
+    append. A close product is only reused when its product_terms match. Vectors are saved with their rows, so restarting does not
+    re-embed anything.
+    """
+
+    def __init__(self, path=None, min_similarity=None):
+        """
+        Args:
+            path (str, optional): SQLite database file
+            min_similarity (float, optional): Smallest similarity at which a match is returned
+        """
+        self.path = path or os.getenv("PRODUCT_INDEX_PATH", DEFAULT_DB_PATH)
+        if min_similarity is None:
+            min_similarity = float(os.getenv("PRODUCT_INDEX_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY))
+        self.min_similarity = min_similarity
+
+        self.lookups = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._descriptions = []
+        self._codes = []
+        self._terms = []
+        # Normalized description -> position, for updating a product classified again
+        self._positions = {}
+        self._nnz = 0
+        self._buckets = np.zeros(16384, dtype=np.int32)
+        self._weights = np.zeros(len(self._buckets), dtype=np.float32)
+        self._owners = np.zeros(len(self._buckets), dtype=np.int32)
+        self._document_frequencies = np.zeros(DIMENSIONS, dtype=np.int32)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "normalized TEXT PRIMARY KEY, description TEXT NOT NULL, hts_code TEXT NOT NULL, "
+            "buckets BLOB NOT NULL, weights BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        for normalized, description, hts_code, buckets, weights in self._db.execute(
+            "SELECT normalized, description, hts_code, buckets, weights FROM products ORDER BY rowid"
+        ):
+            self._append(
+                normalized, description, hts_code,
+                np.frombuffer(buckets, dtype=np.int32), np.frombuffer(weights, dtype=np.float32),
+            )
+
+    def _append(self, normalized, description, hts_code, buckets, weights):
+        """Add a product to the in-memory arrays, growing them as needed. Caller holds the lock."""
+        needed = self._nnz + len(buckets)
+        if needed > len(self._buckets):
+            capacity = max(len(self._buckets) * 2, needed)
+            self._buckets = np.resize(self._buckets, capacity)
+            self._weights = np.resize(self._weights, capacity)
+            self._owners = np.resize(self._owners, capacity)
+        position = len(self._descriptions)
+        self._buckets[self._nnz:needed] = buckets
+        self._weights[self._nnz:needed] = weights
+        self._owners[self._nnz:needed] = position
+        self._document_frequencies[buckets] += 1
+        self._nnz = needed
+        self._positions[normalized] = position
+        self._descriptions.append(description)
+        self._codes.append(hts_code)
+        self._terms.append(product_terms(normalized))
+
+    def find(self, description):
+        """
+        Find the most similar classified product with the same terms.
+
+        Args:
+            description (str): Product description
+
+        Returns:
+            ProductMatch: Closest product at or above min_similarity whose
+                product_terms are the query's, or None
+        """
+        normalized = normalize_description(description)
+        terms = product_terms(normalized)
+        buckets, weights = embed(normalized)
+        with self._lock:
+            self.lookups += 1
+            if not len(buckets) or not self._descriptions:
+                return None
+            count = len(self._descriptions)
+            nnz = self._nnz
+            owners = self._owners[:nnz]
+            stored_buckets = self._buckets[:nnz]
+            # N-grams not indexed yet are weighted like those of a single product
+            idf = np.log((1 + count) / (1 + np.maximum(self._document_frequencies, 1).astype(np.float32))) + 1
+
+            query = np.zeros(DIMENSIONS, dtype=np.float32)
+            query[buckets] = weights * idf[buckets]
+            stored = self._weights[:nnz] * idf[stored_buckets]
+            dots = np.bincount(owners, weights=query[stored_buckets] * stored, minlength=count)
+            norms = np.sqrt(np.bincount(owners, weights=stored * stored, minlength=count))
+            scores = dots / (norms * np.linalg.norm(query[buckets]))
+
+            close = np.flatnonzero(scores >= self.min_similarity)
+            for position in close[np.argsort(-scores[close])]:
+                if self._terms[position] == terms:
+                    self.hits += 1
+                    return ProductMatch(self._descriptions[position], self._codes[position], float(scores[position]))
+            return None
+
+    def add(self, description, hts_code):
+        """
+        Index a classified product, replacing the code of the same normalized description.
+
+        Args:
+            description (str): Product description
+            hts_code (str): HTS code it was classified under
+        """
+        normalized = normalize_description(description)
+        buckets, weights = embed(normalized)
+        if not len(buckets) or not hts_code:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO products (normalized, description, hts_code, buckets, weights, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalized, description, hts_code, buckets.tobytes(), weights.tobytes(), time.time()),
+            )
+            self._db.commit()
+            position = self._positions.get(normalized)
+            if position is not None:
+                # Same words, so the same vector; only the code changes
+                self._descriptions[position] = description
+                self._codes[position] = hts_code
+            else:
+                self._append(normalized, description, hts_code, buckets, weights)
+
+    def stats(self):
+        """
+        Index counters.
+
+        Returns:
+            dict: products indexed, lookups, hits and hit_rate
+        """
+        with self._lock:
+            return {
+                "products": len(self._descriptions),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "min_similarity": self.min_similarity,
+            }
+
+
+def get_product_classification_index():
+    """
+    Get the process-wide index of classified products, creating it on first use.
+
+    Set PRODUCT_INDEX_DISABLED=1 to turn reuse off.
+
+    Returns:
+        ProductClassificationIndex: Shared index, or None when disabled or unavailable
+    """
+    global _default_index
+    if os.getenv("PRODUCT_INDEX_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+
+    with _default_index_lock:
+        if _default_index is None:
+            try:
+                _default_index = ProductClassificationIndex()
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"Product classification index unavailable: {str(e)}")
+                return None
+        return _default_index
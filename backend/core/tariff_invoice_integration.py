@@ -1,8 +1,8 @@
 import logging
-import json
 import os
 import sys
 import re
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 
@@ -15,10 +15,18 @@ if parent_dir not in sys.path:
 
 # Now import the backend modules
 from backend.tariff_research.tariffSearch import TariffMonitoringAgent
-from backend.pdf_processing.invoice_parser import InvoiceParser
-from backend.pdf_processing.pdf_extractor import extract_text_from_pdf
+from backend.tariff_research.hts_index import get_hts_index, normalize_hts_code
+from backend.pdf_processing.invoice_parser import LAYOUT_CONFIDENCE_THRESHOLD, InvoiceParser
+from backend.pdf_processing.invoice_text import InvoiceText
+from backend.pdf_processing.pdf_extractor import extract_document, iter_pages
 from backend.agents.country_detector import CountryDetector
-from llama_stack_client import LlamaStackClient
+from backend.core.json_stream import JsonArrayStream
+from backend.core.llm_client import get_llm_client
+from backend.core.llm_schemas import (
+    HTS_BATCH_FORMAT, LINE_ITEMS_FORMAT, HtsClassificationBatch, get_parse_stats, parse_response, validate_line_item
+)
+from backend.core.near_duplicates import InvoiceFingerprint, get_near_duplicate_index, line_item_key
+from backend.core.product_classifications import get_product_classification_index
 from llama_stack_client.types import UserMessage, SystemMessage
 
 # Configure logging
@@ -28,38 +36,61 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Estimated prompt tokens per batched HTS classification request; larger
+# batches are split into chunks
+HTS_BATCH_TOKEN_BUDGET = int(os.getenv("HTS_BATCH_TOKEN_BUDGET", "3000"))
+
+# Most product descriptions classified in one request
+HTS_BATCH_MAX_ITEMS = int(os.getenv("HTS_BATCH_MAX_ITEMS", "40"))
+
+# Batched HTS codes below this confidence are treated as unknown
+HTS_MIN_CONFIDENCE = float(os.getenv("HTS_MIN_CONFIDENCE", "0.5"))
+
+# Rough characters per token, and tokens the answer takes per description
+_CHARS_PER_TOKEN = 4
+_ANSWER_TOKENS_PER_ITEM = 30
+
+_HTS_BATCH_SYSTEM_PROMPT = (
+    "You are an expert at identifying Harmonized Tariff Schedule (HTS) codes for products based on "
+    "their descriptions. Only return valid HTS codes, and null with a low confidence when you are not confident."
+)
+
+_HTS_SYSTEM_PROMPT = (
+    "You are an expert at identifying HTS codes for products based on their descriptions. "
+    "Only return valid HTS codes or 'unknown' if you're not confident."
+)
+
+# Confidence reported for a code taken from a decisive schedule match
+_DECISIVE_CONFIDENCE = 1.0
+
 class TariffInvoiceIntegration:
     """
     Integrates the TariffMonitoringAgent with the InvoiceParser to analyze
     tariffs for items in an invoice.
     """
     
-    def __init__(self, invoiceOutput=None, use_mock_data=True):
+    def __init__(self, invoiceOutput=None, use_mock_data=True, document=None):
         """
         Initialize the integration between invoice parsing and tariff analysis.
         
         Args:
             invoiceOutput (str, optional): Raw invoice text to process
             use_mock_data (bool): Whether to use mock data for testing
+            document (ExtractedDocument, optional): Structured extraction the text came from
         """
         self.invoice_parser = InvoiceParser()
         self.tariff_agent = TariffMonitoringAgent(use_mock_data=use_mock_data)
         self.country_detector = CountryDetector()
         self.invoiceOutput = invoiceOutput
+        self.document = document
+        self.duplicate_index = get_near_duplicate_index()
+        self.hts_index = get_hts_index()
+        self.product_index = get_product_classification_index()
+        # False while Llama line items are streaming, and after a stream that ended early
+        self._line_items_complete = True
         
-        # Initialize Llama client with the correct host and port
-        host = os.getenv("LLAMA_HOST", "localhost")
-        port = os.getenv("LLAMA_PORT", "8321")  # Updated to use port 8321
-        logger.info(f"Initializing Llama client with host: {host}, port: {port}")
-        
-        try:
-            self.llama_client = LlamaStackClient(
-                base_url=f"http://{host}:{port}",
-            )
-            logger.info("Llama client initialized successfully")
-        except Exception as e:
-            logger.error(f"Error initializing Llama client: {str(e)}")
-            self.llama_client = None
+        # Shared, pooled Llama client
+        self.llama_client = get_llm_client()
         
     def process_invoice_pdf(self, pdf_path):
         """
@@ -71,20 +102,27 @@ class TariffInvoiceIntegration:
         Returns:
             dict: Combined invoice and tariff analysis results
         """
-        # Extract text from PDF
+        # Extract text and tables from PDF
         with open(pdf_path, 'rb') as pdf_file:
-            text = extract_text_from_pdf(pdf_file)
+            document = extract_document(pdf_file, parallel=True)
+        invoice_text = InvoiceText(document.text)
         
         # Parse the invoice
-        invoice_data = self.invoice_parser.parse_invoice(text, pdf_path=pdf_path)
+        invoice_data = self.invoice_parser.parse_invoice(invoice_text, pdf_path=pdf_path, document=document)
+        country_info = self.country_detector.detect_country(invoice_text)
         
-        # Analyze tariffs for each item
-        tariff_analysis = self.analyze_invoice_tariffs(invoice_data)
+        # Analyze tariffs for each parsed item, extracting them again only if parsing found none
+        line_items = invoice_data.get('line_items') or []
+        if line_items:
+            tariff_analysis = self._analyze_items(line_items, country_info['country'])
+        else:
+            tariff_analysis = self.analyze_invoice_tariffs(invoice_text, country_info['country'], document=document)
         
         # Combine results
         result = {
             'invoice_data': invoice_data,
-            'tariff_analysis': tariff_analysis
+            'tariff_analysis': tariff_analysis,
+            'country_detection': country_info
         }
         
         return result
@@ -93,99 +131,363 @@ class TariffInvoiceIntegration:
         """
         Process invoice text and analyze tariffs for the items.
         
+        If a near duplicate of the invoice with the same country of origin was
+        analyzed before, the tariff analysis of every unchanged line item is
+        reused and only new or changed items are analyzed. When the normalized
+        text is identical its line items are reused as well.
+        
         Returns:
-            dict: Combined invoice and tariff analysis results
+            dict: Combined invoice and tariff analysis results; 'reuse' tells
+                whether and how much of a previous analysis was reused
         """
         if not self.invoiceOutput:
             raise ValueError("No invoice text provided")
             
+        # Tokenize once for every detector and parser below
+        invoice_text = InvoiceText.of(self.invoiceOutput)
+        
         # Detect country of origin
-        country_info = self.country_detector.detect_country(self.invoiceOutput)
+        country_info = self.country_detector.detect_country(invoice_text)
         self.country = country_info['country']
         
         # Parse the invoice
         # invoice_data = self.invoice_parser.parse_invoice(self.invoiceOutput, self.country)
         
         # Analyze tariffs for each item
-        tariff_analysis = self.analyze_invoice_tariffs(self.invoiceOutput, self.country)
+        if self.duplicate_index is None:
+            tariff_analysis = self.analyze_invoice_tariffs(invoice_text, self.country, document=self.document)
+            reuse = {'reused': False}
+        else:
+            tariff_analysis, reuse = self._analyze_with_reuse(invoice_text, self.country)
         
         # Combine results
         result = {
             'invoice_data': self.invoiceOutput,
             'tariff_analysis': tariff_analysis,
-            'country_detection': country_info
+            'country_detection': country_info,
+            'reuse': reuse
         }
         
         return result
     
-    def analyze_invoice_tariffs(self, text, country_of_origin):
+    def analyze_invoice_tariffs(self, text, country_of_origin, document=None):
         """
         Analyze tariffs for items in an invoice text.
         
         Args:
-            text (str): Raw invoice text
+            text (str or InvoiceText): Raw invoice text, or its shared tokenized text
             country_of_origin (str): Country of origin for the items
+            document (ExtractedDocument, optional): Structured extraction of the invoice;
+                when its tables or word layout yield line items the Llama extraction is skipped
             
         Returns:
-            dict: Tariff analysis results
+            list: Tariff analysis of each line item; items streamed from Llama are
+                analyzed as they arrive
         """
-        tariff_analysis = {
-            'items': [],
-            'total_tariff_cost': 0.0,
-            'summary': {}
-        }
+        return self._analyze_items(self._extract_line_items(text, document), country_of_origin)
+    
+    def _analyze_items(self, line_items, country_of_origin):
+        """
+        Classify and analyze tariffs for extracted line items.
         
-        # Extract line items from the text using Llama
-        line_items = self._extract_line_items_with_llama(text)
+        Args:
+            line_items (iterable): Line items; a generator when they are streamed from Llama
+            country_of_origin (str): Country of origin for the items
+            
+        Returns:
+            list: Tariff analysis of each line item
+        """
+        # Classify every item without an HTS code in one request; items
+        # streamed from Llama are classified one by one as they arrive
+        batched = isinstance(line_items, list)
+        if batched:
+            self._classify_line_items(line_items, country_of_origin)
         
         analysis = []
 
         # Analyze each item
         for item in line_items:
-            hts_code = item.get('hts_code')
-            
-            # If no HTS code is found, try to find one using the product description
-            if not hts_code:
-                product_description = item.get('product', '')
-                if product_description:
-                    hts_code = self._find_hts_code_for_product(product_description, country_of_origin)
-                    if hts_code:
-                        item['hts_code'] = hts_code
-                        logger.info(f"Found HTS code {hts_code} for product: {product_description}")
-                    else:
-                        logger.warning(f"No HTS code found for item: {product_description}")
-                        # Continue processing even without an HTS code
-                        # Use a placeholder HTS code for analysis
-                        hts_code = None  # Placeholder HTS code
-            
-            quantity = float(item.get('quantity', 0))
-            unit_price = float(item.get('unit_price', 0))
-            total_price = float(item.get('total_price', quantity * unit_price))
-            
-            # Use the TariffMonitoringAgent to analyze tariffs for this item
-            # This will search USTR, USITC, and WTO for tariff information
-            item_analysis = self.tariff_agent.analyze_tariffs(hts_code, country_of_origin)
-            analysis.append(item_analysis)
+            analysis.append(self._analyze_line_item(item, country_of_origin, classify=not batched))
             
         
         # print('THE LENGTH OF THE ANALYSIS IS: ', len(analysis))
         return analysis
     
-    def _extract_line_items_with_llama(self, text):
+    def _extract_line_items(self, text, document=None):
+        """
+        Extract line items from table columns or the word layout when possible,
+        otherwise with Llama.
+        
+        Args:
+            text (str or InvoiceText): Raw invoice text, or its shared tokenized text
+            document (ExtractedDocument, optional): Structured extraction of the invoice
+            
+        Returns:
+            iterable: Line items; a generator when they are streamed from Llama
+        """
+        line_items = []
+        if document is not None:
+            line_items = self.invoice_parser.extract_line_items_from_tables(document.tables)
+            if not line_items:
+                line_items = self._extract_line_items_from_layout(document.pages)
+        if not line_items:
+            return self._extract_line_items_with_llama(text)
+        return line_items
+    
+    def _analyze_with_reuse(self, invoice_text, country_of_origin):
         """
-        Extract line items from text using Llama model.
+        Analyze tariffs, reusing the analysis of a near-duplicate invoice.
+        
+        Items are matched to the stored ones by product and stated HTS code,
+        which is all their tariff analysis depends on. The invoice is indexed
+        afterwards unless it was an exact copy whose items were all reused, or
+        extraction found no items or ended early, so a failed analysis is never
+        replayed. An exact copy that stored no items is extracted again.
         
         Args:
-            text (str): Raw invoice text
+            invoice_text (InvoiceText): Tokenized invoice text
+            country_of_origin (str): Country of origin for the items
             
         Returns:
-            list: List of line items with product, quantity, price, and HTS code
+            tuple: (tariff analysis list, reuse details)
         """
+        fingerprint = InvoiceFingerprint(invoice_text.text)
+        duplicate = self.duplicate_index.find(fingerprint, country_of_origin)
+        exact = duplicate is not None and duplicate.digest == fingerprint.digest and bool(duplicate.items)
+        
+        previous = duplicate.analyses() if duplicate is not None else {}
+        batched = True
+        self._line_items_complete = True
+        if exact:
+            keyed_items = ((dict(stored['item']), stored['key']) for stored in duplicate.items)
+        else:
+            line_items = self._extract_line_items(invoice_text, self.document)
+            keyed_items = ((item, line_item_key(item) if isinstance(item, dict) else None) for item in line_items)
+            batched = isinstance(line_items, list)
+            if batched:
+                # Keys are taken before classification fills in HTS codes
+                keyed_items = list(keyed_items)
+                self._classify_line_items(
+                    [item for item, key in keyed_items if key is not None and key not in previous], country_of_origin
+                )
+        
+        analysis = []
+        indexed = []
+        reused_items = 0
+        for item, key in keyed_items:
+            stored = previous.get(key)
+            if stored is not None:
+                # Keep the HTS code found when the item was first classified
+                if stored['item'].get('hts_code') and not item.get('hts_code'):
+                    item['hts_code'] = stored['item']['hts_code']
+                item_analysis = stored['analysis']
+                reused_items += 1
+            else:
+                item_analysis = self._analyze_line_item(item, country_of_origin, classify=not batched)
+            analysis.append(item_analysis)
+            if key is not None:
+                indexed.append({'key': key, 'item': item, 'analysis': item_analysis})
+        
+        if not analysis or not self._line_items_complete:
+            logger.warning("Line item extraction found nothing or ended early; invoice not indexed for reuse")
+        elif not (exact and reused_items == len(analysis)):
+            self.duplicate_index.add(fingerprint, country_of_origin, indexed)
+        
+        if duplicate is None:
+            return analysis, {'reused': False}
+        logger.info(f"Reused {reused_items} of {len(analysis)} item analyses from invoice {duplicate.entry_id} "
+                    f"(distance {duplicate.distance})")
+        return analysis, {
+            'reused': reused_items > 0,
+            'source_id': duplicate.entry_id,
+            'distance': duplicate.distance,
+            'exact': exact,
+            'reused_items': reused_items,
+            'analyzed_items': len(analysis) - reused_items
+        }
+    
+    def iter_invoice_pdf_analysis(self, pdf_file):
+        """
+        Stream tariff analysis for a PDF invoice, one line item at a time.
+        
+        Country detection and line-item extraction run on each page as soon as it
+        has been extracted, so items are analyzed while later pages are still
+        being read. Line items come from table columns and from the text of each
+        page; the items found on a page are classified in one batched HTS
+        request. Until an origin label settles the country of origin, items are
+        analyzed with the country detected so far and marked provisional; once
+        the whole document is read, every provisional item whose country turned
+        out different is analyzed again and sent a second time with 'revised'
+        set. If no page yields line items, they are rebuilt from the word
+        layout, and only when that is not confident enough does the full text go
+        through the Llama line-item extraction, whose items are analyzed as they
+        stream in.
+        
+        Args:
+            pdf_file: Path, bytes or file object containing the PDF invoice
+            
+        Yields:
+            dict: The line item, its tariff analysis, the country detection
+                result, the item's 'index', and 'provisional' and 'revised' flags
+        """
+        country_stream = self.country_detector.stream()
+        pages = []
+        page_texts = []
+        pending = []
+        # (index, item, country) of items analyzed with a provisional country
+        provisional_items = []
+        released = {'items': 0, 'pages': 0}
+        
+        def invoice_lines():
+            for page in iter_pages(pdf_file, parallel=True):
+                page_text = page.flattened_text()
+                pages.append(page)
+                page_texts.append(page_text)
+                country_stream.feed(page_text)
+                # Table rows are complete as soon as their page is
+                pending.extend(self.invoice_parser.extract_line_items_from_tables(page.tables))
+                yield from page_text.split('\n')
+        
+        def release(items, final=False):
+            country_info = country_stream.finish()
+            provisional = not (final or country_stream.is_final)
+            batched = isinstance(items, list)
+            if batched:
+                self._classify_line_items(items, country_info['country'])
+            for item in items:
+                result = self._streamed_item_result(item, country_info, classify=not batched)
+                result.update(index=released['items'], provisional=provisional, revised=False)
+                if provisional:
+                    provisional_items.append((released['items'], item, country_info['country']))
+                released['items'] += 1
+                yield result
+        
+        for item in self.invoice_parser.iter_line_items(invoice_lines()):
+            pending.append(item)
+            # Release once a new page has been read, so a page's items share one HTS request
+            if len(pages) > released['pages']:
+                released['pages'] = len(pages)
+                ready = list(pending)
+                pending.clear()
+                yield from release(ready)
+        
+        if not released['items'] and not pending:
+            pending = self._extract_line_items_from_layout(pages)
+        if not released['items'] and not pending:
+            text = "\n".join(page_texts).strip()
+            pending = self._extract_line_items_with_llama(text)
+        yield from release(pending, final=True)
+        
+        # Fix up items analyzed before the country of origin was settled
+        country_info = country_stream.finish()
+        for index, item, country in provisional_items:
+            if country == country_info['country']:
+                continue
+            result = self._streamed_item_result(item, country_info, classify=False)
+            result.update(index=index, provisional=False, revised=True)
+            yield result
+    
+    def _streamed_item_result(self, item, country_info, classify=True):
+        """
+        Analyze one streamed line item.
+        
+        Args:
+            item (dict): Line item
+            country_info (dict): Country detection result for the invoice
+            classify (bool): Look up a missing HTS code; False after batch classification
+            
+        Returns:
+            dict: The line item, its tariff analysis and the country detection result
+        """
+        return {
+            'item': item,
+            'tariff_analysis': self._analyze_line_item(item, country_info['country'], classify=classify),
+            'country_detection': country_info
+        }
+    
+    def _analyze_line_item(self, item, country_of_origin, classify=True):
+        """
+        Classify a line item if needed and analyze its tariffs.
+        
+        Args:
+            item (dict): Line item; gains an 'hts_code' key when one is found
+            country_of_origin (str): Country of origin for the item
+            classify (bool): Look up a missing HTS code; False when the item
+                already went through batch classification
+            
+        Returns:
+            Tariff analysis from the TariffMonitoringAgent
+        """
+        hts_code = item.get('hts_code')
+        
+        # If no HTS code is found, try to find one using the product description
+        if not hts_code and classify:
+            product_description = item.get('product', '')
+            if product_description:
+                hts_code = self._find_hts_code_for_product(product_description, country_of_origin)
+                if hts_code:
+                    item['hts_code'] = hts_code
+                    logger.info(f"Found HTS code {hts_code} for product: {product_description}")
+                else:
+                    logger.warning(f"No HTS code found for item: {product_description}")
+                    # Continue processing even without an HTS code
+                    # Use a placeholder HTS code for analysis
+                    hts_code = None  # Placeholder HTS code
+        
+        # Use the TariffMonitoringAgent to analyze tariffs for this item
+        # This will search USTR, USITC, and WTO for tariff information
+        return self.tariff_agent.analyze_tariffs(hts_code, country_of_origin)
+    
+    def _extract_line_items_from_layout(self, pages):
+        """
+        Extract line items from the word layout when the result is confident.
+        
+        Args:
+            pages (list): PageExtraction objects with word boxes
+            
+        Returns:
+            list: Line items, or an empty list if the layout confidence is
+                below LAYOUT_CONFIDENCE_THRESHOLD
+        """
+        line_items, confidence = self.invoice_parser.extract_line_items_from_layout(pages)
+        if not line_items:
+            return []
+        if confidence < LAYOUT_CONFIDENCE_THRESHOLD:
+            logger.info(f"Layout line items have low confidence ({confidence:.2f}), using Llama")
+            return []
+        logger.info(f"Using {len(line_items)} layout line items (confidence {confidence:.2f})")
+        return line_items
+    
+    def _extract_line_items_with_llama(self, text):
+        """
+        Extract line items from text using Llama model, streaming the completion.
+        
+        Generation is constrained to the line-item JSON schema. The completion
+        is fed to an incremental JSON array parser, and each line item is
+        validated and yielded as soon as its closing brace arrives, so callers
+        can classify and look up tariffs for it while the rest is still being
+        generated. If the request fails or the output holds no JSON array
+        before any item was yielded, the fallback extractor is used instead.
+        If it fails or is cut off after items were yielded, the items are kept
+        and _line_items_complete stays False.
+        
+        Args:
+            text (str or InvoiceText): Raw invoice text, or its shared tokenized text
+            
+        Yields:
+            dict: Line item with product, quantity, price, and HTS code
+        """
+        self._line_items_complete = False
         # Check if Llama client is available
         if self.llama_client is None:
             logger.warning("Llama client not available, using fallback method")
-            return self._extract_line_items_fallback(text)
-            
+            yield from self._extract_line_items_fallback(text)
+            self._line_items_complete = True
+            return
+        
+        stream = JsonArrayStream()
+        yielded = 0
+        invalid_items = 0
         try:
             # Prepare the prompt for Llama with specific instructions
             prompt = f"""
@@ -204,7 +506,7 @@ class TariffInvoiceIntegration:
             3. If you find multiple dollar amounts on a line, the larger one is likely the total price
             4. If you can't find a specific field, use null or 0 as appropriate
             
-            Return the items in a JSON array format, where each item has these fields:
+            Return a JSON object whose "line_items" array holds the items, where each item has these fields:
             - product: The product name/description
             - quantity: The quantity as a number
             - unit_price: The unit price as a number (without the $ symbol)
@@ -213,9 +515,9 @@ class TariffInvoiceIntegration:
             
             Here is the invoice text:
             
-            {text}
+            {str(text)}
             
-            Return ONLY the JSON array with no additional text or explanation.
+            Return ONLY the JSON object with no additional text or explanation.
             """
             
             # Call Llama to extract line items
@@ -230,88 +532,333 @@ class TariffInvoiceIntegration:
                         role="user",
                     ),
                 ],
-                model_id="llama3.2:3b",
-                stream=False,
+                response_format=LINE_ITEMS_FORMAT,
+                stream=True,
             )
             
-            # Extract the content from the completion_message
-            if hasattr(response, 'completion_message') and hasattr(response.completion_message, 'content'):
-                response_text = response.completion_message.content
-            else:
-                # If completion_message is not available, use fallback
-                return self._extract_line_items_fallback(text)
-            
-            # Clean up the response text
-            response_text = response_text.strip()
-            
-            # Parse the JSON array
-            try:
-                line_items = json.loads(response_text)
-                return line_items
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing JSON from Llama response: {str(e)}")
-                return self._extract_line_items_fallback(text)
+            # Parse and validate each line item as soon as it is complete
+            for chunk in response:
+                delta = getattr(getattr(chunk, 'event', None), 'delta', None)
+                if getattr(delta, 'type', None) != 'text':
+                    continue
+                for item in stream.feed(delta.text):
+                    item = validate_line_item(item)
+                    if item is None:
+                        invalid_items += 1
+                        continue
+                    yielded += 1
+                    yield item
+                if stream.closed:
+                    break
             
         except Exception as e:
             logger.error(f"Error extracting line items with Llama: {str(e)}", exc_info=True)
-            return self._extract_line_items_fallback(text)
+            if yielded:
+                # Items already handed downstream cannot be taken back
+                logger.warning(f"Llama stream failed after {yielded} line items")
+                return
+            yield from self._extract_line_items_fallback(text)
+            self._line_items_complete = True
+            return
+        
+        get_parse_stats().record("line_items", stream.closed, invalid_items=invalid_items + stream.errors)
+        if not stream.started and not yielded:
+            logger.error("No JSON array in Llama response, using fallback method")
+            yield from self._extract_line_items_fallback(text)
+            self._line_items_complete = True
+        elif not stream.closed:
+            logger.warning(f"Llama response ended inside the JSON array after {yielded} line items")
+        else:
+            self._line_items_complete = True
     
     def _extract_line_items_fallback(self, text):
         """
         Fallback method to extract line items if Llama fails.
         
         Args:
-            text (str): Raw invoice text
+            text (str or InvoiceText): Raw invoice text, or its shared tokenized text
             
         Returns:
             list: List of line items
         """
+        invoice_text = InvoiceText.of(text)
         line_items = []
         
-        # Look for HTS codes in the text
-        hts_pattern = r'([0-9]{4}\.[0-9]{2}(?:\.[0-9]{2})?)'
-        hts_codes = re.findall(hts_pattern, text)
-        
-        if hts_codes:
-            # If HTS codes found, try to associate them with products
-            for hts_code in hts_codes:
-                # Look for text around the HTS code
-                hts_context = re.search(r'([^\n]{0,100})' + re.escape(hts_code) + r'([^\n]{0,100})', text)
-                if hts_context:
-                    context = hts_context.group(1) + hts_context.group(2)
-                    
-                    # Try to extract product name
-                    product_match = re.search(r'([^\n]+?)\s*(?:hts|code|tariff)', context, re.IGNORECASE)
-                    product = product_match.group(1).strip() if product_match else "Unknown Product"
-                    
-                    # Look for numbers that might be quantities and prices
-                    numbers = re.findall(r'\$?\s*(\d+(?:\.\d+)?)', context)
-                    
-                    if len(numbers) >= 2:
-                        # Assume the first number is quantity and the second is price
-                        quantity = float(numbers[0])
-                        unit_price = float(numbers[1])
-                        total_price = quantity * unit_price
-                    else:
-                        # Default values if no numbers found
-                        quantity = 1.0
-                        unit_price = 0.0
-                        total_price = 0.0
-                    
-                    line_items.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'unit_price': unit_price,
-                        'total_price': total_price,
-                        'hts_code': hts_code
-                    })
+        # Use the first occurrence of each HTS code found in the text
+        first_spans = {}
+        for span in invoice_text.hts_codes:
+            first_spans.setdefault(span.value, span)
+        
+        # If HTS codes found, try to associate them with products
+        for span in invoice_text.hts_codes:
+            hts_code = span.value
+            first = first_spans[hts_code]
+            
+            # Look at up to 100 characters on either side of the code, within its line
+            line = invoice_text.line_index(first.start)
+            line_start = invoice_text.line_starts[line]
+            line_end = line_start + len(invoice_text.lines[line])
+            before_start = max(line_start, first.start - 100)
+            after_end = min(line_end, first.end + 100)
+            context = invoice_text.text[before_start:first.start] + invoice_text.text[first.end:after_end]
+            
+            # Try to extract product name
+            product_match = re.search(r'([^\n]+?)\s*(?:hts|code|tariff)', context, re.IGNORECASE)
+            product = product_match.group(1).strip() if product_match else "Unknown Product"
+            
+            # Look for numbers that might be quantities and prices
+            numbers = (invoice_text.numbers_between(before_start, first.start)
+                       + invoice_text.numbers_between(first.end, after_end))
+            
+            if len(numbers) >= 2:
+                # Assume the first number is quantity and the second is price
+                quantity = numbers[0].value
+                unit_price = numbers[1].value
+                total_price = quantity * unit_price
+            else:
+                # Default values if no numbers found
+                quantity = 1.0
+                unit_price = 0.0
+                total_price = 0.0
+            
+            line_items.append({
+                'product': product,
+                'quantity': quantity,
+                'unit_price': unit_price,
+                'total_price': total_price,
+                'hts_code': hts_code
+            })
         
         return line_items
     
+    def _classify_line_items(self, line_items, country_of_origin):
+        """
+        Fill in missing HTS codes of line items with batched classification.
+        
+        Args:
+            line_items (list): Line items; those without an HTS code gain
+                'hts_code' and 'hts_confidence' keys when a code is found
+            country_of_origin (str): Country of origin for the items
+        """
+        unclassified = [
+            item for item in line_items
+            if isinstance(item, dict) and not item.get('hts_code') and item.get('product')
+        ]
+        if not unclassified:
+            return
+        
+        descriptions = list(dict.fromkeys(item['product'] for item in unclassified))
+        codes = self._find_hts_codes_for_products(descriptions, country_of_origin)
+        for item in unclassified:
+            hts_code, confidence = codes.get(item['product'], (None, 0.0))
+            if hts_code:
+                item['hts_code'] = hts_code
+                item['hts_confidence'] = confidence
+                logger.info(f"Found HTS code {hts_code} for product: {item['product']}")
+            else:
+                logger.warning(f"No HTS code found for item: {item['product']}")
+    
+    def _previous_classification(self, product_description):
+        """
+        Look up the HTS code of the most similar product classified before.
+        
+        Args:
+            product_description (str): Description of the product
+            
+        Returns:
+            ProductMatch: Match at or above the similarity threshold, or None
+        """
+        if self.product_index is None:
+            return None
+        match = self.product_index.find(product_description)
+        if match is not None:
+            logger.info(f"Reusing HTS code {match.hts_code} of '{match.description}' "
+                        f"(similarity {match.similarity:.2f}) for product: {product_description}")
+        return match
+    
+    def _remember_classification(self, product_description, hts_code):
+        """Index a newly found HTS code so similar descriptions can reuse it."""
+        if self.product_index is not None and hts_code:
+            self.product_index.add(product_description, hts_code)
+    
+    def _hts_candidates(self, product_description):
+        """
+        Retrieve candidate HTS codes for a product from the local schedule index.
+        
+        Args:
+            product_description (str): Description of the product
+            
+        Returns:
+            list: HtsCandidate objects, best first; empty without an index
+        """
+        if self.hts_index is None:
+            return []
+        return self.hts_index.search(product_description)
+    
+    def _chunk_descriptions(self, descriptions, candidates=None):
+        """
+        Split product descriptions into batches that fit the prompt budget.
+        
+        Args:
+            descriptions (list): Product descriptions
+            candidates (dict, optional): Description to its listed candidate codes
+            
+        Returns:
+            list: Lists of descriptions, in order
+        """
+        candidates = candidates or {}
+        base_tokens = len(_HTS_BATCH_SYSTEM_PROMPT) // _CHARS_PER_TOKEN + 100
+        chunks = []
+        chunk = []
+        tokens = base_tokens
+        for description in descriptions:
+            listed = "".join(_candidate_line(candidate) for candidate in candidates.get(description, []))
+            cost = (len(description) + len(listed)) // _CHARS_PER_TOKEN + _ANSWER_TOKENS_PER_ITEM
+            if chunk and (tokens + cost > HTS_BATCH_TOKEN_BUDGET or len(chunk) >= HTS_BATCH_MAX_ITEMS):
+                chunks.append(chunk)
+                chunk = []
+                tokens = base_tokens
+            chunk.append(description)
+            tokens += cost
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+    
+    def _find_hts_codes_for_products(self, descriptions, country_of_origin):
+        """
+        Find HTS codes for many product descriptions with one request per chunk.
+        
+        Products similar to ones classified before reuse their codes, and
+        products whose schedule match is decisive are resolved without the
+        LLM; the rest are sent with their candidate codes for the LLM to
+        choose from. Chunks are sent concurrently, within the LLM client's
+        concurrency limit.
+        
+        Args:
+            descriptions (list): Distinct product descriptions
+            country_of_origin (str): Country of origin for the products
+            
+        Returns:
+            dict: Description to (HTS code or None, confidence)
+        """
+        reused = {}
+        codes = {}
+        candidates = {}
+        for description in descriptions:
+            match = self._previous_classification(description)
+            if match is not None:
+                reused[description] = (match.hts_code, match.similarity)
+                continue
+            retrieved = self._hts_candidates(description)
+            if self.hts_index is not None and self.hts_index.is_decisive(retrieved):
+                codes[description] = (retrieved[0].code, _DECISIVE_CONFIDENCE)
+            elif retrieved:
+                candidates[description] = retrieved
+        
+        remaining = [
+            description for description in descriptions if description not in codes and description not in reused
+        ]
+        if self.llama_client is None or not remaining:
+            for description, (hts_code, _) in codes.items():
+                self._remember_classification(description, hts_code)
+            codes.update(reused)
+            return codes
+        
+        chunks = self._chunk_descriptions(remaining, candidates)
+        if len(chunks) == 1:
+            results = [self._classify_chunk(chunks[0], country_of_origin, candidates)]
+        else:
+            with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="hts-batch") as executor:
+                results = list(executor.map(
+                    lambda chunk: self._classify_chunk(chunk, country_of_origin, candidates), chunks
+                ))
+        
+        for result in results:
+            codes.update(result)
+        for description, (hts_code, _) in codes.items():
+            self._remember_classification(description, hts_code)
+        logger.info(
+            f"Classified {len(descriptions)} products: {len(reused)} reused, "
+            f"{len(descriptions) - len(reused) - len(remaining)} from the schedule index, "
+            f"{len(remaining)} in {len(chunks)} HTS requests"
+        )
+        codes.update(reused)
+        return codes
+    
+    def _classify_chunk(self, descriptions, country_of_origin, candidates=None):
+        """
+        Classify one batch of product descriptions in a single structured request.
+        
+        Args:
+            descriptions (list): Product descriptions
+            country_of_origin (str): Country of origin for the products
+            candidates (dict, optional): Description to candidate codes; a
+                description with candidates may only be given one of them
+            
+        Returns:
+            dict: Description to (HTS code or None, confidence)
+        """
+        candidates = candidates or {}
+        numbered = "\n".join(
+            f"{index}. {description}" + "".join(_candidate_line(candidate) for candidate in candidates.get(description, []))
+            for index, description in enumerate(descriptions)
+        )
+        prompt = f"""
+            Determine the most likely HTS code for each numbered product description below.
+            Consider the country of origin ({country_of_origin}) as this may affect the classification.
+            
+            {numbered}
+            
+            IMPORTANT INSTRUCTIONS:
+            1. Return one classification per description, with its number as "index"
+            2. Where candidate codes are listed under a description, "hts_code" must be one of them
+            3. Otherwise give "hts_code" in the format XXXX.XX.XX (e.g., 8542.31.0000)
+            4. Give null for "hts_code" if you are not confident, and "confidence" between 0 and 1
+            5. Do not make up or guess HTS codes - accuracy is critical
+            """
+        try:
+            response = self.llama_client.inference.chat_completion(
+                messages=[
+                    SystemMessage(content=_HTS_BATCH_SYSTEM_PROMPT, role="system"),
+                    UserMessage(content=prompt, role="user"),
+                ],
+                response_format=HTS_BATCH_FORMAT,
+                stream=False,
+                cache=True,
+            )
+            parsed = parse_response(HtsClassificationBatch, response.completion_message.content, "hts_batch")
+        except Exception as e:
+            logger.error(f"Error classifying {len(descriptions)} products: {str(e)}", exc_info=True)
+            return {}
+        if parsed is None:
+            return {}
+        
+        codes = {}
+        for classification in parsed.classifications:
+            if not 0 <= classification.index < len(descriptions):
+                continue
+            description = descriptions[classification.index]
+            hts_code = normalize_hts_code((classification.hts_code or "").strip())
+            allowed = {candidate.code for candidate in candidates.get(description, [])}
+            if (
+                hts_code is None
+                or classification.confidence < HTS_MIN_CONFIDENCE
+                or (allowed and hts_code not in allowed)
+            ):
+                hts_code = None
+            codes[description] = (hts_code, classification.confidence)
+        return codes
+    
     def _find_hts_code_for_product(self, product_description, country_of_origin):
         """
         Find the most likely HTS code for a product based on its description.
         
+        The code of a sufficiently similar product classified before is
+        reused. Otherwise the local schedule index is searched: a decisive
+        match is used as is, and else the LLM picks among the retrieved
+        candidates. Without an index or any candidates the LLM is asked for a
+        code outright. New codes are remembered for similar products.
+        
         Args:
             product_description (str): Description of the product
             country_of_origin (str): Country of origin for the product
@@ -319,9 +866,33 @@ class TariffInvoiceIntegration:
         Returns:
             str: The most likely HTS code, or None if no match is found
         """
+        match = self._previous_classification(product_description)
+        if match is not None:
+            return match.hts_code
+        
+        candidates = self._hts_candidates(product_description)
+        if candidates and self.hts_index.is_decisive(candidates):
+            logger.info(f"Found HTS code {candidates[0].code} in the schedule index for product: {product_description}")
+            self._remember_classification(product_description, candidates[0].code)
+            return candidates[0].code
+        if self.llama_client is None:
+            return None
+        
         try:
-            # Prepare a prompt for the Llama model to find the HTS code
-            prompt = f"""
+            if candidates:
+                # Short prompt: the LLM only chooses among the retrieved codes
+                listed = "".join(_candidate_line(candidate) for candidate in candidates)
+                prompt = f"""
+            Which HTS code below best fits this product from {country_of_origin}?
+            
+            Product Description: {product_description}
+            Candidates:{listed}
+            
+            Return ONLY one of the candidate codes, or "unknown" if none fits.
+            """
+            else:
+                # Prepare a prompt for the Llama model to find the HTS code
+                prompt = f"""
             You are an expert at identifying Harmonized Tariff Schedule (HTS) codes for products.
             
             Please analyze the following product description and determine the most likely HTS code.
@@ -342,7 +913,7 @@ class TariffInvoiceIntegration:
             response = self.llama_client.inference.chat_completion(
                 messages=[
                     SystemMessage(
-                        content="You are an expert at identifying HTS codes for products based on their descriptions. Only return valid HTS codes or 'unknown' if you're not confident.",
+                        content=_HTS_SYSTEM_PROMPT,
                         role="system",
                     ),
                     UserMessage(
@@ -350,8 +921,8 @@ class TariffInvoiceIntegration:
                         role="user",
                     ),
                 ],
-                model_id="llama3.2:3b",
                 stream=False,
+                cache=True,
             )
             
             # Extract the content from the completion_message
@@ -367,21 +938,28 @@ class TariffInvoiceIntegration:
                 return None
             
             # Check if the response is a valid HTS code
-            hts_pattern = r'([0-9]{4}\.[0-9]{2}(?:\.[0-9]{2})?)'
-            match = re.search(hts_pattern, response_text)
+            hts_code = normalize_hts_code(response_text)
             
-            if match:
-                hts_code = match.group(1)
-                logger.info(f"Found HTS code {hts_code} for product: {product_description}")
-                return hts_code
-            else:
+            if hts_code is None:
                 logger.warning(f"Llama model returned invalid HTS code format: {response_text}")
                 return None
+            
+            if candidates and hts_code not in {candidate.code for candidate in candidates}:
+                logger.warning(f"Llama model chose {hts_code}, which is not a candidate for product: {product_description}")
+                return None
+            logger.info(f"Found HTS code {hts_code} for product: {product_description}")
+            self._remember_classification(product_description, hts_code)
+            return hts_code
                 
         except Exception as e:
             logger.error(f"Error finding HTS code for product: {str(e)}", exc_info=True)
             return None
 
+
+def _candidate_line(candidate):
+    """Prompt line listing one candidate HTS code under a product description."""
+    return f"\n   - {candidate.code}: {candidate.article.label}"
+
 # Example usage
 if __name__ == "__main__":
     # Test with a sample invoice
@@ -0,0 +1,492 @@
+import bisect
+import re
+from backend.pdf_processing.text_quality import TextQuality
+
+# Cells that hold a number or an amount rather than a label
+_NUMERIC_CELL = re.compile(r'^[\s$€£¥(+-]*\d[\d,.\s]*%?\)?$')
+
+# Lines closer than this many line heights belong to the same text block
+BLOCK_GAP_RATIO = 1.0
+
+# Words closer than this many line heights belong to the same header label
+HEADER_WORD_GAP_RATIO = 0.5
+
+# Summary rows below a layout table, whose amount is the invoice total
+_SUMMARY_ROW = re.compile(r'\b(sub\s*total|total|amount\s*due|balance\s*due)\b', re.IGNORECASE)
+
+# A quantity or amount, negative when written in parentheses
+_AMOUNT = re.compile(r'(\()?\s*[$€£¥]?\s*(-?\d[\d,]*(?:\.\d+)?)')
+
+
+def parse_amount(value):
+    """
+    Parse a quantity or currency amount from a table cell.
+
+    Args:
+        value (str): Cell text such as "$2,500.00", "(12.50)" or "100 pcs"
+
+    Returns:
+        float: Parsed number, or None if the cell holds no number
+    """
+    match = _AMOUNT.search(value or "")
+    if not match:
+        return None
+
+    number = float(match.group(2).replace(',', ''))
+    return -number if match.group(1) else number
+
+
+class TextBlock:
+    """
+    A run of consecutive text lines on a page.
+    """
+
+    def __init__(self, text, bbox=None):
+        """
+        Args:
+            text (str): Text of the block, one line per row
+            bbox (tuple, optional): (x0, top, x1, bottom) in PDF points
+        """
+        self.text = text
+        self.bbox = bbox
+
+    def to_dict(self):
+        """JSON-serializable form of the block."""
+        return {"text": self.text, "bbox": self.bbox}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a block from to_dict output."""
+        return cls(data["text"], tuple(data["bbox"]) if data.get("bbox") else None)
+
+
+class Table:
+    """
+    A table as rows of cells, with its header row detected.
+    """
+
+    def __init__(self, rows, bbox=None):
+        """
+        Args:
+            rows (list): Rows of cells; a cell is a string or None
+            bbox (tuple, optional): (x0, top, x1, bottom) in PDF points
+        """
+        self.rows = rows
+        self.bbox = bbox
+        self.header = self._detect_header(rows)
+
+    @staticmethod
+    def _detect_header(rows):
+        """
+        Detect the header row of a table.
+
+        The first row is a header when at least half of its cells are filled and
+        none of the filled cells is a number or an amount.
+
+        Args:
+            rows (list): Rows of cells
+
+        Returns:
+            list: Header labels, or None if the table has no header row
+        """
+        if not rows:
+            return None
+
+        cells = [cell.strip() if cell else "" for cell in rows[0]]
+        filled = [cell for cell in cells if cell]
+        if not filled or len(filled) * 2 < len(cells):
+            return None
+        if any(_NUMERIC_CELL.match(cell) for cell in filled):
+            return None
+        if not any(re.search(r'[A-Za-z]', cell) for cell in filled):
+            return None
+
+        return [" ".join(cell.split()) for cell in cells]
+
+    @property
+    def body_rows(self):
+        """Rows below the header, or every row if there is no header."""
+        return self.rows[1:] if self.header else self.rows
+
+    def records(self):
+        """
+        Body rows as dictionaries keyed by header label.
+
+        Returns:
+            list: One dict per body row, or an empty list if there is no header
+        """
+        if not self.header:
+            return []
+        return [
+            {label: cell for label, cell in zip(self.header, row) if label}
+            for row in self.body_rows
+        ]
+
+    def to_dict(self):
+        """JSON-serializable form of the table."""
+        return {"rows": self.rows, "header": self.header, "bbox": self.bbox}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a table from to_dict output."""
+        return cls(data["rows"], tuple(data["bbox"]) if data.get("bbox") else None)
+
+
+class PageExtraction:
+    """
+    Text blocks, tables and timings extracted from a single PDF page.
+    """
+
+    def __init__(self, page_number, text, tables=None, timings=None, text_blocks=None, text_quality=None,
+                 image_regions=None, page_size=None, words=None):
+        """
+        Args:
+            page_number (int): Zero-based page index
+            text (str): Text layer of the page
+            tables (list, optional): Table objects found on the page
+            timings (dict, optional): Seconds spent per extraction step
+            text_blocks (list, optional): TextBlock objects in reading order
+            text_quality (TextQuality, optional): Usability of the text layer
+            image_regions (list, optional): (x0, top, x1, bottom) boxes of images on the page
+            page_size (tuple, optional): (width, height) in PDF points
+            words (list, optional): (text, x0, top, x1, bottom) for every word on the page
+        """
+        self.page_number = page_number
+        self.text = text or ""
+        self.tables = tables or []
+        self.timings = timings or {}
+        self.text_blocks = text_blocks or []
+        self.text_quality = text_quality
+        self.image_regions = image_regions or []
+        self.page_size = page_size
+        self.words = words or []
+
+    def flattened_text(self, region_texts=None):
+        """
+        Page text followed by every table flattened to one line per row.
+        
+        Args:
+            region_texts (list, optional): (bbox, text) pairs recognized from image
+                regions, merged into the page text at their layout position
+
+        Returns:
+            str: Page text in the format historically returned by extract_text_from_pdf
+        """
+        page_text = self._text_with_regions(region_texts) if region_texts else self.text
+        for table in self.tables:
+            # Convert table to text format
+            table_text = ""
+            for row in table.rows:
+                # Filter out None values and join with spaces
+                row_text = " ".join([str(cell) if cell is not None else "" for cell in row])
+                table_text += row_text + "\n"
+
+            # Add table text to the page text
+            page_text += "\n" + table_text
+        return page_text
+
+    def _text_with_regions(self, region_texts):
+        """
+        Interleave text blocks and OCR'd image regions by their vertical position.
+
+        Args:
+            region_texts (list): (bbox, text) pairs
+
+        Returns:
+            str: Page text with the region text inserted
+        """
+        region_texts = [(bbox, text.strip()) for bbox, text in region_texts if text and text.strip()]
+        if not region_texts:
+            return self.text
+
+        positioned_blocks = [block for block in self.text_blocks if block.bbox]
+        if not positioned_blocks:
+            # Without block positions the best we can do is append
+            return "\n".join([self.text] + [text for _, text in region_texts]).strip()
+
+        pieces = [(block.bbox[1], block.bbox[0], block.text) for block in positioned_blocks]
+        pieces += [(bbox[1], bbox[0], text) for bbox, text in region_texts]
+        pieces.sort(key=lambda piece: (piece[0], piece[1]))
+        return "\n".join(text for _, _, text in pieces)
+
+    def to_dict(self):
+        """JSON-serializable form of the page."""
+        return {
+            "page_number": self.page_number,
+            "text": self.text,
+            "text_blocks": [block.to_dict() for block in self.text_blocks],
+            "tables": [table.to_dict() for table in self.tables],
+            "timings": self.timings,
+            "text_quality": self.text_quality.to_dict() if self.text_quality else None,
+            "image_regions": self.image_regions,
+            "page_size": self.page_size,
+            "words": self.words,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a page from to_dict output."""
+        return cls(
+            data["page_number"],
+            data["text"],
+            tables=[Table.from_dict(table) for table in data["tables"]],
+            timings=data.get("timings"),
+            text_blocks=[TextBlock.from_dict(block) for block in data["text_blocks"]],
+            text_quality=TextQuality.from_dict(data["text_quality"]) if data.get("text_quality") else None,
+            image_regions=[tuple(region) for region in data.get("image_regions", [])],
+            page_size=tuple(data["page_size"]) if data.get("page_size") else None,
+            words=[tuple(word) for word in data.get("words", [])],
+        )
+
+
+class ExtractedDocument:
+    """
+    Structured extraction result for a whole PDF: pages with text blocks and tables.
+    """
+
+    def __init__(self, pages, from_cache=False):
+        """
+        Args:
+            pages (list): PageExtraction for each page, in page order
+            from_cache (bool): Whether the result was served from the extraction cache
+        """
+        self.pages = pages
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        """Document text with tables flattened, as returned by extract_text_from_pdf."""
+        return "".join(page.flattened_text() + "\n" for page in self.pages).strip()
+
+    @property
+    def pages_needing_ocr(self):
+        """Zero-based indexes of pages whose text layer is missing or garbage."""
+        return [page.page_number for page in self.pages if page.text_quality and page.text_quality.needs_ocr]
+
+    @property
+    def tables(self):
+        """Every table in the document, in page order."""
+        return [table for page in self.pages for table in page.tables]
+
+    def to_dict(self):
+        """JSON-serializable form of the document."""
+        return {"pages": [page.to_dict() for page in self.pages]}
+
+    @classmethod
+    def from_dict(cls, data, from_cache=False):
+        """Rebuild a document from to_dict output."""
+        return cls([PageExtraction.from_dict(page) for page in data["pages"]], from_cache=from_cache)
+
+
+def group_text_blocks(text_lines):
+    """
+    Group pdfplumber text lines into blocks separated by vertical gaps.
+
+    Args:
+        text_lines (list): Dicts with 'text', 'x0', 'top', 'x1' and 'bottom'
+
+    Returns:
+        list: TextBlock for each group of consecutive lines
+    """
+    blocks = []
+    current = []
+
+    def close_block():
+        if current:
+            bbox = (
+                min(line['x0'] for line in current),
+                current[0]['top'],
+                max(line['x1'] for line in current),
+                current[-1]['bottom'],
+            )
+            blocks.append(TextBlock("\n".join(line['text'] for line in current), bbox))
+
+    for line in text_lines:
+        if current:
+            previous = current[-1]
+            line_height = previous['bottom'] - previous['top']
+            if line['top'] - previous['bottom'] > line_height * BLOCK_GAP_RATIO:
+                close_block()
+                current = []
+        current.append(line)
+    close_block()
+
+    return blocks
+
+
+class LayoutTable(Table):
+    """
+    A table rebuilt from word positions on a page without ruling lines.
+
+    The first row holds the header labels and the body rows follow; summary
+    rows such as "Total Amount: $2,850.00" found below the body are kept apart.
+    """
+
+    def __init__(self, rows, bbox=None, summary_rows=None):
+        """
+        Args:
+            rows (list): Header row followed by the body rows
+            bbox (tuple, optional): (x0, top, x1, bottom) in PDF points
+            summary_rows (list, optional): Text of the total rows below the table
+        """
+        super().__init__(rows, bbox)
+        self.summary_rows = summary_rows or []
+
+
+def group_word_rows(words):
+    """
+    Group words into visual rows by vertical overlap.
+
+    Args:
+        words (list): (text, x0, top, x1, bottom) tuples
+
+    Returns:
+        list: Rows in top-to-bottom order, each a list of words sorted left to right
+    """
+    rows = []
+    current = []
+    current_bottom = None
+    for word in sorted(words, key=lambda word: (word[2], word[1])):
+        middle = (word[2] + word[4]) / 2
+        if current and middle > current_bottom:
+            rows.append(sorted(current, key=lambda word: word[1]))
+            current = []
+        if not current:
+            current_bottom = word[4]
+        current.append(word)
+    if current:
+        rows.append(sorted(current, key=lambda word: word[1]))
+    return rows
+
+
+def row_cells(row, boundaries):
+    """
+    Split a row's words into cells at column boundaries.
+
+    Args:
+        row (list): Words of the row, left to right
+        boundaries (list): x positions separating neighbouring columns
+
+    Returns:
+        list: Cell text for each column, or None for an empty cell
+    """
+    cells = [[] for _ in range(len(boundaries) + 1)]
+    for word in row:
+        center = (word[1] + word[3]) / 2
+        cells[bisect.bisect_right(boundaries, center)].append(word[0])
+    return [" ".join(cell) if cell else None for cell in cells]
+
+
+def column_boundaries(labels):
+    """
+    Column boundaries halfway between neighbouring header labels.
+
+    Args:
+        labels (list): (label, x0, x1) from header_labels
+
+    Returns:
+        list: x positions separating neighbouring columns
+    """
+    return [(left[2] + right[1]) / 2 for left, right in zip(labels, labels[1:])]
+
+
+def header_labels(row):
+    """
+    Merge the words of a candidate header row into labels.
+
+    Args:
+        row (list): Words of the row, left to right
+
+    Returns:
+        list: (label, x0, x1) for each group of adjacent words
+    """
+    height = max(word[4] - word[2] for word in row)
+    labels = []
+    for text, x0, _, x1, _ in row:
+        if labels and x0 - labels[-1][2] <= height * HEADER_WORD_GAP_RATIO:
+            label, label_x0, _ = labels[-1]
+            labels[-1] = (f"{label} {text}", label_x0, x1)
+        else:
+            labels.append((text, x0, x1))
+    return labels
+
+
+def find_layout_tables(words, map_columns):
+    """
+    Rebuild line-item tables from word positions.
+
+    A header is the first row whose labels map to a product column and at
+    least one quantity or price column. Column boundaries lie halfway between
+    neighbouring header labels, and every word below goes to the column that
+    holds its center. A row with text only in the product column continues
+    the description of the row above. The table ends at a vertical gap wider
+    than the header-to-first-row distance or at a summary row; the summary
+    rows below it on the page are kept for checking the total.
+
+    Args:
+        words (list): (text, x0, top, x1, bottom) tuples for one page
+        map_columns (callable): Maps a list of header labels to a dict of
+            field name to column index
+
+    Returns:
+        list: LayoutTable objects in page order
+    """
+    rows = group_word_rows(words)
+    tables = []
+    index = 0
+    while index < len(rows):
+        row = rows[index]
+        header_index = index
+        index += 1
+        if any(_NUMERIC_CELL.match(word[0]) for word in row):
+            continue
+        labels = header_labels(row)
+        if len(labels) < 2:
+            continue
+        columns = map_columns([label for label, _, _ in labels])
+        if 'product' not in columns or not any(role in columns for role in ('quantity', 'unit_price', 'total_price')):
+            continue
+
+        boundaries = column_boundaries(labels)
+        product_column = columns['product']
+        numeric_columns = [columns[role] for role in ('quantity', 'unit_price', 'total_price') if role in columns]
+        header_top = row[0][2]
+        previous_bottom = max(word[4] for word in row)
+        pitch = None
+        body = []
+        summary_rows = []
+        while index < len(rows):
+            body_row = rows[index]
+            top = min(word[2] for word in body_row)
+            text = " ".join(word[0] for word in body_row)
+            if _SUMMARY_ROW.search(text):
+                break
+            if pitch is None:
+                pitch = top - header_top
+            elif top - previous_bottom > pitch:
+                break
+
+            cells = row_cells(body_row, boundaries)
+            if body and cells[product_column] and not any(cells[column] for column in numeric_columns) \
+                    and sum(1 for cell in cells if cell) == 1:
+                # Wrapped description
+                body[-1][product_column] = f"{body[-1][product_column] or ''} {cells[product_column]}".strip()
+            else:
+                body.append(cells)
+            previous_bottom = max(word[4] for word in body_row)
+            index += 1
+
+        if body:
+            for summary_row in rows[index:]:
+                text = " ".join(word[0] for word in summary_row)
+                if _SUMMARY_ROW.search(text):
+                    summary_rows.append(text)
+            table_words = [word for table_row in rows[header_index:index] for word in table_row]
+            bbox = (
+                min(word[1] for word in table_words),
+                header_top,
+                max(word[3] for word in table_words),
+                max(word[4] for word in table_words),
+            )
+            tables.append(LayoutTable([[label for label, _, _ in labels]] + body, bbox, summary_rows))
+    return tables
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+# Default location and size of the on-disk cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "extraction")
+DEFAULT_MAX_MB = 512
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+class ExtractionCache:
+    """
+    Persistent, size-bounded cache of PDF extraction results keyed by content hash.
+
+    Each entry is a JSON file named after the SHA-256 of the PDF bytes and a
+    namespace that identifies what was stored (e.g. the extracted document for a
+    given extractor version, or the OCR text). Entries are evicted least recently
+    used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        Args:
+            cache_dir (str, optional): Directory holding cache entries
+            max_bytes (int, optional): Size limit for all entries together
+        """
+        self.cache_dir = cache_dir or os.getenv("EXTRACTION_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("EXTRACTION_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def digest(data):
+        """
+        Content hash used as the cache key for a PDF.
+
+        Args:
+            data (bytes): Raw PDF bytes
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, digest, namespace):
+        """Path of the entry for a digest and namespace."""
+        return os.path.join(self.cache_dir, f"{digest}-{namespace}.json")
+
+    def _entries(self):
+        """
+        List cache entries with their size and last access time.
+
+        Returns:
+            list: (path, size, mtime) tuples
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, digest, namespace):
+        """
+        Look up a cached value.
+
+        Args:
+            digest (str): Content hash of the PDF
+            namespace (str): What was stored for it
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        path = self._path(digest, namespace)
+        try:
+            with open(path, 'r') as f:
+                value = json.load(f)
+            # Mark the entry as recently used
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, digest, namespace, value):
+        """
+        Store a value, evicting least recently used entries if the cache is full.
+
+        Args:
+            digest (str): Content hash of the PDF
+            namespace (str): What is being stored for it
+            value: JSON-serializable value
+        """
+        path = self._path(digest, namespace)
+        payload = json.dumps(value)
+
+        try:
+            previous_size = os.path.getsize(path)
+        except FileNotFoundError:
+            previous_size = 0
+
+        # Write to a temporary file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(payload)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        with self._lock:
+            self._size += os.path.getsize(path) - previous_size
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+
+        Args:
+            keep (str, optional): Entry that must not be evicted
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+            logging.debug(f"Evicted extraction cache entry {os.path.basename(path)}")
+
+    def clear(self):
+        """
+        Remove every cache entry.
+        """
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+    def stats(self):
+        """
+        Cache counters.
+
+        Returns:
+            dict: hits, misses, evictions, hit_rate, size_bytes and max_bytes
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def get_extraction_cache():
+    """
+    Get the process-wide extraction cache, creating it on first use.
+
+    Set EXTRACTION_CACHE_DISABLED=1 to turn caching off.
+
+    Returns:
+        ExtractionCache: Shared cache, or None when caching is disabled
+    """
+    global _default_cache
+    if os.getenv("EXTRACTION_CACHE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = ExtractionCache()
+            except OSError as e:
+                logging.warning(f"Extraction cache unavailable: {str(e)}")
+                return None
+        return _default_cache
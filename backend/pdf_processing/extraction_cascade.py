@@ -0,0 +1,179 @@
+import os
+import threading
+
+# Extraction stages, cheapest first
+CASCADE_STAGES = ("template", "tables", "layout", "patterns", "ocr", "llm_small", "llm_large")
+
+# Stages to run, in order; a comma-separated subset of CASCADE_STAGES
+DEFAULT_CASCADE = ",".join(CASCADE_STAGES)
+
+# A stage whose result scores at least this much ends the cascade
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+
+# Relative tolerance when checking quantity x unit price and item sums against amounts
+AMOUNT_TOLERANCE = 0.01
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def configured_stages():
+    """
+    Stages named by INVOICE_CASCADE, in order.
+
+    Returns:
+        list: Stage names; unknown names are dropped
+    """
+    names = [name.strip() for name in os.getenv("INVOICE_CASCADE", DEFAULT_CASCADE).split(",")]
+    return [name for name in names if name in CASCADE_STAGES]
+
+
+def amounts_match(expected, actual):
+    """
+    Whether two amounts agree within AMOUNT_TOLERANCE.
+
+    Args:
+        expected (float): Computed amount
+        actual (float): Stated amount
+
+    Returns:
+        bool: True if they agree
+    """
+    return abs(expected - actual) <= AMOUNT_TOLERANCE * max(abs(expected), abs(actual), 1.0)
+
+
+def _as_float(value):
+    """Number from a parsed field, which LLM output may hold as a string."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').replace('$', '').strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def score_invoice(result):
+    """
+    Confidence in a parsed invoice from its arithmetic consistency.
+
+    Items whose quantity, unit price and total are all known should satisfy
+    quantity x unit price = total (three fifths of the score), and the item
+    totals should add up to the invoice total (two fifths). A check with
+    nothing to compare counts half; an invoice without line items scores 0.
+
+    Args:
+        result (dict): Structured invoice data
+
+    Returns:
+        float: Confidence between 0 and 1
+    """
+    line_items = result.get("line_items") or []
+    if not line_items:
+        return 0.0
+
+    consistent = checked = 0
+    items_total = 0.0
+    for item in line_items:
+        if not isinstance(item, dict):
+            return 0.0
+        quantity = _as_float(item.get("quantity"))
+        unit_price = _as_float(item.get("unit_price"))
+        total_price = _as_float(item.get("total_price"))
+        if quantity and unit_price and total_price is not None:
+            checked += 1
+            if amounts_match(quantity * unit_price, total_price):
+                consistent += 1
+        items_total += total_price or 0.0
+
+    arithmetic = consistent / checked if checked else 0.5
+    total_amount = _as_float(result.get("total_amount"))
+    if total_amount:
+        total_match = 1.0 if amounts_match(items_total, total_amount) else 0.0
+    else:
+        total_match = 0.5
+    return 0.6 * arithmetic + 0.4 * total_match
+
+
+class CascadeStats:
+    """
+    Per-stage counters for the extraction cascade, for tuning thresholds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self.invoices = 0
+        self.below_threshold = 0
+
+    def record_stage(self, stage, seconds, hit):
+        """
+        Record one run of a stage.
+
+        Args:
+            stage (str): Stage name
+            seconds (float): Time the stage took
+            hit (bool): Whether its result cleared the threshold
+        """
+        with self._lock:
+            counters = self._stages.setdefault(stage, {"runs": 0, "hits": 0, "seconds": 0.0})
+            counters["runs"] += 1
+            counters["hits"] += int(hit)
+            counters["seconds"] += seconds
+
+    def record_invoice(self, resolved):
+        """
+        Record one invoice that went through the cascade.
+
+        Args:
+            resolved (bool): Whether any stage cleared the threshold
+        """
+        with self._lock:
+            self.invoices += 1
+            self.below_threshold += int(not resolved)
+
+    def stats(self):
+        """
+        Cascade counters.
+
+        Returns:
+            dict: invoices, below_threshold, and for each stage its runs, hits,
+                hit_rate and mean_seconds
+        """
+        with self._lock:
+            return {
+                "invoices": self.invoices,
+                "below_threshold": self.below_threshold,
+                "stages": {
+                    stage: {
+                        "runs": counters["runs"],
+                        "hits": counters["hits"],
+                        "hit_rate": counters["hits"] / counters["runs"],
+                        "mean_seconds": counters["seconds"] / counters["runs"],
+                    }
+                    for stage, counters in self._stages.items()
+                },
+            }
+
+
+def get_cascade_stats():
+    """
+    Get the process-wide cascade counters.
+
+    Returns:
+        CascadeStats: Shared counters
+    """
+    global _stats
+    with _stats_lock:
+        if _stats is None:
+            _stats = CascadeStats()
+        return _stats
+
+
+def cascade_stats():
+    """
+    Counters of the process-wide extraction cascade.
+
+    Returns:
+        dict: CascadeStats.stats()
+    """
+    return get_cascade_stats().stats()
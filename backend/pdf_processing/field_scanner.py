@@ -0,0 +1,320 @@
+import heapq
+import re
+from backend.agents.country_gazetteer import DEFAULT_KINDS, KIND_ALIAS, KIND_NAME
+from backend.pdf_processing.invoice_text import InvoiceText
+
+# Field patterns, in priority order; the first pattern that matches a line wins
+VENDOR_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'vendor\s*:?\s*([^\n]+)',
+    r'supplier\s*:?\s*([^\n]+)',
+    r'from\s*:?\s*([^\n]+)',
+    r'bill\s*to\s*:?\s*([^\n]+)',
+    r'sold\s*by\s*:?\s*([^\n]+)',
+    r'company\s*:?\s*([^\n]+)',
+    r'business\s*:?\s*([^\n]+)',
+)]
+
+ORIGIN_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'country\s*of\s*origin\s*:?\s*([^\n]+)',
+    r'origin\s*:?\s*([^\n]+)',
+    r'made\s*in\s*:?\s*([^\n]+)',
+    r'manufactured\s*in\s*:?\s*([^\n]+)',
+    r'produced\s*in\s*:?\s*([^\n]+)',
+)]
+
+# Totals may carry thousands separators ("$2,850.00")
+TOTAL_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'total\s*amount\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)',
+    r'total\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)',
+    r'amount\s*due\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)',
+    r'balance\s*due\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)',
+    r'grand\s*total\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)',
+)]
+
+# Gazetteer terms accepted as a country of origin when no origin label is present.
+# Mentions are read from the same gazetteer pass as CountryDetector's and
+# filtered down to these kinds; ambiguous terms (Georgia, Jordan, Chad, ...)
+# are only accepted on a line with an origin label.
+COUNTRY_KINDS = (KIND_NAME, KIND_ALIAS)
+
+# Keywords that every pattern of a field contains
+_FIELD_KEYWORDS = {
+    "vendor": ("vendor", "supplier", "from", "bill to", "sold by", "company", "business"),
+    "origin": ("origin", "made in", "manufactured in", "produced in"),
+    "total": ("total", "amount due", "balance due"),
+}
+
+# Field for each lowercased keyword, with whitespace removed
+_KEYWORD_FIELD = {keyword.replace(" ", ""): field for field, keywords in _FIELD_KEYWORDS.items() for keyword in keywords}
+
+# Every keyword in one alternation, matched against the lowercased document.
+# The lookahead reports overlapping keywords, and whitespace excludes newlines
+# so a match never spans lines. Lines without a keyword are skipped by every
+# field handler.
+_KEYWORD_SCANNER = re.compile(
+    r'(?=(' + '|'.join(
+        r'[^\S\n]*'.join(keyword.split()) for keywords in _FIELD_KEYWORDS.values() for keyword in keywords
+    ) + r'))'
+)
+_WHITESPACE = re.compile(r'\s+')
+
+# Line item section patterns, checked in this order
+_ITEM_START = re.compile(r'^\d+\.')
+_ITEM_HTS = re.compile(r'hts\s*code\s*:?\s*([0-9\.]+)', re.IGNORECASE)
+# Amounts may carry thousands separators, like the totals
+_ITEM_QUANTITY = re.compile(r'quantity\s*:?\s*(\d[\d,]*(?:\.\d+)?)', re.IGNORECASE)
+_ITEM_UNIT_PRICE = re.compile(r'unit\s*price\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)', re.IGNORECASE)
+_ITEM_TOTAL = re.compile(r'total\s*:?\s*\$?\s*(\d[\d,]*(?:\.\d+)?)', re.IGNORECASE)
+
+FIELDS = ("vendor_name", "country_of_origin", "line_items", "total_amount")
+
+
+def _first_capture(patterns, line):
+    """
+    Capture of the first pattern, in priority order, that matches a line.
+
+    Args:
+        patterns (list): Compiled patterns with one group
+        line (str): Line to search
+
+    Returns:
+        str: Captured text, or None if no pattern matches
+    """
+    for pattern in patterns:
+        match = pattern.search(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+class LineItemCollector:
+    """
+    Incremental parser for the "Items:" section of a text invoice.
+
+    Lines are fed one at a time; an item is complete when the next item starts
+    or finish() is called.
+    """
+
+    def __init__(self):
+        self.items_started = False
+        self.current_item = None
+        # Indexes of the fed lines that held an item's total
+        self.total_lines = []
+        self._line_index = -1
+
+    def feed(self, line):
+        """
+        Consume one invoice line.
+
+        Args:
+            line (str): Invoice line
+
+        Returns:
+            dict: The previous item if this line completed it, otherwise None
+        """
+        self._line_index += 1
+        line = line.strip()
+        if not line:
+            return None
+
+        # Check if we've reached the Items section
+        if not self.items_started:
+            if line.lower().startswith('items:'):
+                self.items_started = True
+            return None
+        if line.lower().startswith('items:'):
+            return None
+
+        # A numbered line starts a new item
+        if _ITEM_START.match(line):
+            completed = self.current_item
+            self.current_item = {
+                'product': line.split('.', 1)[1].strip(),
+                'quantity': 0,
+                'unit_price': 0.0,
+                'total_price': 0.0
+            }
+            return completed
+
+        if self.current_item is None:
+            return None
+
+        match = _ITEM_HTS.search(line)
+        if match:
+            self.current_item['hts_code'] = match.group(1)
+            return None
+        match = _ITEM_QUANTITY.search(line)
+        if match:
+            self.current_item['quantity'] = float(match.group(1).replace(',', ''))
+            return None
+        match = _ITEM_UNIT_PRICE.search(line)
+        if match:
+            self.current_item['unit_price'] = float(match.group(1).replace(',', ''))
+            return None
+        match = _ITEM_TOTAL.search(line)
+        if match:
+            self.current_item['total_price'] = float(match.group(1).replace(',', ''))
+            self.total_lines.append(self._line_index)
+        return None
+
+    def finish(self):
+        """
+        Complete the last item.
+
+        Returns:
+            dict: The item in progress, or None
+        """
+        completed, self.current_item = self.current_item, None
+        return completed
+
+
+class InvoiceFieldScanner:
+    """
+    Extract invoice header fields and line items in a single pass over the lines.
+
+    The document is scanned once with a combined keyword alternation, and only
+    the handlers for the fields whose keywords matched a line run their full
+    patterns on it. Country names without an origin label are found by the
+    shared country gazetteer in the same lazy pass.
+    """
+
+    def scan(self, text, fields=FIELDS):
+        """
+        Scan invoice text for the requested fields.
+
+        Args:
+            text (InvoiceText, str or list): Invoice text, or its lines in document order
+            fields (tuple): Any of "vendor_name", "country_of_origin", "line_items"
+                and "total_amount"
+
+        Returns:
+            dict: Value for each requested field; "Unknown" or 0.0 when not found
+        """
+        if isinstance(text, (list, tuple)):
+            text = "\n".join(text)
+        invoice_text = InvoiceText.of(text)
+        lines = invoice_text.lines
+        result = {}
+
+        # Item totals are read by the items section, so they are never the invoice total
+        item_total_lines = set()
+        if "line_items" in fields or "total_amount" in fields:
+            collector = LineItemCollector()
+            line_items = []
+            for line in lines:
+                item = collector.feed(line)
+                if item is not None:
+                    line_items.append(item)
+            item = collector.finish()
+            if item is not None:
+                line_items.append(item)
+            if "line_items" in fields:
+                result["line_items"] = line_items
+            item_total_lines = set(collector.total_lines)
+
+        header_fields = [field for field in ("vendor_name", "country_of_origin", "total_amount") if field in fields]
+        if header_fields:
+            result.update(self._scan_header_fields(invoice_text, header_fields, item_total_lines))
+        return result
+
+    def _scan_header_fields(self, invoice_text, fields, item_total_lines=()):
+        """
+        Find the vendor, origin and total in one keyword scan over the document.
+
+        Each field takes its value from the first line where one of its
+        patterns matches, trying the patterns in priority order.
+
+        Args:
+            invoice_text (InvoiceText): Tokenized invoice text
+            fields (list): Any of "vendor_name", "country_of_origin" and "total_amount"
+            item_total_lines (set): Indexes of lines holding a line item's total
+
+        Returns:
+            dict: Value for each requested field
+        """
+        lines = invoice_text.lines
+        pending = set(fields)
+        found = {}
+
+        def handle(index, hits, countries):
+            line = lines[index]
+            if "vendor_name" in pending and "vendor" in hits:
+                vendor_name = _first_capture(VENDOR_PATTERNS, line)
+                if vendor_name is not None:
+                    found["vendor_name"] = vendor_name.strip()
+                    pending.discard("vendor_name")
+
+            if "country_of_origin" in pending and ("origin" in hits or countries):
+                country_of_origin = _first_capture(ORIGIN_PATTERNS, line) if "origin" in hits else None
+                if country_of_origin is not None:
+                    country_of_origin = country_of_origin.strip()
+                else:
+                    labeled = "origin" in hits
+                    mention = next((mention for mention in countries if labeled or not mention.ambiguous), None)
+                    country_of_origin = mention.name if mention is not None else None
+                if country_of_origin is not None:
+                    found["country_of_origin"] = country_of_origin
+                    pending.discard("country_of_origin")
+
+            if "total_amount" in pending and "total" in hits and index not in item_total_lines:
+                total = _first_capture(TOTAL_PATTERNS, line)
+                if total is not None:
+                    found["total_amount"] = float(total.replace(',', ''))
+                    pending.discard("total_amount")
+
+        current = None
+        hits = set()
+        countries = []
+        for index, field, mention in self._line_events(invoice_text, "country_of_origin" in fields):
+            if index != current:
+                if current is not None:
+                    handle(current, hits, countries)
+                    if not pending:
+                        break
+                current = index
+                hits = set()
+                countries = []
+            hits.add(field)
+            if mention is not None:
+                countries.append(mention)
+        else:
+            if current is not None:
+                handle(current, hits, countries)
+
+        if "vendor_name" in fields and "vendor_name" not in found:
+            # If no label matched, fall back to the first non-empty line
+            found["vendor_name"] = next((line.strip() for line in lines if line.strip()), "Unknown")
+        if "country_of_origin" in fields:
+            found.setdefault("country_of_origin", "Unknown")
+        if "total_amount" in fields:
+            found.setdefault("total_amount", 0.0)
+        return found
+
+    def _line_events(self, invoice_text, with_countries):
+        """
+        Keyword and country hits of the document, in line order.
+
+        Both come from a single lazy scan over the whole document, so scanning
+        stops as soon as the caller has found every field.
+
+        Args:
+            invoice_text (InvoiceText): Tokenized invoice text
+            with_countries (bool): Whether to report country mentions
+
+        Yields:
+            tuple: (line index, field, CountryMention or None)
+        """
+        keyword_events = (
+            (invoice_text.line_index(match.start(), lowered=True), _KEYWORD_FIELD[_WHITESPACE.sub("", match.group(1))], None)
+            for match in _KEYWORD_SCANNER.finditer(invoice_text.lowered)
+        )
+        if not with_countries:
+            yield from keyword_events
+            return
+
+        country_events = (
+            (invoice_text.line_index(mention.start), "country", mention)
+            for mention in invoice_text.country_mentions(DEFAULT_KINDS)
+            if mention.kind in COUNTRY_KINDS
+        )
+        yield from heapq.merge(keyword_events, country_events, key=lambda event: event[0])
@@ -1,19 +1,62 @@
-from llama_stack_client import LlamaStackClient
-import json
+from llama_stack_client.types import UserMessage, SystemMessage
 import logging
 import re
 import os
-import tempfile
-from PIL import Image
-import pytesseract
-import pdf2image
+import time
+from backend.core.llm_client import DEFAULT_MODEL, get_llm_client
+from backend.core.llm_schemas import INVOICE_FORMAT, InvoiceExtraction, parse_response
+from backend.pdf_processing.document import find_layout_tables, group_word_rows, parse_amount
+from backend.pdf_processing.extraction_cache import get_extraction_cache
+from backend.pdf_processing.extraction_cascade import (
+    DEFAULT_CONFIDENCE_THRESHOLD, amounts_match, configured_stages, get_cascade_stats, score_invoice
+)
+from backend.pdf_processing.field_scanner import FIELDS, InvoiceFieldScanner, LineItemCollector
+from backend.pdf_processing.invoice_text import InvoiceText
+from backend.pdf_processing.layout_templates import get_template_store
+from backend.pdf_processing.ocr import OcrPageResult, get_ocr_pipeline, select_ocr_regions
+from backend.pdf_processing.pdf_extractor import count_pages, extract_document
+
+# Cache namespace for a page's OCR result; bump when OCR output can change for the same PDF
+OCR_CACHE_NAMESPACE = "ocr-page{page}-v2"
+OCR_REGION_CACHE_NAMESPACE = "ocr-region-page{page}-{x0:.0f}-{top:.0f}-{x1:.0f}-{bottom:.0f}-v1"
+
+# Layout line items at or above this confidence are used without asking the LLM
+LAYOUT_CONFIDENCE_THRESHOLD = float(os.getenv("LAYOUT_CONFIDENCE_THRESHOLD", "0.8"))
+
+# Models for the cascade's LLM stages. The large-model stage only runs when
+# LLM_LARGE_MODEL names a model registered with the Llama Stack server.
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", os.getenv("LLM_MODEL", DEFAULT_MODEL))
+LLM_LARGE_MODEL = os.getenv("LLM_LARGE_MODEL")
 
 class InvoiceParser:
+    # Header keywords for each line-item field. Fields are assigned in this order
+    # and keywords in priority order, so "Unit Price" is never taken for a total
+    # and a "Description" column wins over an "Item" column.
+    TABLE_COLUMN_ROLES = [
+        ('hts_code', ['hts', 'hs code', 'tariff']),
+        ('country_of_origin', ['country of origin', 'origin', 'coo']),
+        ('unit_price', ['unit price', 'unit cost', 'price', 'rate']),
+        ('quantity', ['qty', 'quantity', 'units', 'pcs']),
+        ('total_price', ['amount', 'line total', 'extended', 'total']),
+        ('product', ['description', 'product', 'goods', 'article', 'item']),
+    ]
+    
     def __init__(self):
         """
         Initialize the invoice parser with multiple parsing strategies.
         """
-        self.llama = LlamaStackClient(base_url="http://localhost:8321")
+        self.llama = get_llm_client()
+        self.field_scanner = InvoiceFieldScanner()
+        
+        # Extraction cascade: stages in order, the confidence that ends it, and its counters
+        self.cascade = [stage for stage in configured_stages() if stage != "llm_large" or LLM_LARGE_MODEL]
+        self.confidence_threshold = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", DEFAULT_CONFIDENCE_THRESHOLD))
+        self.small_model = LLM_SMALL_MODEL
+        self.large_model = LLM_LARGE_MODEL
+        self.stats = get_cascade_stats()
+        
+        # Vendor layout templates learned from earlier invoices
+        self.templates = get_template_store()
         
         # System prompt for invoice understanding
         self.system_prompt = """
@@ -43,38 +86,65 @@ class InvoiceParser:
         }
         """
     
-    def parse_invoice(self, text, pdf_path=None):
+    def parse_invoice(self, text, pdf_path=None, document=None):
         """
         Parse invoice text and extract structured data using multiple strategies.
         
+        Strategies run as a cascade, cheapest first: a learned vendor template,
+        table columns, word layout, text patterns, OCR, a small model and a
+        large model. Each result is scored on its arithmetic consistency and the
+        first one that clears the confidence threshold is returned; if none
+        does, the best-scoring result is. The stages and threshold come from
+        INVOICE_CASCADE and CASCADE_CONFIDENCE_THRESHOLD. A confident result
+        from any stage but the template teaches the template store the
+        invoice's layout.
+        
         Args:
-            text (str): Raw text from invoice
+            text (str or InvoiceText): Raw text from invoice, or its shared tokenized text
             pdf_path (str, optional): Path to the PDF file for OCR
+            document (ExtractedDocument, optional): Structured extraction of the PDF
             
         Returns:
             dict: Structured invoice data
         """
         try:
-            # Try multiple parsing strategies in order of reliability
-            
-            # Strategy 1: Try to use Llama for understanding
-            result = self._parse_with_llama(text)
-            if result and self._is_valid_result(result):
-                logging.info("Successfully parsed with Llama")
-                return result
-            
-            # Strategy 2: Try OCR if PDF path is provided
-            if pdf_path and os.path.exists(pdf_path):
-                ocr_text = self._extract_text_with_ocr(pdf_path)
-                if ocr_text and len(ocr_text) > len(text):
-                    logging.info("Using OCR text for parsing")
-                    result = self._parse_with_patterns(ocr_text)
-                    if result and self._is_valid_result(result):
-                        return result
-            
-            # Strategy 3: Use pattern matching on the original text
+            invoice_text = InvoiceText.of(text)
+            stages = {
+                "template": self._parse_with_template,
+                "tables": self._parse_with_tables,
+                "layout": self._parse_with_layout,
+                "patterns": self._parse_with_text_patterns,
+                "ocr": self._parse_with_ocr,
+                "llm_small": self._parse_with_small_model,
+                "llm_large": self._parse_with_large_model,
+            }
+            
+            best = None
+            for stage in self.cascade:
+                started = time.perf_counter()
+                result = stages[stage](invoice_text, pdf_path, document)
+                confidence = score_invoice(result) if result and self._is_valid_result(result) else None
+                elapsed = time.perf_counter() - started
+                
+                hit = confidence is not None and confidence >= self.confidence_threshold
+                self.stats.record_stage(stage, elapsed, hit)
+                if confidence is None:
+                    continue
+                logging.info(f"Extraction stage {stage}: confidence {confidence:.2f} in {elapsed:.3f}s")
+                if hit:
+                    self.stats.record_invoice(resolved=True)
+                    if stage != "template" and document is not None and self.templates is not None:
+                        self.templates.learn(document, result)
+                    return result
+                # On a tie the later, more capable stage wins
+                if best is None or confidence >= best[0]:
+                    best = (confidence, result)
+            
+            self.stats.record_invoice(resolved=False)
+            if best is not None:
+                return best[1]
             logging.info("Using pattern matching for parsing")
-            return self._parse_with_patterns(text)
+            return self._parse_with_patterns(invoice_text)
                 
         except Exception as e:
             logging.error(f"Error parsing invoice: {str(e)}", exc_info=True)
@@ -86,91 +156,199 @@ class InvoiceParser:
                 "total_amount": 0.0
             }
     
-    def _parse_with_llama(self, text):
+    def _parse_with_template(self, invoice_text, pdf_path, document):
+        """
+        Parse invoice with the learned template for its vendor layout.
+        
+        Args:
+            invoice_text (InvoiceText): Tokenized invoice text
+            pdf_path (str): Path to the PDF file, or None
+            document (ExtractedDocument): Structured extraction of the PDF, or None
+            
+        Returns:
+            dict: Structured invoice data, or None if no template matches
+        """
+        if document is None or self.templates is None:
+            return None
+        template = self.templates.match(document)
+        if template is None:
+            return None
+        
+        line_items = []
+        for page in document.pages:
+            for table in find_layout_tables(page.words, template.map_columns):
+                columns = template.map_columns(table.header)
+                for row in table.body_rows:
+                    item = self._table_row_to_item(row, columns)
+                    if item is not None:
+                        line_items.append(item)
+        
+        rows = [row for page in document.pages for row in group_word_rows(page.words)]
+        result = {
+            "vendor_name": template.extract_field("vendor_name", rows),
+            "country_of_origin": template.extract_field("country_of_origin", rows),
+            "line_items": line_items,
+            "total_amount": template.extract_field("total_amount", rows),
+        }
+        # Fields the template has no rule for are read from the text as usual
+        missing = tuple(field for field, value in result.items() if value is None)
+        if missing:
+            result.update(self.field_scanner.scan(invoice_text, missing))
+        
+        self.templates.record(template, bool(line_items) and score_invoice(result) >= self.confidence_threshold)
+        return result
+    
+    def _parse_with_tables(self, invoice_text, pdf_path, document):
+        """
+        Parse invoice reading line items straight from the PDF's tables.
+        
+        Args:
+            invoice_text (InvoiceText): Tokenized invoice text
+            pdf_path (str): Path to the PDF file, or None
+            document (ExtractedDocument): Structured extraction of the PDF, or None
+            
+        Returns:
+            dict: Structured invoice data, or None if no table holds line items
+        """
+        line_items = self.extract_line_items_from_tables(document.tables) if document is not None else []
+        if not line_items:
+            return None
+        return self._parse_with_patterns(invoice_text, line_items=line_items)
+    
+    def _parse_with_layout(self, invoice_text, pdf_path, document):
         """
-        Parse invoice using Llama.
+        Parse invoice rebuilding unruled tables from word positions.
         
         Args:
-            text (str): Raw text from invoice
+            invoice_text (InvoiceText): Tokenized invoice text
+            pdf_path (str): Path to the PDF file, or None
+            document (ExtractedDocument): Structured extraction of the PDF, or None
             
         Returns:
-            dict: Structured invoice data or None if parsing fails
+            dict: Structured invoice data, or None if the layout holds no line items
         """
+        if document is None:
+            return None
+        line_items, _ = self.extract_line_items_from_layout(document.pages)
+        if not line_items:
+            return None
+        return self._parse_with_patterns(invoice_text, line_items=line_items)
+    
+    def _parse_with_text_patterns(self, invoice_text, pdf_path, document):
+        """Parse invoice with pattern matching on the original text."""
+        return self._parse_with_patterns(invoice_text)
+    
+    def _parse_with_ocr(self, invoice_text, pdf_path, document):
+        """
+        Parse invoice after OCR of the pages whose text layer is missing or
+        garbage, and of the image regions (e.g. a scanned table) of otherwise
+        digital pages.
+        
+        Args:
+            invoice_text (InvoiceText): Tokenized invoice text
+            pdf_path (str): Path to the PDF file, or None
+            document (ExtractedDocument): Structured extraction of the PDF, or None
+            
+        Returns:
+            dict: Structured invoice data, or None if nothing needed OCR
+        """
+        if not pdf_path or not os.path.exists(pdf_path):
+            return None
+        if document is None:
+            document = extract_document(pdf_path)
+        ocr_pages = document.pages_needing_ocr
+        ocr_regions = {}
+        for page in document.pages:
+            regions = select_ocr_regions(page)
+            if regions:
+                ocr_regions[page.page_number] = regions
+        if not ocr_pages and not ocr_regions:
+            return None
+        
+        if ocr_pages:
+            logging.info(f"Using OCR text for pages {[index + 1 for index in ocr_pages]}")
+        if ocr_regions:
+            logging.info(f"Using OCR text for image regions on pages {[index + 1 for index in ocr_regions]}")
+        ocr_text = self._merge_ocr_text(
+            document,
+            self._ocr_pages(pdf_path, ocr_pages) if ocr_pages else {},
+            self._ocr_regions(pdf_path, ocr_regions) if ocr_regions else {},
+        )
+        return self._parse_with_patterns(ocr_text)
+    
+    def _parse_with_small_model(self, invoice_text, pdf_path, document):
+        """Parse invoice with the small model (LLM_SMALL_MODEL)."""
+        return self._parse_with_llama(invoice_text, self.small_model)
+    
+    def _parse_with_large_model(self, invoice_text, pdf_path, document):
+        """Parse invoice with the large model (LLM_LARGE_MODEL)."""
+        return self._parse_with_llama(invoice_text, self.large_model)
+    
+    def _parse_with_llama(self, text, model_id):
+        """
+        Parse invoice using Llama, with output constrained to the invoice schema.
+        
+        Args:
+            text (InvoiceText): Tokenized invoice text
+            model_id (str): Model to ask
+            
+        Returns:
+            dict: Structured invoice data or None if the call or validation fails
+        """
+        if self.llama is None:
+            return None
         try:
             # Prepare the prompt
             prompt = f"""
-            {self.system_prompt}
-            
             Here is the invoice text:
             
-            {text}
+            {text.text}
             
             Extract the information and return it as a JSON object.
             """
             
             # Call Llama for parsing
-            try:
-                # Try to use the chat method if available
-                if hasattr(self.llama, 'chat'):
-                    response = self.llama.chat(prompt)
-                else:
-                    # Fall back to a simpler method if chat is not available
-                    logging.warning("LlamaStackClient does not have a chat method, using fallback parsing")
-                    return self._parse_with_patterns(text)
-                
-                # Extract the JSON from the response
-                if response and "content" in response:
-                    content = response["content"]
-                    
-                    # Try to find JSON in the response
-                    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(1)
-                    else:
-                        # Try to find any JSON-like structure
-                        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                        if json_match:
-                            json_str = json_match.group(0)
-                        else:
-                            return None
-                    
-                    # Parse the JSON
-                    result = json.loads(json_str)
-                    return result
-            except Exception as e:
-                logging.error(f"Error calling Llama: {str(e)}", exc_info=True)
-                return None
-            
-            return None
+            response = self.llama.inference.chat_completion(
+                messages=[
+                    SystemMessage(content=self.system_prompt, role="system"),
+                    UserMessage(content=prompt, role="user"),
+                ],
+                model_id=model_id,
+                response_format=INVOICE_FORMAT,
+                stream=False,
+            )
+            
+            # Generation is constrained to the schema, so the whole body is the JSON object
+            parsed = parse_response(InvoiceExtraction, response.completion_message.content, "invoice")
+            return parsed.model_dump() if parsed is not None else None
             
         except Exception as e:
-            logging.error(f"Error parsing with Llama: {str(e)}", exc_info=True)
+            logging.error(f"Error parsing with Llama ({model_id}): {str(e)}", exc_info=True)
             return None
     
-    def _parse_with_patterns(self, text):
+    def _parse_with_patterns(self, text, tables=None, line_items=None):
         """
         Parse invoice using pattern matching.
         
         Args:
-            text (str): Raw text from invoice
+            text (str or InvoiceText): Raw text from invoice, or its shared tokenized text
+            tables (list, optional): Table objects to read line items from
+            line_items (list, optional): Line items already read from the layout
             
         Returns:
             dict: Structured invoice data
         """
-        # Split text into lines
-        lines = text.split('\n')
-        
-        # Extract vendor name
-        vendor_name = self._extract_vendor_name(lines)
-        
-        # Extract country of origin
-        country_of_origin = self._extract_country_of_origin(lines)
-        
-        # Extract line items
-        line_items = self._extract_line_items(lines)
-        
-        # Extract total amount
-        total_amount = self._extract_total_amount(lines)
+        # Prefer table columns over re-parsing the text for line items
+        line_items = line_items or self.extract_line_items_from_tables(tables or [])
+        fields = FIELDS if not line_items else tuple(field for field in FIELDS if field != "line_items")
+        
+        # Extract every field in one pass over the lines
+        scanned = self.field_scanner.scan(InvoiceText.of(text), fields)
+        vendor_name = scanned["vendor_name"]
+        country_of_origin = scanned["country_of_origin"]
+        if not line_items:
+            line_items = scanned["line_items"]
+        total_amount = scanned["total_amount"]
         
         # Construct result
         result = {
@@ -192,30 +370,7 @@ class InvoiceParser:
         Returns:
             str: Vendor name or "Unknown"
         """
-        # Common patterns for vendor name
-        patterns = [
-            r'vendor\s*:?\s*([^\n]+)',
-            r'supplier\s*:?\s*([^\n]+)',
-            r'from\s*:?\s*([^\n]+)',
-            r'bill\s*to\s*:?\s*([^\n]+)',
-            r'sold\s*by\s*:?\s*([^\n]+)',
-            r'company\s*:?\s*([^\n]+)',
-            r'business\s*:?\s*([^\n]+)'
-        ]
-        
-        # Check each line against patterns
-        for line in lines:
-            for pattern in patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    return match.group(1).strip()
-        
-        # If no match found, return the first non-empty line
-        for line in lines:
-            if line.strip():
-                return line.strip()
-        
-        return "Unknown"
+        return self.field_scanner.scan(lines, ("vendor_name",))["vendor_name"]
     
     def _extract_country_of_origin(self, lines):
         """
@@ -227,36 +382,7 @@ class InvoiceParser:
         Returns:
             str: Country of origin or "Unknown"
         """
-        # Common patterns for country of origin
-        patterns = [
-            r'country\s*of\s*origin\s*:?\s*([^\n]+)',
-            r'origin\s*:?\s*([^\n]+)',
-            r'made\s*in\s*:?\s*([^\n]+)',
-            r'manufactured\s*in\s*:?\s*([^\n]+)',
-            r'produced\s*in\s*:?\s*([^\n]+)'
-        ]
-        
-        # List of common countries
-        countries = [
-            "China", "Mexico", "Canada", "Japan", "Germany", "United States", 
-            "USA", "UK", "United Kingdom", "France", "Italy", "Spain", 
-            "Brazil", "India", "South Korea", "Taiwan", "Vietnam", "Thailand",
-            "Malaysia", "Indonesia", "Philippines", "Singapore", "Hong Kong"
-        ]
-        
-        # Check each line against patterns
-        for line in lines:
-            for pattern in patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    return match.group(1).strip()
-            
-            # Check for country names in the line
-            for country in countries:
-                if re.search(r'\b' + re.escape(country) + r'\b', line, re.IGNORECASE):
-                    return country
-        
-        return "Unknown"
+        return self.field_scanner.scan(lines, ("country_of_origin",))["country_of_origin"]
     
     def _extract_line_items(self, lines):
         """
@@ -268,73 +394,200 @@ class InvoiceParser:
         Returns:
             list: List of line items
         """
-        line_items = []
-        current_item = None
+        return list(self.iter_line_items(lines))
+    
+    def iter_line_items(self, lines):
+        """
+        Extract line items from invoice lines, yielding each item once it is complete.
         
-        # Find the Items section
-        items_started = False
+        An item is complete when the next item starts or the lines run out, so
+        lines may come from a generator over pages that are still being extracted.
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check if we've reached the Items section
-            if line.lower().startswith('items:'):
-                items_started = True
-                continue
+        Args:
+            lines (iterable): Invoice lines in document order
             
-            if not items_started:
-                continue
+        Yields:
+            dict: Line item
+        """
+        collector = LineItemCollector()
+        for line in lines:
+            item = collector.feed(line)
+            if item is not None:
+                yield item
+        
+        # Emit the last item if it exists
+        item = collector.finish()
+        if item is not None:
+            yield item
+    
+    def extract_line_items_from_tables(self, tables):
+        """
+        Read line items straight from table columns.
+        
+        Only tables with a detected header that names a product column and at
+        least one quantity or price column are used.
+        
+        Args:
+            tables (list): Table objects
             
-            # Check if this is a new item (starts with a number)
-            if re.match(r'^\d+\.', line):
-                # Save the previous item if it exists
-                if current_item is not None:
-                    line_items.append(current_item)
-                
-                # Start a new item
-                current_item = {
-                    'product': line.split('.', 1)[1].strip(),
-                    'quantity': 0,
-                    'unit_price': 0.0,
-                    'total_price': 0.0
-                }
+        Returns:
+            list: List of line items
+        """
+        line_items = []
+        for table in tables:
+            columns = self._map_table_columns(table.header)
+            if 'product' not in columns:
                 continue
-            
-            # Skip if we haven't started an item yet
-            if current_item is None:
+            if not any(role in columns for role in ('quantity', 'unit_price', 'total_price')):
                 continue
             
-            # Extract HTS code
-            hts_match = re.search(r'hts\s*code\s*:?\s*([0-9\.]+)', line, re.IGNORECASE)
-            if hts_match:
-                current_item['hts_code'] = hts_match.group(1)
-                continue
+            for row in table.body_rows:
+                item = self._table_row_to_item(row, columns)
+                if item is not None:
+                    line_items.append(item)
+        
+        return line_items
+    
+    def extract_line_items_from_layout(self, pages):
+        """
+        Read line items from word positions, for tables drawn without ruling lines.
+        
+        The confidence combines three checks: quantity x unit price matching
+        the amount on rows that have all three (half the score), the share of
+        items whose mapped number columns all parsed (three tenths), and the
+        item amounts adding up to the total printed below the table (a fifth).
+        A check with nothing to compare counts half.
+        
+        Args:
+            pages (list): PageExtraction objects with word boxes
             
-            # Extract quantity
-            qty_match = re.search(r'quantity\s*:?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
-            if qty_match:
-                current_item['quantity'] = float(qty_match.group(1))
-                continue
+        Returns:
+            tuple: (line items, confidence between 0 and 1)
+        """
+        line_items = []
+        consistent = checked = complete = 0
+        stated_totals = []
+        for page in pages:
+            for table in find_layout_tables(page.words, self._map_table_columns):
+                columns = self._map_table_columns(table.header)
+                numeric_roles = [role for role in ('quantity', 'unit_price', 'total_price') if role in columns]
+                for row in table.body_rows:
+                    item = self._table_row_to_item(row, columns)
+                    if item is None:
+                        continue
+                    line_items.append(item)
+                    
+                    amounts = {role: self._parse_amount(row[columns[role]] or "") for role in numeric_roles}
+                    if all(amount is not None for amount in amounts.values()):
+                        complete += 1
+                    if len(amounts) == 3 and all(amount is not None for amount in amounts.values()):
+                        checked += 1
+                        if amounts_match(amounts['quantity'] * amounts['unit_price'], amounts['total_price']):
+                            consistent += 1
+                
+                for summary in table.summary_rows:
+                    amounts = re.findall(r'-?\d[\d,]*(?:\.\d+)?', summary)
+                    if amounts:
+                        stated_totals.append(float(amounts[-1].replace(',', '')))
+        
+        if not line_items:
+            return [], 0.0
+        
+        arithmetic = consistent / checked if checked else 0.5
+        completeness = complete / len(line_items)
+        if stated_totals:
+            items_total = sum(item['total_price'] for item in line_items)
+            total_match = 1.0 if any(amounts_match(items_total, total) for total in stated_totals) else 0.0
+        else:
+            total_match = 0.5
+        
+        return line_items, 0.5 * arithmetic + 0.3 * completeness + 0.2 * total_match
+    
+    def _map_table_columns(self, header):
+        """
+        Map line-item fields to table column indexes using header keywords.
+        
+        Args:
+            header (list): Header labels, or None
             
-            # Extract unit price
-            price_match = re.search(r'unit\s*price\s*:?\s*\$?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
-            if price_match:
-                current_item['unit_price'] = float(price_match.group(1))
-                continue
+        Returns:
+            dict: Field name to column index
+        """
+        if not header:
+            return {}
+        
+        labels = [label.lower() for label in header]
+        columns = {}
+        for role, keywords in self.TABLE_COLUMN_ROLES:
+            for keyword in keywords:
+                pattern = r'\b' + re.escape(keyword) + r'\b'
+                index = next(
+                    (i for i, label in enumerate(labels)
+                     if i not in columns.values() and re.search(pattern, label)),
+                    None
+                )
+                if index is not None:
+                    columns[role] = index
+                    break
+        
+        return columns
+    
+    def _table_row_to_item(self, row, columns):
+        """
+        Build a line item from a table row.
+        
+        Args:
+            row (list): Cells of the row
+            columns (dict): Field name to column index
             
-            # Extract total price
-            total_match = re.search(r'total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)', line, re.IGNORECASE)
-            if total_match:
-                current_item['total_price'] = float(total_match.group(1))
-                continue
+        Returns:
+            dict: Line item, or None for empty, summary or non-numeric rows
+        """
+        def cell(role):
+            index = columns.get(role)
+            if index is None or index >= len(row) or row[index] is None:
+                return ""
+            return " ".join(str(row[index]).split())
+        
+        product = cell('product')
+        if not product or re.match(r'^(sub\s*total|total|tax|vat|shipping|freight|discount|balance)\b', product, re.IGNORECASE):
+            return None
         
-        # Add the last item if it exists
-        if current_item is not None:
-            line_items.append(current_item)
+        quantity = self._parse_amount(cell('quantity'))
+        unit_price = self._parse_amount(cell('unit_price'))
+        total_price = self._parse_amount(cell('total_price'))
+        if quantity is None and unit_price is None and total_price is None:
+            return None
         
-        return line_items
+        quantity = quantity if quantity is not None else 1.0
+        unit_price = unit_price if unit_price is not None else 0.0
+        if total_price is None:
+            total_price = quantity * unit_price
+        
+        item = {
+            'product': product,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_price': total_price
+        }
+        if cell('hts_code'):
+            item['hts_code'] = cell('hts_code')
+        if cell('country_of_origin'):
+            item['country_of_origin'] = cell('country_of_origin')
+        
+        return item
+    
+    def _parse_amount(self, value):
+        """
+        Parse a quantity or currency amount from a table cell.
+        
+        Args:
+            value (str): Cell text such as "$2,500.00", "(12.50)" or "100 pcs"
+            
+        Returns:
+            float: Parsed number, or None if the cell holds no number
+        """
+        return parse_amount(value)
     
     def _parse_line_item(self, line):
         """
@@ -420,23 +673,7 @@ class InvoiceParser:
         Returns:
             float: Total amount or 0.0
         """
-        # Common patterns for total amount
-        patterns = [
-            r'total\s*amount\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
-            r'total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
-            r'amount\s*due\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
-            r'balance\s*due\s*:?\s*\$?\s*(\d+(?:\.\d+)?)',
-            r'grand\s*total\s*:?\s*\$?\s*(\d+(?:\.\d+)?)'
-        ]
-        
-        # Check each line against patterns
-        for line in lines:
-            for pattern in patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
-                if match:
-                    return float(match.group(1))
-        
-        return 0.0
+        return self.field_scanner.scan(lines, ("total_amount",))["total_amount"]
     
     def _is_valid_result(self, result):
         """
@@ -486,25 +723,118 @@ class InvoiceParser:
             str: Extracted text
         """
         try:
-            # Convert PDF to images
-            images = pdf2image.convert_from_path(pdf_path)
-            
-            # Extract text from each image
-            text = ""
-            for i, image in enumerate(images):
-                # Save image to temporary file
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                    image.save(temp_file.name)
-                
-                # Extract text using Tesseract
-                page_text = pytesseract.image_to_string(Image.open(temp_file.name))
-                text += page_text + "\n\n"
-                
-                # Clean up temporary file
-                os.unlink(temp_file.name)
-            
-            return text
-            
+            page_count = count_pages(pdf_path)
         except Exception as e:
             logging.error(f"Error extracting text with OCR: {str(e)}", exc_info=True)
-            return "" 
\ No newline at end of file
+            return ""
+        
+        results = self._ocr_pages(pdf_path, range(page_count))
+        return "".join((results[index].text if index in results else "") + "\n\n" for index in range(page_count))
+    
+    def _ocr_pages(self, pdf_path, pages):
+        """
+        OCR selected pages of a PDF in parallel, keeping rendered pages in memory.
+        
+        Args:
+            pdf_path (str): Path to PDF file
+            pages (iterable): Zero-based indexes of the pages to OCR
+            
+        Returns:
+            dict: Page index to OcrPageResult, for every page that could be OCR'd
+        """
+        cache = get_extraction_cache()
+        digest = None
+        if cache is not None:
+            with open(pdf_path, 'rb') as pdf_file:
+                digest = cache.digest(pdf_file.read())
+        
+        results = {}
+        missing = []
+        for index in pages:
+            cached = cache.get(digest, OCR_CACHE_NAMESPACE.format(page=index)) if cache is not None else None
+            if cached is not None:
+                results[index] = OcrPageResult.from_dict(cached)
+            else:
+                missing.append(index)
+        
+        if missing:
+            ocr_results = get_ocr_pipeline().run(pdf_path, missing)
+            for index, result in ocr_results.items():
+                logging.info(f"OCR'd page {index + 1} in {result.timings.get('total', 0):.2f}s (confidence {result.confidence:.0f})")
+                if cache is not None:
+                    try:
+                        cache.put(digest, OCR_CACHE_NAMESPACE.format(page=index), result.to_dict())
+                    except OSError as e:
+                        logging.warning(f"Could not write OCR cache entry: {str(e)}")
+            results.update(ocr_results)
+        
+        return results
+    
+    def _ocr_regions(self, pdf_path, regions_by_page):
+        """
+        OCR image regions of digital pages, rendering only the region at OCR resolution.
+        
+        Args:
+            pdf_path (str): Path to PDF file
+            regions_by_page (dict): Page index to list of (x0, top, x1, bottom) boxes
+            
+        Returns:
+            dict: (page index, box) to OcrPageResult, for every region that could be OCR'd
+        """
+        cache = get_extraction_cache()
+        digest = None
+        if cache is not None:
+            with open(pdf_path, 'rb') as pdf_file:
+                digest = cache.digest(pdf_file.read())
+        
+        def namespace(index, region):
+            x0, top, x1, bottom = region
+            return OCR_REGION_CACHE_NAMESPACE.format(page=index, x0=x0, top=top, x1=x1, bottom=bottom)
+        
+        results = {}
+        missing = []
+        for index, regions in regions_by_page.items():
+            for region in regions:
+                cached = cache.get(digest, namespace(index, region)) if cache is not None else None
+                if cached is not None:
+                    results[(index, region)] = OcrPageResult.from_dict(cached)
+                else:
+                    missing.append((index, region))
+        
+        if missing:
+            ocr_results = get_ocr_pipeline().run_regions(pdf_path, missing)
+            for (index, region), result in ocr_results.items():
+                logging.info(f"OCR'd image region on page {index + 1} in {result.timings.get('total', 0):.2f}s (confidence {result.confidence:.0f})")
+                if cache is not None:
+                    try:
+                        cache.put(digest, namespace(index, region), result.to_dict())
+                    except OSError as e:
+                        logging.warning(f"Could not write OCR cache entry: {str(e)}")
+            results.update(ocr_results)
+        
+        return results
+    
+    def _merge_ocr_text(self, document, ocr_results, region_results=None):
+        """
+        Build the document text with OCR text in place of unusable text layers.
+        
+        Args:
+            document (ExtractedDocument): Structured extraction of the PDF
+            ocr_results (dict): Page index to OcrPageResult
+            region_results (dict, optional): (page index, box) to OcrPageResult for
+                image regions of digital pages
+            
+        Returns:
+            str: Document text
+        """
+        region_texts = {}
+        for (index, region), result in (region_results or {}).items():
+            region_texts.setdefault(index, []).append((region, result.text))
+        
+        page_texts = []
+        for page in document.pages:
+            if page.page_number in ocr_results:
+                page_texts.append(ocr_results[page.page_number].text.strip())
+            else:
+                page_texts.append(page.flattened_text(region_texts.get(page.page_number)))
+        return "\n".join(page_texts).strip()
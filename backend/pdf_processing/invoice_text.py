@@ -0,0 +1,238 @@
+import bisect
+import re
+from functools import cached_property
+from backend.agents.country_gazetteer import DEFAULT_KINDS, get_country_gazetteer
+from backend.tariff_research.hts_index import HTS_CODE
+
+# Plain numbers, as read by the pattern-based line item parsers
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+# Amounts with a currency symbol or ISO code before or after them. The leading
+# lookahead lets the engine skip most positions without trying either branch,
+# and a trailing-code amount must start at the beginning of a number.
+_CURRENCY_AMOUNT = re.compile(
+    r'(?=[$€£¥A-Z\d-])(?:'
+    r'(?:(?P<symbol>[$€£¥])|\b(?P<code>USD|EUR|GBP|JPY|CNY|RMB|CAD|MXN)\b)\s*(?P<amount>-?\d[\d,]*(?:\.\d+)?)'
+    r'|(?<![\d,.])(?P<trailing_amount>-?\d[\d,]*(?:\.\d+)?)\s*(?P<trailing_code>USD|EUR|GBP|JPY|CNY|RMB|CAD|MXN)\b'
+    r')'
+)
+_CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+
+
+class TextSpan:
+    """
+    A value found in the invoice text, with its character offsets.
+    """
+
+    def __init__(self, value, start, end, currency=None):
+        """
+        Args:
+            value: Parsed value (float for numbers and amounts, str for codes)
+            start (int): Offset of the first character
+            end (int): Offset just past the span
+            currency (str, optional): ISO currency code for amounts
+        """
+        self.value = value
+        self.start = start
+        self.end = end
+        self.currency = currency
+
+
+class _LazyMentions:
+    """
+    Country mentions produced on demand and remembered, so several readers
+    share one gazetteer pass and none scans further than it needs.
+    """
+
+    def __init__(self, mentions):
+        self._source = mentions
+        self._seen = []
+
+    def __iter__(self):
+        index = 0
+        while True:
+            if index < len(self._seen):
+                yield self._seen[index]
+            else:
+                mention = next(self._source, None)
+                if mention is None:
+                    return
+                self._seen.append(mention)
+                yield mention
+            index += 1
+
+
+class InvoiceText:
+    """
+    Invoice text tokenized once and shared by every detector and parser.
+
+    Lines and their offsets are split up front; case-folded text, numeric
+    tokens, currency amounts, HTS codes and country mentions are computed the
+    first time any reader asks for them and reused afterwards.
+    """
+
+    def __init__(self, text):
+        """
+        Args:
+            text (str): Raw invoice text
+        """
+        self.text = text or ""
+        self.lines = self.text.split('\n')
+        self.line_starts = []
+        offset = 0
+        for line in self.lines:
+            self.line_starts.append(offset)
+            offset += len(line) + 1
+        self._country_mentions = {}
+
+    @classmethod
+    def of(cls, text):
+        """
+        Wrap raw text, or return it unchanged if it is already tokenized.
+
+        Args:
+            text (str or InvoiceText): Invoice text
+
+        Returns:
+            InvoiceText: Tokenized text
+        """
+        return text if isinstance(text, cls) else cls(text)
+
+    def __str__(self):
+        return self.text
+
+    def __bool__(self):
+        return bool(self.text)
+
+    @cached_property
+    def lowered_lines(self):
+        """Lowercased lines."""
+        return [line.lower() for line in self.lines]
+
+    @cached_property
+    def lowered(self):
+        """Lowercased text; line breaks stay where they are."""
+        return "\n".join(self.lowered_lines)
+
+    @cached_property
+    def lowered_line_starts(self):
+        """Offset of each line in the lowercased text."""
+        if len(self.lowered) == len(self.text):
+            return self.line_starts
+        starts = []
+        offset = 0
+        for line in self.lowered_lines:
+            starts.append(offset)
+            offset += len(line) + 1
+        return starts
+
+    def line_index(self, offset, lowered=False):
+        """
+        Line containing a character offset.
+
+        Args:
+            offset (int): Offset in the text
+            lowered (bool): Whether the offset is in the lowercased text
+
+        Returns:
+            int: Zero-based line index
+        """
+        starts = self.lowered_line_starts if lowered else self.line_starts
+        return bisect.bisect_right(starts, offset) - 1
+
+    def lines_matching(self, keywords):
+        """
+        Lines containing a keyword, found with one scan of the lowercased text.
+
+        Args:
+            keywords (re.Pattern): Lowercase keyword pattern
+
+        Returns:
+            list: Indices of the matching lines, in order
+        """
+        indices = []
+        for match in keywords.finditer(self.lowered):
+            index = self.line_index(match.start(), lowered=True)
+            if not indices or indices[-1] != index:
+                indices.append(index)
+        return indices
+
+    @cached_property
+    def numbers(self):
+        """Every number in the text, as TextSpans in order of offset."""
+        return [TextSpan(float(match.group()), match.start(), match.end()) for match in _NUMBER.finditer(self.text)]
+
+    @cached_property
+    def _number_starts(self):
+        """Start offset of every number, for bisecting."""
+        return [number.start for number in self.numbers]
+
+    def numbers_between(self, start, end):
+        """
+        Numbers lying within a range of the text.
+
+        Args:
+            start (int): First offset of the range
+            end (int): Offset just past the range
+
+        Returns:
+            list: TextSpans of the numbers in the range
+        """
+        numbers = self.numbers
+        spans = []
+        for number in numbers[bisect.bisect_left(self._number_starts, start):]:
+            if number.end > end:
+                break
+            spans.append(number)
+        return spans
+
+    @cached_property
+    def currency_amounts(self):
+        """Amounts written with a currency symbol or code, as TextSpans."""
+        spans = []
+        for match in _CURRENCY_AMOUNT.finditer(self.text):
+            if match.group('amount') is not None:
+                amount = match.group('amount')
+                currency = _CURRENCY_SYMBOLS.get(match.group('symbol')) or match.group('code')
+            else:
+                amount = match.group('trailing_amount')
+                currency = match.group('trailing_code')
+            spans.append(TextSpan(float(amount.replace(',', '')), match.start(), match.end(), currency))
+        return spans
+
+    @cached_property
+    def hts_codes(self):
+        """HTS codes in the text, as TextSpans holding the code string."""
+        return [TextSpan(match.group(), match.start(), match.end()) for match in HTS_CODE.finditer(self.text)]
+
+    def country_mentions(self, kinds=DEFAULT_KINDS):
+        """
+        Country mentions in order of offset, found by the shared gazetteer.
+
+        The gazetteer runs at most once per kinds, and only as far into the
+        text as readers have iterated.
+
+        Args:
+            kinds (tuple): Kinds of terms to accept
+
+        Returns:
+            iterable: CountryMention objects
+        """
+        mentions = self._country_mentions.get(kinds)
+        if mentions is None:
+            mentions = _LazyMentions(get_country_gazetteer().iter_mentions(self.text, kinds))
+            self._country_mentions[kinds] = mentions
+        return mentions
+
+    def first_country(self, kinds=DEFAULT_KINDS, ambiguous=True):
+        """
+        First country mentioned in the text.
+
+        Args:
+            kinds (tuple): Kinds of terms to accept
+            ambiguous (bool): Whether to accept terms that are also ordinary words
+
+        Returns:
+            CountryMention: First mention, or None
+        """
+        return next((mention for mention in self.country_mentions(kinds) if ambiguous or not mention.ambiguous), None)
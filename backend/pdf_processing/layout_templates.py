@@ -0,0 +1,491 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from backend.pdf_processing.document import column_boundaries, group_word_rows, header_labels, parse_amount, row_cells
+from backend.pdf_processing.extraction_cascade import amounts_match
+
+# Default location of the learned templates
+DEFAULT_STORE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "templates", "templates.json"
+)
+
+# Share of the page height, from the top, whose words identify the vendor's letterhead
+HEADER_BAND = 0.25
+
+# Smallest token overlap (Jaccard) for a page to match a template
+MIN_TEMPLATE_SIMILARITY = 0.6
+
+# How far, in PDF points, a header label may move and still match the template
+COLUMN_TOLERANCE = 10.0
+
+# Rows below the header searched for the learned line items
+_LEARN_ROWS_PER_ITEM = 3
+
+_FINGERPRINT_TOKEN = re.compile(r'^[^\W\d_]{2,}$')
+_AMOUNT_TOKEN = re.compile(r'[$€£¥]?\s*-?\d[\d,]*(?:\.\d+)?')
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def _normalize(text):
+    """Lowercase text with runs of whitespace collapsed."""
+    return " ".join(str(text).lower().split())
+
+
+def layout_fingerprint(page):
+    """
+    Vocabulary identifying a page layout.
+
+    The tokens are the words of the letterhead band at the top of the page and
+    every label word (one ending in a colon) anywhere on it. Numbers, dates
+    and other per-invoice values are left out.
+
+    Args:
+        page (PageExtraction): Page with word boxes
+
+    Returns:
+        frozenset: Lowercased tokens
+    """
+    if page.page_size:
+        height = page.page_size[1]
+    else:
+        height = max((word[4] for word in page.words), default=0)
+    tokens = set()
+    for text, _, top, _, _ in page.words:
+        if top < height * HEADER_BAND or text.endswith(':'):
+            token = text.lower().strip(':.,')
+            if _FINGERPRINT_TOKEN.match(token):
+                tokens.add(token)
+    return frozenset(tokens)
+
+
+def _similarity(first, second):
+    """Jaccard overlap of two token sets."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class LayoutTemplate:
+    """
+    Extraction rules learned from one successfully parsed invoice of a vendor.
+
+    The line-item table is found by its exact header labels at their learned
+    positions, and each header label maps to a line-item field. Invoice fields,
+    the vendor name included, are read from the current invoice's row starting
+    with a learned label. The vendor name the template was learned from only
+    identifies the template, since other vendors may share the same layout.
+    """
+
+    def __init__(self, template_id, tokens, header, positions, columns, vendor_name, fields,
+                 hits=0, failures=0, learned_at=None):
+        """
+        Args:
+            template_id (str): Stable identifier
+            tokens (frozenset): Layout fingerprint of the first page
+            header (list): Lowercased header labels, left to right
+            positions (list): x0 of each header label in PDF points
+            columns (dict): Line-item field to header label index
+            vendor_name (str): Vendor the template was learned from, for logs and stats
+            fields (dict): Field name to {"anchor": label}
+            hits (int): Invoices extracted with the template
+            failures (int): Extractions that failed validation
+            learned_at (float, optional): When the template was learned
+        """
+        self.template_id = template_id
+        self.tokens = frozenset(tokens)
+        self.header = header
+        self.positions = positions
+        self.columns = columns
+        self.vendor_name = vendor_name
+        self.fields = fields
+        self.hits = hits
+        self.failures = failures
+        self.learned_at = learned_at or time.time()
+
+    def map_columns(self, labels):
+        """
+        Map line-item fields to column indexes for the learned header.
+
+        Args:
+            labels (list): Header labels
+
+        Returns:
+            dict: Field name to column index, or an empty dict for any other header
+        """
+        if [_normalize(label) for label in labels] != self.header:
+            return {}
+        return dict(self.columns)
+
+    def finds_header(self, rows):
+        """
+        Whether the learned header row appears among the rows at its learned positions.
+
+        Args:
+            rows (list): Word rows from group_word_rows
+
+        Returns:
+            bool: True if the header was found
+        """
+        for row in rows:
+            labels = header_labels(row)
+            if len(labels) != len(self.header):
+                continue
+            if [_normalize(label) for label, _, _ in labels] != self.header:
+                continue
+            if all(abs(x0 - position) <= COLUMN_TOLERANCE for (_, x0, _), position in zip(labels, self.positions)):
+                return True
+        return False
+
+    def extract_field(self, field, rows):
+        """
+        Read an invoice field with its learned rule.
+
+        Args:
+            field (str): "vendor_name", "country_of_origin" or "total_amount"
+            rows (list): Word rows of the pages, in document order
+
+        Returns:
+            Field value, or None if the template has no rule for it or the anchor is missing
+        """
+        rule = self.fields.get(field)
+        if rule is None:
+            return None
+
+        anchor = rule["anchor"]
+        # For totals the last matching row wins, so a grand total beats a subtotal with the same label
+        for row in (reversed(rows) if field == "total_amount" else rows):
+            text = " ".join(word[0] for word in row)
+            if _normalize(text).startswith(anchor):
+                rest = " ".join(text.split())[len(anchor):].strip()
+                if field == "total_amount":
+                    amounts = _AMOUNT_TOKEN.findall(rest)
+                    return parse_amount(amounts[-1]) if amounts else None
+                return rest or None
+        return None
+
+    def to_dict(self):
+        """JSON-serializable form of the template."""
+        return {
+            "template_id": self.template_id,
+            "tokens": sorted(self.tokens),
+            "header": self.header,
+            "positions": self.positions,
+            "columns": self.columns,
+            "vendor_name": self.vendor_name,
+            "fields": self.fields,
+            "hits": self.hits,
+            "failures": self.failures,
+            "learned_at": self.learned_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a template from to_dict output."""
+        return cls(
+            data["template_id"], data["tokens"], data["header"], data["positions"], data["columns"],
+            data.get("vendor_name"), data.get("fields", {}),
+            hits=data.get("hits", 0), failures=data.get("failures", 0), learned_at=data.get("learned_at"),
+        )
+
+
+def _value_matches(role, cell, value):
+    """Whether a table cell holds a parsed line-item value."""
+    if cell is None or value is None:
+        return False
+    if role in ("quantity", "unit_price", "total_price"):
+        number = parse_amount(cell)
+        try:
+            return number is not None and amounts_match(float(value), number)
+        except (TypeError, ValueError):
+            return False
+    cell, value = _normalize(cell), _normalize(value)
+    if role == "product":
+        # Wrapped descriptions only show their first line in the row
+        return bool(cell) and (cell in value or value in cell)
+    return cell == value
+
+
+def _learn_columns(rows, line_items):
+    """
+    Find the line-item table on a page and learn which column holds which field.
+
+    The header is the closest label-only row above the first item's product;
+    each field is assigned the column whose cells match the parsed values of
+    most items.
+
+    Args:
+        rows (list): Word rows from group_word_rows
+        line_items (list): Line items of the successful parse
+
+    Returns:
+        tuple: (header row index, labels, field to column index), or None
+    """
+    first_product = _normalize(line_items[0].get("product", ""))
+    if not first_product:
+        return None
+
+    for index, row in enumerate(rows):
+        row_text = _normalize(" ".join(word[0] for word in row))
+        if first_product.split()[0] not in row_text:
+            continue
+
+        for header_index in range(index - 1, max(index - 4, -1), -1):
+            header = rows[header_index]
+            if any(parse_amount(word[0]) is not None for word in header):
+                continue
+            labels = header_labels(header)
+            if len(labels) < 2:
+                continue
+
+            boundaries = column_boundaries(labels)
+            body = rows[header_index + 1:header_index + 1 + len(line_items) * _LEARN_ROWS_PER_ITEM]
+            cell_rows = [row_cells(body_row, boundaries) for body_row in body]
+
+            columns = {}
+            for role in ("product", "total_price", "unit_price", "quantity", "hts_code", "country_of_origin"):
+                best_column, best_count = None, 0
+                for column in range(len(labels)):
+                    if column in columns.values():
+                        continue
+                    count = sum(
+                        1 for item in line_items
+                        if any(_value_matches(role, cells[column], item.get(role)) for cells in cell_rows)
+                    )
+                    if count > best_count:
+                        best_column, best_count = column, count
+                if best_column is not None and best_count * 2 >= len(line_items):
+                    columns[role] = best_column
+
+            if "product" in columns and any(role in columns for role in ("quantity", "unit_price", "total_price")):
+                return header_index, labels, columns
+        return None
+    return None
+
+
+def _learn_field(field, value, rows):
+    """
+    Learn how to read an invoice field from where its parsed value appears.
+
+    Args:
+        field (str): "vendor_name", "country_of_origin" or "total_amount"
+        value: Parsed value
+        rows (list): Word rows of the pages, in document order
+
+    Returns:
+        dict: {"anchor": label}, or None if the value has no label to anchor on
+    """
+    if field == "total_amount":
+        try:
+            total = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not total:
+            return None
+        for row in reversed(rows):
+            text = " ".join(word[0] for word in row)
+            amounts = list(_AMOUNT_TOKEN.finditer(text))
+            if amounts and amounts_match(total, parse_amount(amounts[-1].group()) or 0.0):
+                anchor = _normalize(text[:amounts[-1].start()])
+                if re.search(r'[^\W\d_]', anchor):
+                    return {"anchor": anchor}
+        return None
+
+    if not value or value == "Unknown":
+        return None
+    needle = _normalize(value)
+    for row in rows:
+        text = _normalize(" ".join(word[0] for word in row))
+        position = text.find(needle)
+        if position > 0 and text[:position].rstrip().endswith(':'):
+            return {"anchor": text[:position].rstrip()}
+    # An unlabelled vendor or country may come from a letterhead or address,
+    # which differs between invoices, so it is left to the text patterns
+    return None
+
+
+class TemplateStore:
+    """
+    Local store of vendor layout templates, persisted as one JSON file.
+
+    Pages are matched to templates by the overlap of their fingerprint tokens
+    and confirmed by finding the learned table header at its learned
+    position. A template that fails validation is replaced the next time an
+    invoice with that layout is parsed successfully.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): JSON file holding the templates
+        """
+        self.path = path or os.getenv("TEMPLATE_STORE_PATH", DEFAULT_STORE_PATH)
+        self.matches = 0
+        self.misses = 0
+        self.learned = 0
+        self.relearned = 0
+        self._lock = threading.Lock()
+        self._templates = {}
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            for entry in data.get("templates", []):
+                template = LayoutTemplate.from_dict(entry)
+                self._templates[template.template_id] = template
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable template store {self.path}: {str(e)}")
+
+    def match(self, document):
+        """
+        Find the template for a document's layout.
+
+        Args:
+            document (ExtractedDocument): Extraction with word boxes
+
+        Returns:
+            LayoutTemplate: Matching template, or None
+        """
+        if not document.pages:
+            return None
+        tokens = layout_fingerprint(document.pages[0])
+        with self._lock:
+            candidates = sorted(
+                ((_similarity(tokens, template.tokens), template) for template in self._templates.values()),
+                key=lambda candidate: candidate[0],
+                reverse=True,
+            )
+        candidates = [template for similarity, template in candidates if similarity >= MIN_TEMPLATE_SIMILARITY]
+        if candidates:
+            rows = [row for page in document.pages for row in group_word_rows(page.words)]
+            for template in candidates:
+                if template.finds_header(rows):
+                    with self._lock:
+                        self.matches += 1
+                    return template
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def learn(self, document, result):
+        """
+        Learn a template from a successfully parsed invoice.
+
+        Any template whose fingerprint matches the document is replaced, so a
+        vendor's changed layout is re-learned in place.
+
+        Args:
+            document (ExtractedDocument): Extraction with word boxes
+            result (dict): Validated structured invoice data
+
+        Returns:
+            LayoutTemplate: The new template, or None if the line items could
+                not be located in the layout
+        """
+        line_items = [item for item in result.get("line_items") or [] if isinstance(item, dict) and item.get("product")]
+        if not line_items or not document.pages:
+            return None
+
+        rows = [row for page in document.pages for row in group_word_rows(page.words)]
+        learned = _learn_columns(rows, line_items)
+        if learned is None:
+            return None
+        _, labels, columns = learned
+
+        tokens = layout_fingerprint(document.pages[0])
+        header = [_normalize(label) for label, _, _ in labels]
+        fields = {}
+        for field in ("vendor_name", "country_of_origin", "total_amount"):
+            rule = _learn_field(field, result.get(field), rows)
+            if rule is not None:
+                fields[field] = rule
+
+        template_id = hashlib.sha256(json.dumps([sorted(tokens), header]).encode('utf-8')).hexdigest()[:16]
+        template = LayoutTemplate(
+            template_id, tokens, header, [x0 for _, x0, _ in labels], columns, result.get("vendor_name"), fields
+        )
+
+        with self._lock:
+            replaced = [
+                existing for existing in self._templates
+                if _similarity(tokens, self._templates[existing].tokens) >= MIN_TEMPLATE_SIMILARITY
+            ]
+            for existing in replaced:
+                del self._templates[existing]
+            self._templates[template_id] = template
+            if replaced:
+                self.relearned += 1
+            else:
+                self.learned += 1
+            self._save()
+        logging.info(f"{'Re-learned' if replaced else 'Learned'} layout template {template_id} for {template.vendor_name}")
+        return template
+
+    def record(self, template, success):
+        """
+        Record whether an extraction with a template passed validation.
+
+        The counters are written to disk with the next learned template.
+
+        Args:
+            template (LayoutTemplate): Template that was applied
+            success (bool): Whether the result cleared the confidence threshold
+        """
+        with self._lock:
+            if success:
+                template.hits += 1
+            else:
+                template.failures += 1
+        if not success:
+            logging.info(f"Layout template {template.template_id} failed validation")
+
+    def _save(self):
+        """Write the templates to disk atomically. Caller holds the lock."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"templates": [template.to_dict() for template in self._templates.values()]}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save template store {self.path}: {str(e)}")
+
+    def stats(self):
+        """
+        Store counters.
+
+        Returns:
+            dict: templates, matches, misses, learned and relearned
+        """
+        with self._lock:
+            return {
+                "templates": len(self._templates),
+                "matches": self.matches,
+                "misses": self.misses,
+                "learned": self.learned,
+                "relearned": self.relearned,
+            }
+
+
+def get_template_store():
+    """
+    Get the process-wide template store, unless disabled with TEMPLATE_STORE_DISABLED.
+
+    Returns:
+        TemplateStore: Shared store, or None if disabled
+    """
+    global _default_store
+    if os.getenv("TEMPLATE_STORE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TemplateStore()
+        return _default_store
@@ -0,0 +1,471 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pdf2image
+import pypdfium2 as pdfium
+import pytesseract
+from backend.pdf_processing.extraction_cache import get_extraction_cache
+from backend.pdf_processing.ocr_service import get_ocr_service, warm_engine_available
+from backend.pdf_processing.pdf_extractor import PDFIUM_LOCK
+
+# Resolution pages are rendered at and scans are normalized to before OCR
+OCR_DPI = 300
+
+# Image regions smaller than this share of the page, or than these sizes in
+# points, are logos or rules rather than text worth OCR'ing
+MIN_REGION_AREA_RATIO = 0.01
+MIN_REGION_WIDTH = 36
+MIN_REGION_HEIGHT = 12
+
+# Regions whose area is at least this much covered by text-layer blocks already have text
+MAX_REGION_TEXT_OVERLAP = 0.5
+
+# Cache namespace for OCR results keyed by the hash of the preprocessed image
+OCR_IMAGE_CACHE_NAMESPACE = "ocr-image-v1"
+
+# Page renderers: pdfium renders in-process, pdf2image spawns poppler's pdftoppm
+RENDER_BACKEND_PDFIUM = "pdfium"
+RENDER_BACKEND_POPPLER = "pdf2image"
+DEFAULT_RENDER_BACKEND = os.getenv("OCR_RENDER_BACKEND", RENDER_BACKEND_PDFIUM)
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+class OcrPageResult:
+    """
+    OCR output for a single page or a region of it.
+    """
+
+    def __init__(self, page_number, text, confidence, timings=None, region=None):
+        """
+        Args:
+            page_number (int): Zero-based page index
+            text (str): Recognized text
+            confidence (float): Mean word confidence from 0 to 100, or 0.0 if no words
+            timings (dict, optional): Seconds spent per OCR step
+            region (tuple, optional): (x0, top, x1, bottom) box that was OCR'd, or
+                None for the whole page
+        """
+        self.page_number = page_number
+        self.text = text
+        self.confidence = confidence
+        self.timings = timings or {}
+        self.region = region
+
+    def to_dict(self):
+        """JSON-serializable form of the result."""
+        return {
+            "page_number": self.page_number,
+            "text": self.text,
+            "confidence": self.confidence,
+            "timings": self.timings,
+            "region": self.region,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a result from to_dict output."""
+        region = tuple(data["region"]) if data.get("region") else None
+        return cls(data["page_number"], data["text"], data["confidence"], data.get("timings"), region)
+
+
+def _overlap_area(a, b):
+    """Area shared by two (x0, top, x1, bottom) boxes."""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    return width * height if width > 0 and height > 0 else 0.0
+
+
+def select_ocr_regions(page):
+    """
+    Pick the image regions of an otherwise digital page that are worth OCR'ing.
+
+    Pages that need full-page OCR get none, and so do logos, thin rules and
+    images that already sit under text-layer blocks (e.g. searchable scans).
+
+    Args:
+        page (PageExtraction): Extracted page
+
+    Returns:
+        list: (x0, top, x1, bottom) boxes to OCR
+    """
+    if page.text_quality is not None and page.text_quality.needs_ocr:
+        return []
+    if not page.image_regions or not page.page_size:
+        return []
+
+    page_area = page.page_size[0] * page.page_size[1]
+    text_boxes = [block.bbox for block in page.text_blocks if block.bbox]
+
+    regions = []
+    for region in page.image_regions:
+        width, height = region[2] - region[0], region[3] - region[1]
+        area = width * height
+        if width < MIN_REGION_WIDTH or height < MIN_REGION_HEIGHT or area < page_area * MIN_REGION_AREA_RATIO:
+            continue
+        covered = sum(_overlap_area(region, box) for box in text_boxes)
+        if covered >= area * MAX_REGION_TEXT_OVERLAP:
+            continue
+        regions.append(region)
+    return regions
+
+
+def _render_with_pdfium(pdf, index, dpi, region):
+    """
+    Render a page or region in-process with pdfium, straight to a grayscale buffer.
+
+    Args:
+        pdf: pypdfium2 document
+        index (int): Zero-based page index
+        dpi (int): Render resolution
+        region (tuple, optional): (x0, top, x1, bottom) in PDF points
+
+    Returns:
+        PIL.Image.Image: Rendered page or region
+    """
+    with PDFIUM_LOCK:
+        page = pdf[index]
+        try:
+            crop = (0, 0, 0, 0)
+            if region is not None:
+                width, height = page.get_size()
+                x0, top, x1, bottom = region
+                # pdfium crops by the margin to remove from each side (left, bottom, right, top)
+                crop = (max(x0, 0), max(height - bottom, 0), max(width - x1, 0), max(top, 0))
+            bitmap = page.render(scale=dpi / 72, crop=crop, grayscale=True)
+            try:
+                return bitmap.to_pil().copy()
+            finally:
+                bitmap.close()
+        finally:
+            page.close()
+
+
+def _render_with_poppler(pdf_path, index, dpi, region):
+    """
+    Render a page with pdf2image and crop it to a region.
+
+    Args:
+        pdf_path (str): Path to PDF file
+        index (int): Zero-based page index
+        dpi (int): Render resolution
+        region (tuple, optional): (x0, top, x1, bottom) in PDF points
+
+    Returns:
+        PIL.Image.Image: Rendered page or region
+    """
+    image = pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=index + 1, last_page=index + 1)[0]
+    if region is not None:
+        scale = dpi / 72
+        image = image.crop(tuple(round(coordinate * scale) for coordinate in region))
+    return image
+
+
+def render_page(pdf_path, index, dpi=OCR_DPI, region=None, backend=DEFAULT_RENDER_BACKEND, pdf=None):
+    """
+    Render a single PDF page, or a region of it, to an in-memory image.
+
+    Args:
+        pdf_path (str): Path to PDF file
+        index (int): Zero-based page index
+        dpi (int): Render resolution
+        region (tuple, optional): (x0, top, x1, bottom) in PDF points; the whole
+            page when omitted
+        backend (str): "pdfium" (in-process) or "pdf2image" (poppler subprocess)
+        pdf (optional): Already-open pypdfium2 document for pdf_path, so that
+            rendering several pages does not reopen the file
+
+    Returns:
+        PIL.Image.Image: Rendered page or region
+    """
+    if backend == RENDER_BACKEND_POPPLER:
+        return _render_with_poppler(pdf_path, index, dpi, region)
+    if backend != RENDER_BACKEND_PDFIUM:
+        raise ValueError(f"Unknown render backend: {backend}")
+
+    if pdf is not None:
+        return _render_with_pdfium(pdf, index, dpi, region)
+
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return _render_with_pdfium(pdf, index, dpi, region)
+    finally:
+        with PDFIUM_LOCK:
+            pdf.close()
+
+
+def _otsu_threshold(histogram):
+    """
+    Pick the gray level that best separates ink from background.
+
+    Args:
+        histogram (list): 256-bin grayscale histogram
+
+    Returns:
+        int: Threshold gray level
+    """
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+
+    background = 0
+    weighted_background = 0.0
+    best_level, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        weighted_background += level * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def preprocess_image(image, source_dpi=None, target_dpi=OCR_DPI):
+    """
+    Prepare a page image for tesseract: grayscale, normalize DPI and binarize.
+
+    Args:
+        image (PIL.Image.Image): Page image
+        source_dpi (float, optional): Resolution the image was produced at; read
+            from the image metadata when omitted
+        target_dpi (int): Resolution to normalize to
+
+    Returns:
+        PIL.Image.Image: Black-and-white image at the target resolution
+    """
+    if source_dpi is None:
+        source_dpi = image.info.get("dpi", (target_dpi,))[0] or target_dpi
+
+    gray = image.convert("L")
+    if abs(source_dpi - target_dpi) > 1:
+        scale = target_dpi / source_dpi
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))))
+
+    threshold = _otsu_threshold(gray.histogram())
+    return gray.point(lambda level: 255 if level > threshold else 0, mode="1")
+
+
+def ocr_image(image):
+    """
+    Run tesseract once and return both the text and its confidence.
+
+    Args:
+        image (PIL.Image.Image): Preprocessed page image
+
+    Returns:
+        tuple: (text, confidence) with confidence the mean word confidence (0-100)
+    """
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+
+    lines = []
+    paragraphs = []
+    current_line = None
+    current_paragraph = None
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        confidences.append(confidence)
+
+        paragraph_key = (data["page_num"][i], data["block_num"][i], data["par_num"][i])
+        line_key = paragraph_key + (data["line_num"][i],)
+        if paragraph_key != current_paragraph:
+            if lines:
+                paragraphs.append("\n".join(lines))
+            lines = []
+            current_paragraph = paragraph_key
+            current_line = None
+        if line_key != current_line:
+            lines.append(word)
+            current_line = line_key
+        else:
+            lines[-1] += " " + word
+    if lines:
+        paragraphs.append("\n".join(lines))
+
+    text = "\n\n".join(paragraphs)
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return text, confidence
+
+
+class OcrPipeline:
+    """
+    OCR pages in parallel across a bounded worker pool, entirely in memory.
+
+    Each worker renders, preprocesses and recognizes one page (or region) at a
+    time, so at most max_workers images are alive at once regardless of
+    document length.
+    """
+
+    def __init__(self, max_workers=None, dpi=OCR_DPI, render_backend=DEFAULT_RENDER_BACKEND, service=None):
+        """
+        Args:
+            max_workers (int, optional): Pages OCR'd concurrently; defaults to
+                OCR_WORKERS or the CPU count
+            dpi (int): Render and normalization resolution
+            render_backend (str): "pdfium" (default) or "pdf2image"
+            service (OcrService, optional): Worker service that runs tesseract; when
+                omitted tesseract is called directly from the pipeline threads
+        """
+        self.max_workers = max_workers or int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+        self.dpi = dpi
+        self.render_backend = render_backend
+        self.service = service
+        # tesseract runs out of process, so threads give real parallelism
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocr")
+
+    def _process_page(self, pdf_path, index, pdf=None, region=None):
+        """
+        Render, preprocess and OCR one page or region.
+
+        Args:
+            pdf_path (str): Path to PDF file
+            index (int): Zero-based page index
+            pdf (optional): Already-open pypdfium2 document for pdf_path
+            region (tuple, optional): (x0, top, x1, bottom) box to OCR
+
+        Returns:
+            OcrPageResult: OCR output for the page or region
+        """
+        timings = {}
+        started = time.perf_counter()
+        image = render_page(pdf_path, index, dpi=self.dpi, region=region, backend=self.render_backend, pdf=pdf)
+        timings['render'] = time.perf_counter() - started
+
+        step = time.perf_counter()
+        image = preprocess_image(image, source_dpi=self.dpi, target_dpi=self.dpi)
+        timings['preprocess'] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        text, confidence = self._recognize(image)
+        timings['ocr'] = time.perf_counter() - step
+
+        timings['total'] = time.perf_counter() - started
+        return OcrPageResult(index, text, confidence, timings, region)
+
+    def _recognize(self, image):
+        """
+        OCR a preprocessed image, reusing the result for an identical image.
+
+        Boilerplate pages (terms and conditions, cover sheets, certificates of
+        origin) come out of preprocessing as the same bitmap across invoices, so
+        results are cached by a hash of the image itself rather than of the PDF.
+
+        Args:
+            image (PIL.Image.Image): Preprocessed page image
+
+        Returns:
+            tuple: (text, confidence)
+        """
+        cache = get_extraction_cache()
+        digest = None
+        if cache is not None:
+            digest = cache.digest(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode() + image.tobytes())
+            cached = cache.get(digest, OCR_IMAGE_CACHE_NAMESPACE)
+            if cached is not None:
+                return cached["text"], cached["confidence"]
+
+        text, confidence = self.service.ocr(image) if self.service is not None else ocr_image(image)
+
+        if cache is not None:
+            try:
+                cache.put(digest, OCR_IMAGE_CACHE_NAMESPACE, {"text": text, "confidence": confidence})
+            except OSError as e:
+                logging.warning(f"Could not write OCR cache entry: {str(e)}")
+        return text, confidence
+
+    def run(self, pdf_path, pages):
+        """
+        OCR selected pages of a PDF.
+
+        Args:
+            pdf_path (str): Path to PDF file
+            pages (iterable): Zero-based indexes of the pages to OCR
+
+        Returns:
+            dict: Page index to OcrPageResult, for every page that could be OCR'd
+        """
+        results = self._run(pdf_path, [(index, None) for index in pages])
+        return {index: result for (index, _), result in results.items()}
+
+    def run_regions(self, pdf_path, regions):
+        """
+        OCR selected regions of a PDF's pages.
+
+        Args:
+            pdf_path (str): Path to PDF file
+            regions (iterable): (page index, (x0, top, x1, bottom)) pairs
+
+        Returns:
+            dict: (page index, box) to OcrPageResult, for every region that could be OCR'd
+        """
+        return self._run(pdf_path, list(regions))
+
+    def _run(self, pdf_path, jobs):
+        """
+        OCR pages or regions across the worker pool.
+
+        Args:
+            pdf_path (str): Path to PDF file
+            jobs (list): (page index, box or None) pairs
+
+        Returns:
+            dict: Job to OcrPageResult, for every job that succeeded
+        """
+        pdf = None
+        if self.render_backend == RENDER_BACKEND_PDFIUM:
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_path)
+
+        try:
+            futures = {
+                (index, region): self._executor.submit(self._process_page, pdf_path, index, pdf, region)
+                for index, region in jobs
+            }
+
+            results = {}
+            for (index, region), future in futures.items():
+                try:
+                    results[(index, region)] = future.result()
+                except Exception as e:
+                    logging.error(f"Error extracting text with OCR from page {index + 1}: {str(e)}", exc_info=True)
+            return results
+        finally:
+            if pdf is not None:
+                with PDFIUM_LOCK:
+                    pdf.close()
+
+
+def get_ocr_pipeline():
+    """
+    Get the process-wide OCR pipeline, creating it on first use.
+
+    Recognition goes through the shared OcrService when tesserocr is
+    installed and OCR_SERVICE_DISABLED is not set; otherwise tesseract is
+    called directly through pytesseract.
+
+    Returns:
+        OcrPipeline: Shared pipeline
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            service = None
+            if os.getenv("OCR_SERVICE_DISABLED", "").lower() not in ("1", "true", "yes"):
+                if warm_engine_available():
+                    service = get_ocr_service()
+                else:
+                    logging.info("tesserocr is not installed; calling tesseract directly instead of the OCR service")
+            _pipeline = OcrPipeline(service=service)
+        return _pipeline
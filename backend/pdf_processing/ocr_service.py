@@ -0,0 +1,354 @@
+import collections
+import importlib.util
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+# Seconds a single page may spend in tesseract before its worker is restarted
+DEFAULT_PAGE_TIMEOUT = 120
+
+# Tesseract language loaded by every worker
+DEFAULT_LANGUAGE = "eng"
+
+# How often the dispatcher checks for timed-out pages when nothing else happens
+_POLL_INTERVAL = 0.5
+
+_service = None
+_service_lock = threading.Lock()
+
+
+class OcrTimeoutError(TimeoutError):
+    """Raised when a page takes longer than the service's page timeout."""
+
+
+def warm_engine_available():
+    """
+    Whether tesserocr is installed, so workers can keep tesseract loaded.
+
+    Without it every page starts a tesseract process anyway, and the service
+    would only add a trip through the worker pipe.
+
+    Returns:
+        bool: True if tesserocr can be imported
+    """
+    return importlib.util.find_spec("tesserocr") is not None
+
+
+def _load_engine(language):
+    """
+    Load the OCR engine once for the lifetime of a worker process.
+
+    tesserocr keeps tesseract and its language data loaded in-process; without
+    it the worker falls back to pytesseract, which starts a tesseract process
+    per call (get_ocr_pipeline does not use the service in that case).
+
+    Args:
+        language (str): Tesseract language code
+
+    Returns:
+        callable: Function mapping a PIL image to (text, confidence)
+    """
+    try:
+        import tesserocr
+    except ImportError:
+        tesserocr = None
+
+    if tesserocr is not None:
+        api = tesserocr.PyTessBaseAPI(lang=language)
+
+        def recognize(image):
+            api.SetImage(image)
+            return api.GetUTF8Text().strip(), float(api.MeanTextConf())
+
+        return recognize
+
+    from backend.pdf_processing.ocr import ocr_image
+    return ocr_image
+
+
+def _worker_main(connection, language):
+    """
+    Worker process loop: receive page buffers, send back recognized text.
+
+    Args:
+        connection (Connection): Pipe end shared with the dispatcher
+        language (str): Tesseract language code
+    """
+    from PIL import Image
+
+    recognize = _load_engine(language)
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        job_id, mode, size, buffer = job
+        try:
+            text, confidence = recognize(Image.frombytes(mode, size, buffer))
+            connection.send((job_id, text, confidence, None))
+        except Exception as e:
+            connection.send((job_id, None, None, f"{type(e).__name__}: {str(e)}"))
+
+
+class _Worker:
+    """
+    One OCR worker process and the job it is currently running.
+    """
+
+    def __init__(self, context, language):
+        """
+        Args:
+            context: multiprocessing context used to start the process
+            language (str): Tesseract language code
+        """
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_connection, language), daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.job = None
+        self.started = None
+
+    @property
+    def idle(self):
+        """True if the worker is not running a job."""
+        return self.job is None
+
+    def stop(self, force=False):
+        """
+        Stop the worker process.
+
+        Args:
+            force (bool): Kill it instead of asking it to exit
+        """
+        if force:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout=5)
+        self.connection.close()
+
+
+class OcrService:
+    """
+    Long-lived OCR worker processes fed from a local queue of page images.
+
+    Pages are submitted as in-memory images and queued until a worker is
+    free. Each worker loads the OCR engine once and keeps it for every page it
+    handles; a worker that exceeds the page timeout is killed and replaced so a
+    single pathological page cannot stall the queue.
+    """
+
+    def __init__(self, workers=None, page_timeout=None, language=DEFAULT_LANGUAGE):
+        """
+        Args:
+            workers (int, optional): Worker processes; defaults to OCR_WORKERS or the CPU count
+            page_timeout (float, optional): Seconds per page; defaults to OCR_PAGE_TIMEOUT
+            language (str): Tesseract language code
+        """
+        self.workers = workers or int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+        self.page_timeout = page_timeout or float(os.getenv("OCR_PAGE_TIMEOUT", DEFAULT_PAGE_TIMEOUT))
+        self.language = language
+
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self._busy_seconds = 0.0
+
+        # spawn rather than fork: the API server is multi-threaded
+        self._context = multiprocessing.get_context("spawn")
+        self._job_ids = itertools.count()
+        self._queue = collections.deque()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+
+        self._pool = [_Worker(self._context, self.language) for _ in range(self.workers)]
+        self._dispatcher = threading.Thread(target=self._dispatch, name="ocr-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, image):
+        """
+        Queue a page image for OCR.
+
+        Args:
+            image (PIL.Image.Image): Preprocessed page image
+
+        Returns:
+            Future: Resolves to (text, confidence), or raises OcrTimeoutError
+                or RuntimeError if the page could not be OCR'd
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("OCR service has been shut down")
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._queue.append((job_id, image.mode, image.size, image.tobytes()))
+            self._wakeup_writer.send(None)
+        return future
+
+    def ocr(self, image):
+        """
+        OCR a page image and wait for the result.
+
+        Args:
+            image (PIL.Image.Image): Preprocessed page image
+
+        Returns:
+            tuple: (text, confidence) with confidence the mean word confidence (0-100)
+        """
+        return self.submit(image).result()
+
+    def _dispatch(self):
+        """
+        Dispatcher thread: hand queued pages to idle workers, collect results
+        and replace workers whose page timed out.
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                for index, worker in enumerate(self._pool):
+                    if worker.idle and self._queue:
+                        job = self._queue.popleft()
+                        try:
+                            worker.connection.send(job)
+                        except (OSError, ValueError):
+                            # The idle worker died; retry the page on its replacement
+                            self._queue.appendleft(job)
+                            self._replace(index, worker)
+                            continue
+                        worker.job = job[0]
+                        worker.started = time.perf_counter()
+                connections = [worker.connection for worker in self._pool if not worker.idle]
+
+            ready = wait(connections + [self._wakeup_reader], timeout=_POLL_INTERVAL)
+            if self._wakeup_reader in ready:
+                while self._wakeup_reader.poll():
+                    self._wakeup_reader.recv()
+
+            with self._lock:
+                for index, worker in enumerate(self._pool):
+                    if worker.idle:
+                        continue
+                    if worker.connection in ready:
+                        self._collect(index, worker)
+                    elif time.perf_counter() - worker.started > self.page_timeout:
+                        self.timeouts += 1
+                        self._fail(worker.job, OcrTimeoutError(f"OCR of page exceeded {self.page_timeout:.0f}s"))
+                        self._replace(index, worker)
+
+    def _collect(self, index, worker):
+        """
+        Resolve the future for a worker's finished job. Caller holds the lock.
+
+        Args:
+            index (int): Position of the worker in the pool
+            worker (_Worker): Worker with a result ready
+        """
+        try:
+            job_id, text, confidence, error = worker.connection.recv()
+        except (EOFError, OSError):
+            # The worker died mid-page (e.g. out of memory)
+            self._fail(worker.job, RuntimeError("OCR worker exited unexpectedly"))
+            self._replace(index, worker)
+            return
+
+        self._busy_seconds += time.perf_counter() - worker.started
+        worker.job = None
+        worker.started = None
+        if error is not None:
+            self._fail(job_id, RuntimeError(error))
+            return
+        self.completed += 1
+        future = self._futures.pop(job_id, None)
+        if future is not None:
+            future.set_result((text, confidence))
+
+    def _fail(self, job_id, error):
+        """Fail a job's future. Caller holds the lock."""
+        self.failed += 1
+        future = self._futures.pop(job_id, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def _replace(self, index, worker):
+        """Kill a worker and start a fresh one in its place. Caller holds the lock."""
+        logging.warning(f"Restarting OCR worker {worker.process.pid}")
+        worker.stop(force=True)
+        self._pool[index] = _Worker(self._context, self.language)
+        self.restarts += 1
+
+    def stats(self):
+        """
+        Service counters.
+
+        Returns:
+            dict: workers, busy_workers, queue_depth, completed, failed, timeouts,
+                restarts and mean_page_seconds
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy_workers": sum(1 for worker in self._pool if not worker.idle),
+                "queue_depth": len(self._queue),
+                "completed": self.completed,
+                "failed": self.failed,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "mean_page_seconds": self._busy_seconds / self.completed if self.completed else 0.0,
+            }
+
+    def shutdown(self):
+        """
+        Stop the workers, failing any pages that are still queued or running.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for job_id in list(self._futures):
+                self._fail(job_id, RuntimeError("OCR service has been shut down"))
+            self._queue.clear()
+            self._wakeup_writer.send(None)
+        self._dispatcher.join(timeout=5)
+        for worker in self._pool:
+            worker.stop(force=not worker.idle)
+
+
+def get_ocr_service():
+    """
+    Get the process-wide OCR service, starting its workers on first use.
+
+    Returns:
+        OcrService: Shared service
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = OcrService()
+        return _service
+
+
+def ocr_service_stats():
+    """
+    Counters of the process-wide OCR service.
+
+    Returns:
+        dict: OcrService.stats(), or None if the service has not been started
+    """
+    with _service_lock:
+        return _service.stats() if _service is not None else None
@@ -1,54 +1,416 @@
-from PyPDF2 import PdfReader
 import pdfplumber
+import pypdfium2 as pdfium
 import logging
 import io
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from backend.pdf_processing.document import ExtractedDocument, PageExtraction, Table, TextBlock, group_text_blocks
+from backend.pdf_processing.extraction_cache import get_extraction_cache
+from backend.pdf_processing.text_quality import score_text_layer
 
-def extract_text_from_pdf(pdf_file):
+# Bump whenever extraction output can change for the same input PDF
+EXTRACTOR_VERSION = "7"
+
+# Supported text-layer backends
+TEXT_BACKEND_LAYOUT = "pdfplumber"
+TEXT_BACKEND_PDFIUM = "pdfium"
+
+# Documents shorter than this are extracted serially; pool overhead would dominate
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+# Smallest page range handed to a single worker
+PARALLEL_MIN_CHUNK = 4
+
+# pdfium is not thread-safe, so every pdfium call in the process goes through this lock
+PDFIUM_LOCK = threading.RLock()
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _read_pdf_bytes(pdf_file):
+    """
+    Read the raw bytes of a PDF from a path, bytes or file object.
+
+    Args:
+        pdf_file: Path, bytes or file object containing the PDF
+
+    Returns:
+        bytes: Raw PDF bytes
+    """
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if isinstance(pdf_file, str):
+        with open(pdf_file, 'rb') as f:
+            return f.read()
+
+    # Reset file pointer in case the stream was already consumed
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def _probe_page(pdf_page):
+    """
+    Inspect a pdfium page's objects without any layout analysis.
+
+    Args:
+        pdf_page: pypdfium2 page
+
+    Returns:
+        tuple: (has_ruling, image_coverage, image_regions) where has_ruling is
+            True if the page draws vector paths that could form a ruled table,
+            image_coverage is the share of the page area covered by images, and
+            image_regions are the images' (x0, top, x1, bottom) boxes in PDF points
+    """
+    page_width, page_height = pdf_page.get_size()
+    page_area = page_width * page_height
+
+    has_ruling = False
+    image_area = 0.0
+    image_regions = []
+    for obj in pdf_page.get_objects(filter=[pdfium.raw.FPDF_PAGEOBJ_PATH, pdfium.raw.FPDF_PAGEOBJ_IMAGE]):
+        if obj.type == pdfium.raw.FPDF_PAGEOBJ_PATH:
+            has_ruling = True
+            continue
+        left, bottom, right, top = obj.get_pos()
+        # Clip to the page and flip to top-left origin, like pdfplumber boxes
+        x0, x1 = max(left, 0), min(right, page_width)
+        region_top, region_bottom = page_height - min(top, page_height), page_height - max(bottom, 0)
+        if x1 > x0 and region_bottom > region_top:
+            image_area += (x1 - x0) * (region_bottom - region_top)
+            image_regions.append((x0, region_top, x1, region_bottom))
+
+    image_coverage = min(image_area / page_area, 1.0) if page_area else 0.0
+    return has_ruling, image_coverage, image_regions
+
+
+def _pdfium_page_text(pdf_page):
+    """
+    Read the text layer of a pdfium page.
+
+    Args:
+        pdf_page: pypdfium2 page
+
+    Returns:
+        str: Page text with normalized line endings
+    """
+    textpage = pdf_page.get_textpage()
+    try:
+        return textpage.get_text_bounded().replace("\r\n", "\n")
+    finally:
+        textpage.close()
+
+
+def _extract_page(plumber_pdf, pdfium_pdf, index, text_backend):
+    """
+    Extract text and tables from one page, analyzing its layout at most once.
+
+    Args:
+        plumber_pdf: Open pdfplumber document
+        pdfium_pdf: Open pypdfium2 document
+        index (int): Zero-based page index
+        text_backend (str): TEXT_BACKEND_LAYOUT or TEXT_BACKEND_PDFIUM
+
+    Returns:
+        PageExtraction: Extraction result for the page
+    """
+    timings = {}
+    words = []
+    started = time.perf_counter()
+
+    with PDFIUM_LOCK:
+        pdf_page = pdfium_pdf[index]
+        try:
+            # pdfium answers "could there be a table here?" without a layout pass
+            has_ruling, image_coverage, image_regions = _probe_page(pdf_page)
+            page_size = pdf_page.get_size()
+            if text_backend == TEXT_BACKEND_PDFIUM:
+                page_text = _pdfium_page_text(pdf_page)
+                text_blocks = [TextBlock(page_text)] if page_text else []
+        finally:
+            pdf_page.close()
+    timings['probe'] = time.perf_counter() - started
+
+    plumber_page = None
+    if text_backend == TEXT_BACKEND_LAYOUT or has_ruling:
+        plumber_page = plumber_pdf.pages[index]
+
+    if text_backend == TEXT_BACKEND_LAYOUT:
+        step = time.perf_counter()
+        page_text = plumber_page.extract_text()
+        # Reuses the text map cached by extract_text, so no second layout pass
+        text_blocks = group_text_blocks(plumber_page.extract_text_lines(return_chars=False))
+        # Word boxes for rebuilding tables that have no ruling lines
+        words = [
+            (word['text'], round(word['x0'], 2), round(word['top'], 2), round(word['x1'], 2), round(word['bottom'], 2))
+            for word in plumber_page.extract_words()
+        ]
+        timings['text'] = time.perf_counter() - step
+
+    tables = []
+    # The default table settings only find tables bounded by ruling lines,
+    # so pages without edges are guaranteed to have none
+    if has_ruling and plumber_page.edges:
+        step = time.perf_counter()
+        tables = [Table(table.extract(), table.bbox) for table in plumber_page.find_tables()]
+        timings['tables'] = time.perf_counter() - step
+
+    if plumber_page is not None:
+        # Drop the cached layout objects so long documents don't accumulate them
+        plumber_page.close()
+
+    text_quality = score_text_layer(page_text, image_coverage)
+
+    timings['total'] = time.perf_counter() - started
+    return PageExtraction(
+        index, page_text, tables, timings, text_blocks, text_quality,
+        image_regions=image_regions, page_size=page_size, words=words
+    )
+
+
+def _iter_page_range(data, start, stop, text_backend):
+    """
+    Extract a contiguous range of pages from raw PDF bytes, yielding each as it completes.
+
+    Args:
+        data (bytes): Raw PDF bytes
+        start (int): First page index (inclusive)
+        stop (int): Last page index (exclusive)
+        text_backend (str): TEXT_BACKEND_LAYOUT or TEXT_BACKEND_PDFIUM
+
+    Yields:
+        PageExtraction: Extraction result for each page in the range
+    """
+    with PDFIUM_LOCK:
+        pdfium_pdf = pdfium.PdfDocument(data)
+    try:
+        with pdfplumber.open(io.BytesIO(data)) as plumber_pdf:
+            for index in range(start, stop):
+                page = _extract_page(plumber_pdf, pdfium_pdf, index, text_backend)
+                logging.debug(f"Extracted page {index + 1} in {page.timings['total']:.4f}s")
+                yield page
+    finally:
+        with PDFIUM_LOCK:
+            pdfium_pdf.close()
+
+
+def _extract_page_range(data, start, stop, text_backend):
+    """
+    Extract a contiguous range of pages from raw PDF bytes.
+
+    Runs in worker processes, so it opens its own document handles.
+
+    Args:
+        data (bytes): Raw PDF bytes
+        start (int): First page index (inclusive)
+        stop (int): Last page index (exclusive)
+        text_backend (str): TEXT_BACKEND_LAYOUT or TEXT_BACKEND_PDFIUM
+
+    Returns:
+        list: PageExtraction for each page in the range
+    """
+    return list(_iter_page_range(data, start, stop, text_backend))
+
+
+def count_pages(pdf_file):
+    """
+    Count the pages of a PDF without parsing their content.
+
+    Args:
+        pdf_file: Path, bytes or file object containing the PDF
+
+    Returns:
+        int: Number of pages
+    """
+    data = _read_pdf_bytes(pdf_file)
+    with PDFIUM_LOCK:
+        pdfium_pdf = pdfium.PdfDocument(data)
+        try:
+            return len(pdfium_pdf)
+        finally:
+            pdfium_pdf.close()
+
+
+def _get_process_pool():
+    """
+    Get the process pool shared by all parallel extractions, creating it on first use.
+
+    Returns:
+        ProcessPoolExecutor: Shared process pool
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=_pool_workers())
+        return _process_pool
+
+
+def _pool_workers():
+    """
+    Number of extraction worker processes, from PDF_EXTRACT_WORKERS or the CPU count.
+
+    Returns:
+        int: Worker count
+    """
+    return int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _reset_process_pool():
+    """
+    Discard the shared process pool so the next parallel extraction starts a new one.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+
+
+def _page_ranges(page_count, workers):
+    """
+    Split a document into contiguous page ranges for the worker pool.
+
+    Args:
+        page_count (int): Number of pages in the document
+        workers (int): Number of pool workers
+
+    Returns:
+        list: (start, stop) tuples covering every page in order
+    """
+    # Two ranges per worker keeps the pool busy when some pages are slower
+    chunk = max(PARALLEL_MIN_CHUNK, -(-page_count // (workers * 2)))
+    return [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+
+
+def _iter_pages_parallel(data, page_count, text_backend):
+    """
+    Extract pages across the shared process pool, yielding them in page order.
+
+    Each range is yielded as soon as it and every range before it are done.
+
+    Args:
+        data (bytes): Raw PDF bytes
+        page_count (int): Number of pages in the document
+        text_backend (str): TEXT_BACKEND_LAYOUT or TEXT_BACKEND_PDFIUM
+
+    Yields:
+        PageExtraction: Extraction result for each page
+    """
+    pool = _get_process_pool()
+    ranges = _page_ranges(page_count, _pool_workers())
+    futures = [pool.submit(_extract_page_range, data, start, stop, text_backend) for start, stop in ranges]
+
+    for future in futures:
+        yield from future.result()
+
+
+def iter_pages(pdf_file, text_backend=TEXT_BACKEND_LAYOUT, parallel=False):
+    """
+    Extract a PDF page by page, yielding each page as soon as it is ready.
+
+    Lets downstream parsing start before the whole document has been extracted.
+
+    Args:
+        pdf_file: Path, bytes or file object containing the PDF
+        text_backend (str): "pdfplumber" for layout-ordered text (default) or
+            "pdfium" for the faster content-stream-ordered text layer
+        parallel (bool): Spread page ranges across a process pool. Documents
+            shorter than PARALLEL_MIN_PAGES are still extracted serially.
+
+    Yields:
+        PageExtraction: Extraction result for each page, in page order
+    """
+    if text_backend not in (TEXT_BACKEND_LAYOUT, TEXT_BACKEND_PDFIUM):
+        raise ValueError(f"Unknown text backend: {text_backend}")
+
+    data = _read_pdf_bytes(pdf_file)
+    page_count = count_pages(data)
+
+    start = 0
+    if parallel and page_count >= PARALLEL_MIN_PAGES:
+        try:
+            for page in _iter_pages_parallel(data, page_count, text_backend):
+                yield page
+                start = page.page_number + 1
+            return
+        except Exception as e:
+            logging.warning(f"Parallel extraction failed, continuing serially from page {start + 1}: {str(e)}")
+            _reset_process_pool()
+
+    yield from _iter_page_range(data, start, page_count, text_backend)
+
+
+def extract_pages(pdf_file, text_backend=TEXT_BACKEND_LAYOUT, parallel=False):
+    """
+    Extract text, tables and per-page timings from every page of a PDF.
+
+    Args:
+        pdf_file: Path, bytes or file object containing the PDF
+        text_backend (str): "pdfplumber" for layout-ordered text (default) or
+            "pdfium" for the faster content-stream-ordered text layer
+        parallel (bool): Spread page ranges across a process pool. Documents
+            shorter than PARALLEL_MIN_PAGES are still extracted serially.
+
+    Returns:
+        list: PageExtraction for each page, in page order
+    """
+    return list(iter_pages(pdf_file, text_backend=text_backend, parallel=parallel))
+
+
+def extract_document(pdf_file, text_backend=TEXT_BACKEND_LAYOUT, parallel=False, use_cache=True):
+    """
+    Extract a PDF into a structured document of pages, text blocks and tables.
+
+    Results are cached on disk by the SHA-256 of the PDF bytes, so a repeat
+    upload of the same file skips extraction entirely.
+
+    Args:
+        pdf_file: Path, bytes or file object containing the PDF
+        text_backend (str): "pdfplumber" for layout-ordered text (default) or
+            "pdfium" for the faster content-stream-ordered text layer
+        parallel (bool): Spread page ranges across a process pool
+        use_cache (bool): Read from and write to the extraction cache
+
+    Returns:
+        ExtractedDocument: Structured extraction result
+    """
+    data = _read_pdf_bytes(pdf_file)
+
+    cache = get_extraction_cache() if use_cache else None
+    if cache is not None:
+        digest = cache.digest(data)
+        namespace = f"document-{text_backend}-v{EXTRACTOR_VERSION}"
+        cached = cache.get(digest, namespace)
+        if cached is not None:
+            logging.info(f"Extraction cache hit for {digest[:12]}")
+            return ExtractedDocument.from_dict(cached, from_cache=True)
+
+    document = ExtractedDocument(extract_pages(data, text_backend=text_backend, parallel=parallel))
+
+    if cache is not None:
+        try:
+            cache.put(digest, namespace, document.to_dict())
+        except OSError as e:
+            logging.warning(f"Could not write extraction cache entry: {str(e)}")
+
+    return document
+
+
+def extract_text_from_pdf(pdf_file, parallel=False):
     """
     Extract text from a PDF file with improved table handling.
-    
+
     Args:
         pdf_file: File object containing the PDF
-        
+        parallel (bool): Extract long documents across a process pool
+
     Returns:
         str: Extracted text from the PDF
     """
     try:
-        # Create a PDF reader object for basic text extraction
-        pdf_reader = PdfReader(pdf_file)
-        
-        # Extract text from all pages
-        text = ""
-        
-        # Reset file pointer for pdfplumber
-        pdf_file.seek(0)
-        
-        # Use pdfplumber for better table extraction
-        with pdfplumber.open(pdf_file) as pdf:
-            for i, page in enumerate(pdf.pages):
-                # Extract tables
-                tables = page.extract_tables()
-                
-                # Extract regular text
-                page_text = page.extract_text()
-                
-                # Process tables if found
-                if tables:
-                    # Add table text to the extracted text
-                    for table in tables:
-                        # Convert table to text format
-                        table_text = ""
-                        for row in table:
-                            # Filter out None values and join with spaces
-                            row_text = " ".join([str(cell) if cell is not None else "" for cell in row])
-                            table_text += row_text + "\n"
-                        
-                        # Add table text to the page text
-                        page_text += "\n" + table_text
-                
-                text += page_text + "\n"
-            
-        return text.strip()
+        return extract_document(pdf_file, parallel=parallel).text
     except Exception as e:
         logging.error(f"Error extracting text from PDF: {str(e)}", exc_info=True)
-        raise Exception(f"Failed to extract text from PDF: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Failed to extract text from PDF: {str(e)}")
@@ -0,0 +1,139 @@
+import re
+
+# Pages with fewer glyphs than this have no usable text layer
+MIN_GLYPHS = 20
+
+# Pages whose images cover at least this fraction of the page are treated as scans
+SCANNED_IMAGE_COVERAGE = 0.3
+
+# A text layer below the printable ratio is considered garbage (e.g. broken font encodings)
+MIN_PRINTABLE_RATIO = 0.85
+
+# Few known words only mark a page as garbled when most of its tokens are not
+# word-like either: a product list or a non-English invoice has few known
+# words but reads as ordinary words and numbers
+MIN_DICTIONARY_RATIO = 0.15
+MIN_WORD_LIKE_RATIO = 0.5
+
+# Minimum number of alphabetic tokens before the dictionary ratio is trusted
+MIN_WORDS_FOR_DICTIONARY = 8
+
+# Common English and invoice vocabulary used to recognize real words
+DICTIONARY = frozenset("""
+a about above account address after all also amount an and any are as at bank be
+bill billing bin box by charge charges city code company contact cost country
+currency customer date days delivery description destination details discount
+due each email for freight from goods gross hs hts in inc included invoice is it
+item items law limited ltd made manufactured method net no not number of office
+on or order origin our paid pay payable payment per phone please po port price
+product products purchase qty quantity rate reference remit sales ship shipped
+shipping sold state street subtotal supplier tax terms than thank that the this
+to total transfer unit units university us usd value vat vendor weight with you
+your zip
+""".split())
+
+_WORD = re.compile(r'[A-Za-z]{2,}')
+
+# A word-like token is a number or letters in lower, Capitalized or UPPER case;
+# letter/digit mixes and mixed case ("hTq", "K#x9") are not
+_WORD_LIKE = re.compile(r'^(?:[^\W\d_]?[^\W\d_A-Z]*|[^\W\d_a-z]+|[\d.,:/%$€£¥+-]+)$')
+_TOKEN_PUNCTUATION = "\"'()[]{}<>.,;:!?*"
+
+
+class TextQuality:
+    """
+    Signals describing how usable a page's text layer is, and whether it needs OCR.
+    """
+
+    def __init__(self, glyph_count, printable_ratio, dictionary_ratio, image_coverage, word_like_ratio=None):
+        """
+        Args:
+            glyph_count (int): Non-whitespace characters in the text layer
+            printable_ratio (float): Share of those characters that are printable
+            dictionary_ratio (float): Share of alphabetic tokens that are known words
+            image_coverage (float): Share of the page area covered by images
+            word_like_ratio (float, optional): Share of whitespace-separated tokens
+                that look like ordinary words or numbers
+        """
+        self.glyph_count = glyph_count
+        self.printable_ratio = printable_ratio
+        self.dictionary_ratio = dictionary_ratio
+        self.image_coverage = image_coverage
+        self.word_like_ratio = word_like_ratio
+        self.reason = self._classify()
+
+    def _classify(self):
+        """
+        Decide whether the page needs OCR.
+
+        Returns:
+            str: Why the page needs OCR, or None if its text layer is usable
+        """
+        if self.glyph_count < MIN_GLYPHS:
+            # Blank pages have neither text nor images and need nothing
+            return "missing_text_layer" if self.image_coverage > 0 else None
+        if self.printable_ratio < MIN_PRINTABLE_RATIO:
+            return "unprintable_text"
+        if (
+            self.dictionary_ratio is not None
+            and self.dictionary_ratio < MIN_DICTIONARY_RATIO
+            and self.word_like_ratio is not None
+            and self.word_like_ratio < MIN_WORD_LIKE_RATIO
+        ):
+            return "garbled_text"
+        if self.image_coverage >= SCANNED_IMAGE_COVERAGE and self.glyph_count < MIN_GLYPHS * 5:
+            # A sparse text layer over a full-page image is usually just a stamp or header
+            return "scanned_page"
+        return None
+
+    @property
+    def needs_ocr(self):
+        """True if the page's text layer is missing or garbage."""
+        return self.reason is not None
+
+    def to_dict(self):
+        """JSON-serializable form of the signals."""
+        return {
+            "glyph_count": self.glyph_count,
+            "printable_ratio": self.printable_ratio,
+            "dictionary_ratio": self.dictionary_ratio,
+            "image_coverage": self.image_coverage,
+            "word_like_ratio": self.word_like_ratio,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild signals from to_dict output."""
+        return cls(
+            data["glyph_count"], data["printable_ratio"], data["dictionary_ratio"], data["image_coverage"],
+            data.get("word_like_ratio"),
+        )
+
+
+def score_text_layer(text, image_coverage=0.0):
+    """
+    Score a page's text layer from cheap signals, without rendering the page.
+
+    Args:
+        text (str): Text layer of the page
+        image_coverage (float): Share of the page area covered by images
+
+    Returns:
+        TextQuality: Signals and OCR decision for the page
+    """
+    glyphs = [char for char in text or "" if not char.isspace()]
+    glyph_count = len(glyphs)
+    printable = sum(1 for char in glyphs if char.isprintable() and char != "�")
+    printable_ratio = printable / glyph_count if glyph_count else 0.0
+
+    words = [word.lower() for word in _WORD.findall(text or "")]
+    if len(words) >= MIN_WORDS_FOR_DICTIONARY:
+        dictionary_ratio = sum(1 for word in words if word in DICTIONARY) / len(words)
+        tokens = [token for token in (token.strip(_TOKEN_PUNCTUATION) for token in (text or "").split()) if token]
+        word_like_ratio = sum(1 for token in tokens if _WORD_LIKE.match(token)) / len(tokens)
+    else:
+        # Too few words to judge; rely on the other signals
+        dictionary_ratio = None
+        word_like_ratio = None
+
+    return TextQuality(glyph_count, printable_ratio, dictionary_ratio, image_coverage, word_like_ratio)
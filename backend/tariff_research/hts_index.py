@@ -0,0 +1,359 @@
+import csv
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import numpy as np
+
+# Default location of the HTS schedule export (USITC CSV or JSON)
+DEFAULT_SCHEDULE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "hts_schedule.json"
+)
+
+# Candidates retrieved per product
+DEFAULT_TOP_K = 5
+
+# The top candidate is taken without asking the LLM when its score is at
+# least this multiple of the runner-up's
+DEFAULT_DECISIVE_RATIO = 1.5
+
+# ...and only when it contains at least this share of the product's terms,
+# and at least this many of them, so a match on one stray word is not taken
+DEFAULT_DECISIVE_COVERAGE = 0.75
+DEFAULT_DECISIVE_MIN_TERMS = 2
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Column names of the schedule exports, lowercased
+_CODE_COLUMNS = ("htsno", "hts number", "hts_number", "code")
+_INDENT_COLUMNS = ("indent",)
+_DESCRIPTION_COLUMNS = ("description", "article description")
+
+# HTS codes as written on invoices and in model answers: 6-digit headings
+# (dddd.dd), 8-digit subheadings and 10-digit statistical suffixes, dotted as
+# in the schedule (dddd.dd.dd, dddd.dd.dd.dd) or with the suffix run together
+# (dddd.dd.dddd). Only 8- and 10-digit codes are assignable schedule articles.
+HTS_CODE = re.compile(r'(?<![\d.])\d{4}\.\d{2}(?:\.\d{4}|\.\d{2}(?:\.\d{2})?)?(?![\d.]?\d)')
+
+_TOKEN = re.compile(r'[a-z][a-z]+')
+_STOPWORDS = frozenset((
+    "and", "or", "of", "the", "for", "with", "without", "in", "on", "to", "by", "from", "other",
+    "not", "than", "its", "their", "thereof", "whether", "nesoi", "including", "excluding", "an",
+    "as", "at", "be", "but", "if", "is", "are", "such", "this", "that", "which",
+))
+
+_default_index = None
+_default_index_loaded = False
+_default_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Index terms of a description: lowercase words without stopwords, with plurals folded.
+
+    Args:
+        text (str): Description or query
+
+    Returns:
+        list: Terms in order
+    """
+    terms = []
+    for word in _TOKEN.findall(str(text).lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def normalize_hts_code(code):
+    """
+    An HTS code in the schedule's dotted format.
+
+    Args:
+        code (str): Code in any form HTS_CODE accepts, e.g. 8542.31.0000
+
+    Returns:
+        str: The code as dddd.dd, dddd.dd.dd or dddd.dd.dd.dd, or None if it
+            is not an HTS code
+    """
+    match = HTS_CODE.search(str(code or ""))
+    if match is None:
+        return None
+    digits = match.group(0).replace(".", "")
+    parts = [digits[:4]] + [digits[start:start + 2] for start in range(4, len(digits), 2)]
+    return ".".join(parts)
+
+
+class HtsArticle:
+    """
+    An assignable line of the HTS schedule with the headings above it.
+    """
+
+    def __init__(self, code, description, headings):
+        """
+        Args:
+            code (str): HTS code, e.g. 8471.30.01
+            description (str): The article's own description
+            headings (list): Descriptions of the enclosing heading levels, outermost first
+        """
+        self.code = code
+        self.description = description
+        self.headings = headings
+
+    @property
+    def label(self):
+        """Short description for prompts: the closest heading and the article's own text."""
+        if self.headings:
+            return f"{self.headings[-1].rstrip(':')}: {self.description}"
+        return self.description
+
+
+class HtsCandidate:
+    """
+    An HTS code retrieved for a product, with its BM25 score.
+    """
+
+    def __init__(self, article, score, matched_terms=0, coverage=0.0):
+        """
+        Args:
+            article (HtsArticle): Retrieved article
+            score (float): BM25 score
+            matched_terms (int): Distinct product terms found in the article
+            coverage (float): Share of the product's distinct terms found in the article
+        """
+        self.article = article
+        self.score = score
+        self.matched_terms = matched_terms
+        self.coverage = coverage
+
+    @property
+    def code(self):
+        return self.article.code
+
+
+def _column(row, names):
+    """Value of the first of several possible columns present in a row."""
+    for key, value in row.items():
+        if key is not None and key.strip().lower() in names:
+            return value
+    return None
+
+
+def load_hts_schedule(path):
+    """
+    Read the assignable articles of an HTS schedule export.
+
+    Rows are read in schedule order, and each row's indent places it under
+    the heading rows above it, so every article carries its chapter and
+    heading descriptions.
+
+    Args:
+        path (str): USITC export as .json (a list of rows) or .csv
+
+    Returns:
+        list: HtsArticle objects
+    """
+    if path.lower().endswith(".csv"):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+
+    articles = []
+    # (indent, description) of the enclosing levels
+    stack = []
+    for row in rows:
+        description = " ".join(str(_column(row, _DESCRIPTION_COLUMNS) or "").split())
+        if not description:
+            continue
+        code = str(_column(row, _CODE_COLUMNS) or "").strip()
+        try:
+            indent = int(_column(row, _INDENT_COLUMNS) or 0)
+        except ValueError:
+            indent = 0
+
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        # Headings (dddd.dd) only group the articles below them
+        if HTS_CODE.fullmatch(code) and len(code.replace(".", "")) >= 8:
+            articles.append(HtsArticle(normalize_hts_code(code), description, [text for _, text in stack]))
+        stack.append((indent, description))
+    return articles
+
+
+class HtsIndex:
+    """
+    BM25 index over the HTS schedule for retrieving candidate codes.
+
+    Each article is indexed with its own description counted twice and the
+    descriptions of its enclosing headings once, so its own wording outweighs
+    the shared heading text. Postings hold precomputed BM25 weights as NumPy
+    arrays, so a query is one vector addition per query term.
+    """
+
+    def __init__(self, articles):
+        """
+        Args:
+            articles (list): HtsArticle objects
+        """
+        self.articles = articles
+        self.searches = 0
+        self.decisive = 0
+        self._search_seconds = 0.0
+        self._lock = threading.Lock()
+        documents = [
+            tokenize(article.description) * 2 + tokenize(" ".join(article.headings))
+            for article in articles
+        ]
+        lengths = np.array([len(terms) for terms in documents], dtype=np.float64)
+        average_length = lengths.mean() if len(lengths) else 0.0
+
+        term_counts = {}
+        for doc_id, terms in enumerate(documents):
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                term_counts.setdefault(term, []).append((doc_id, count))
+
+        self._postings = {}
+        total = len(documents)
+        for term, entries in term_counts.items():
+            doc_ids = np.array([doc_id for doc_id, _ in entries], dtype=np.int32)
+            frequencies = np.array([count for _, count in entries], dtype=np.float64)
+            idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / average_length)
+            weights = idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+            self._postings[term] = (doc_ids, weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Build the index from a schedule export.
+
+        Args:
+            path (str): USITC export as .json or .csv
+
+        Returns:
+            HtsIndex: Index over its assignable articles
+        """
+        articles = load_hts_schedule(path)
+        logging.info(f"Indexed {len(articles)} HTS articles from {path}")
+        return cls(articles)
+
+    def search(self, description, k=DEFAULT_TOP_K):
+        """
+        Retrieve the best-matching HTS codes for a product description.
+
+        Args:
+            description (str): Product description
+            k (int): Most candidates to return
+
+        Returns:
+            list: HtsCandidate objects, best first; empty if no term matches
+        """
+        started = time.perf_counter()
+        terms = set(tokenize(description))
+        scores = np.zeros(len(self.articles), dtype=np.float64)
+        term_hits = np.zeros(len(self.articles), dtype=np.int32)
+        matched = False
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+                term_hits[doc_ids] += 1
+                matched = True
+        candidates = []
+        if matched:
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            candidates = [
+                HtsCandidate(
+                    self.articles[doc_id], float(scores[doc_id]),
+                    int(term_hits[doc_id]), float(term_hits[doc_id] / len(terms)),
+                )
+                for doc_id in top if scores[doc_id] > 0
+            ]
+
+        with self._lock:
+            self.searches += 1
+            self._search_seconds += time.perf_counter() - started
+        return candidates
+
+    def is_decisive(self, candidates, ratio=None):
+        """
+        Whether the top candidate covers the product and clearly beats the rest.
+
+        Args:
+            candidates (list): Output of search()
+            ratio (float, optional): Required top / runner-up score ratio;
+                defaults to HTS_DECISIVE_RATIO
+
+        Returns:
+            bool: True if the top code can be used without the LLM
+        """
+        if not candidates:
+            return False
+        if ratio is None:
+            ratio = float(os.getenv("HTS_DECISIVE_RATIO", DEFAULT_DECISIVE_RATIO))
+        top = candidates[0]
+        if (
+            top.coverage < float(os.getenv("HTS_DECISIVE_COVERAGE", DEFAULT_DECISIVE_COVERAGE))
+            or top.matched_terms < int(os.getenv("HTS_DECISIVE_MIN_TERMS", DEFAULT_DECISIVE_MIN_TERMS))
+        ):
+            return False
+        decisive = len(candidates) == 1 or top.score >= ratio * candidates[1].score
+        if decisive:
+            with self._lock:
+                self.decisive += 1
+        return decisive
+
+    def stats(self):
+        """
+        Index counters.
+
+        Returns:
+            dict: articles and terms indexed, searches, mean search time in
+                milliseconds, and decisive results that needed no LLM call
+        """
+        with self._lock:
+            return {
+                "articles": len(self.articles),
+                "terms": len(self._postings),
+                "searches": self.searches,
+                "mean_search_ms": 1000 * self._search_seconds / self.searches if self.searches else 0.0,
+                "decisive": self.decisive,
+            }
+
+
+def get_hts_index():
+    """
+    Get the process-wide HTS index, building it from HTS_SCHEDULE_PATH on first use.
+
+    Returns:
+        HtsIndex: Shared index, or None if no schedule is available
+    """
+    global _default_index, _default_index_loaded
+    with _default_index_lock:
+        if not _default_index_loaded:
+            _default_index_loaded = True
+            path = os.getenv("HTS_SCHEDULE_PATH", DEFAULT_SCHEDULE_PATH)
+            try:
+                _default_index = HtsIndex.load(path)
+            except FileNotFoundError:
+                logging.info(f"No HTS schedule at {path}; HTS codes are classified by the LLM alone")
+            except (OSError, ValueError, csv.Error) as e:
+                logging.warning(f"Could not load HTS schedule {path}: {str(e)}")
+        return _default_index
@@ -8,6 +8,9 @@ import json
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from backend.agents.country_gazetteer import DEFAULT_KINDS, KIND_CODE
+from backend.core.llm_client import get_llm_client
+from backend.pdf_processing.invoice_text import InvoiceText
 
 # Load environment variables
 load_dotenv()
@@ -176,19 +179,11 @@ class TariffMonitoringAgent:
     def __init__(self, use_mock_data=False, use_mock_llm=False):
         self.tariff_data = TariffData(use_mock_data=use_mock_data)
         
-        # Use Llama LLM
-        try:
-            from llama_stack_client import LlamaStackClient
-            from llama_stack_client.types import UserMessage, SystemMessage
-            
-            # Initialize LlamaStackClient with the correct host and port
-            self.llm = LlamaStackClient(
-                base_url="http://localhost:8321",
-            )
-            print("Using Llama LLM for tariff analysis")
-        except Exception as e:
-            print(f"Error initializing Llama: {str(e)}")
-            raise e
+        # Use the process-wide Llama client
+        self.llm = get_llm_client()
+        if self.llm is None:
+            raise RuntimeError("Llama client unavailable")
+        print("Using Llama LLM for tariff analysis")
         
         # Define tools for the agent
         self.tools = [
@@ -242,36 +237,29 @@ class TariffMonitoringAgent:
                                 hts_code = re.sub(r'[^0-9.]', '', hts_part)
                     
                     # Extract country from query if not provided
-                    if country is None and "from" in query:
+                    if country is None:
+                        # Prefer the country named right after "from" (where an ISO
+                        # code is unambiguous), then any country named in the query
                         import re
-                        # Updated pattern to handle multi-word country names
-                        country_pattern = r'from\s+([A-Za-z\s]+?)(?:\.|\s|$)'
-                        country_match = re.search(country_pattern, query)
-                        if country_match:
-                            country = country_match.group(1).strip()
-                            # Handle common country name variations
-                            country_mapping = {
-                                "United": "United States",
-                                "United States of America": "United States",
-                                "USA": "United States",
-                                "UK": "United Kingdom",
-                                "Great Britain": "United Kingdom",
-                                "PRC": "China",
-                                "People's Republic of China": "China",
-                                "Mainland China": "China",
-                                "Republic of Korea": "South Korea",
-                                "ROK": "South Korea",
-                                "Korea": "South Korea"
-                            }
-                            # Check if we need to map the country name
-                            if country in country_mapping:
-                                country = country_mapping[country]
-                        else:
-                            # Fallback to simple splitting if regex fails
-                            parts = query.split("from")
-                            if len(parts) > 1:
-                                country_part = parts[1].split()[0].strip()
-                                country = country_part
+                        mentions = list(InvoiceText.of(query).country_mentions(DEFAULT_KINDS + (KIND_CODE,)))
+                        after_from = [
+                            mention for mention in mentions
+                            if re.search(r'\bfrom\s+(?:the\s+)?$', query[max(0, mention.start - 32):mention.start], re.IGNORECASE)
+                        ]
+                        named = [mention for mention in mentions if mention.kind != KIND_CODE]
+                        if after_from or named:
+                            country = (after_from or named)[0].name
+                        elif "from" in query:
+                            # Fall back to the words after "from" for places the
+                            # gazetteer does not know
+                            country_match = re.search(r'from\s+([A-Za-z\s]+?)(?:\.|\s|$)', query)
+                            if country_match:
+                                country = country_match.group(1).strip()
+                            else:
+                                parts = query.split("from")
+                                if len(parts) > 1:
+                                    country_part = parts[1].split()[0].strip()
+                                    country = country_part
                 
                 # Log the final values after extraction (if needed)
                 print(f"Final HTS code: {hts_code}, Country: {country}")
@@ -297,8 +285,8 @@ class TariffMonitoringAgent:
                                 role="user",
                             ),
                         ],
-                        model_id="llama3.2:3b",
                         stream=False,
+                        cache=True,
                     )
                     
                     # Extract the content from the response
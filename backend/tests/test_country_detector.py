@@ -0,0 +1,29 @@
+import pytest
+
+from backend.agents.country_detector import CountryDetector
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return CountryDetector()
+
+
+@pytest.mark.parametrize("text, country", [
+    ("ACME Electronics Ltd\n88 Nanshan Road, Shenzhen, China", "China"),
+    ("Tata Parts\nMumbai, India", "India"),
+    ("Andes Copper SA\nAv. Apoquindo 3000, Santiago, Chile", "Chile"),
+])
+def test_unlabeled_address_line(detector, text, country):
+    assert detector.detect_country(text)["country"] == country
+
+
+@pytest.mark.parametrize("text", [
+    "Bill to: Chad Smith\n12 Jordan Lane\nAtlanta, Georgia",
+    "Fine China dinner set\n10 lb turkey\nmetal polish",
+])
+def test_names_and_common_words_without_label(detector, text):
+    assert detector.detect_country(text)["country"] == "Unknown"
+
+
+def test_labeled_ambiguous_term(detector):
+    assert detector.detect_country("Country of Origin: Georgia")["country"] == "Georgia"
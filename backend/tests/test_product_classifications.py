@@ -0,0 +1,29 @@
+import pytest
+
+from backend.core.product_classifications import ProductClassificationIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ProductClassificationIndex(path=str(tmp_path / "products.db"))
+    index.add("Laptop computer 15 inch", "8471.30.01")
+    index.add("Hex Bolt M6 100pc", "7318.15.20")
+    return index
+
+
+@pytest.mark.parametrize("description, hts_code", [
+    ("laptop computers 15 inch", "8471.30.01"),
+    ("Hex bolts M6", "7318.15.20"),
+])
+def test_same_product_is_reused(index, description, hts_code):
+    match = index.find(description)
+    assert match is not None
+    assert match.hts_code == hts_code
+
+
+@pytest.mark.parametrize("description", [
+    "Laptop computer bag 15 inch",
+    "Hex nut M6",
+])
+def test_different_head_noun_is_not_reused(index, description):
+    assert index.find(description) is None